@@ -0,0 +1,363 @@
+# bench/loadtest.py
+"""Load test end-to-end offline: update Telegram (JSONL) diputar ulang ke Application asli
+dari bot.build_app(), dengan Bot API palsu & Apps Script tiruan lokal.
+
+    python bench/loadtest.py                          # 200 user sintetis, 200 update/detik
+    python bench/loadtest.py --user 1000 --laju 0     # secepatnya (semua update langsung masuk)
+    python bench/loadtest.py --file rekaman.jsonl     # putar ulang update rekaman (1 Update JSON per baris)
+    python bench/loadtest.py --buat updates.jsonl     # tulis update sintetis ke file, tanpa menjalankan
+    python bench/loadtest.py --latensi-api 0.05       # simulasi RTT Bot API 50 ms
+
+Alur sintetis per user: /start → tombol mode (template) → blok teks → ✅ simpan,
+ditambah inline query. Latensi dihitung dari jadwal masuk update sampai handler selesai
+(termasuk antre per chat), lalu dilaporkan p50/p95/p99 & update/detik per langkah dan
+per alur lengkap start→simpan. Chat id rekaman otomatis didaftarkan sebagai tenant utama.
+"""
+import argparse, asyncio, csv, json, os, random, shutil, sys, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIR))
+
+FIXTURE_CSV = os.path.join(DIR, "fixtures", "sheet_parfum.csv")
+KUNCI_INLINE = ["pink", "avr", "rose", "bacarat", "no 5", "l", "anan", "mi"]
+
+
+# =============== APPS SCRIPT TIRUAN (http.server, thread terpisah) ===============
+class AppsScriptTiruan(ThreadingHTTPServer):
+    """GET → isi sheet (fixture CSV), POST → simpan data (dihitung saja)."""
+    daemon_threads = True
+
+    def __init__(self, latensi: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _HandlerScript)
+        self.latensi = latensi
+        self.diterima = 0
+        self.kunci = threading.Lock()
+        with open(FIXTURE_CSV, "rb") as f:
+            self.sheet = f.read()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _HandlerScript(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, seperti Google
+
+    def _balas(self, body: bytes, tipe: str):
+        self.send_response(200)
+        self.send_header("Content-Type", tipe)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._balas(self.server.sheet, "text/csv")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.server.latensi:
+            time.sleep(self.server.latensi)
+        with self.server.kunci:
+            self.server.diterima += 1
+        self._balas(b'{"status":"success"}', "application/json")
+
+    def log_message(self, *a):
+        pass
+
+
+# =============== UPDATE SINTETIS ===============
+def _nama_parfum(n: int) -> list:
+    with open(FIXTURE_CSV, encoding="utf-8") as f:
+        r = csv.reader(f)
+        next(r)   # header
+        return [row[0] for row in islice(r, n)]
+
+
+def _user(cid: int) -> dict:
+    return {"id": cid, "is_bot": False, "first_name": f"User{cid}"}
+
+def _pesan(cid: int, mid: int, teks: str) -> dict:
+    m = {"message_id": mid, "date": int(time.time()), "chat": {"id": cid, "type": "private"},
+         "from": _user(cid), "text": teks}
+    if teks.startswith("/"):
+        m["entities"] = [{"type": "bot_command", "offset": 0, "length": len(teks.split()[0])}]
+    return m
+
+def _tombol(cid: int, mid: int, data: str) -> dict:
+    return {"id": f"cq{cid}_{mid}", "from": _user(cid), "chat_instance": str(cid), "data": data,
+            "message": {"message_id": mid, "date": int(time.time()), "chat": {"id": cid, "type": "private"},
+                        "from": {"id": 1, "is_bot": True, "first_name": "Bot"}, "text": "..."}}
+
+
+def update_sintetis(n_user: int, inline: float = 1.0, paralel: int = 20, seed: int = 1) -> list:
+    """Alur lengkap per user; `paralel` user berjalan selang-seling agar antre per chat teruji."""
+    rnd = random.Random(seed)
+    nama = _nama_parfum(200)
+    uid = iter(range(1, 10 ** 9))
+    alur = []
+    for i in range(n_user):
+        cid = 100000 + i
+        jual = i % 2 == 0
+        parfum = rnd.choice(nama)
+        if jual:
+            blok = (f"nama: Pembeli {i}\nno_hp: 0812{i:07d}\nalamat: Jl. Melati {i}\n"
+                    f"nama_parfum: {parfum}\nvarian: 35ml\nqty: {rnd.randint(1, 5)}\nharga_satuan: 45.000")
+        else:
+            blok = (f"nama: Supplier {i}\nkategori: Bibit\nnama_barang: {parfum}\nvarian: 100ml\n"
+                    f"qty: {rnd.randint(1, 5)}\nharga_total: 250.000")
+        mode = "Penjualan" if jual else "Pembelian"
+        langkah = [
+            {"message": _pesan(cid, 1, "/start")},
+            {"callback_query": _tombol(cid, 2, f"mode|{mode}")},
+            {"message": _pesan(cid, 3, blok)},
+            {"callback_query": _tombol(cid, 4, f"fast_save_{mode.lower()}")},
+        ]
+        for k in range(int(inline) + (rnd.random() < inline % 1)):
+            q = rnd.choice(KUNCI_INLINE)[:rnd.randint(1, 4)]
+            langkah.insert(rnd.randint(1, len(langkah)),
+                           {"inline_query": {"id": f"iq{cid}_{k}", "from": _user(cid), "query": q, "offset": ""}})
+        alur.append(langkah)
+
+    hasil = []
+    for g in range(0, len(alur), paralel):
+        grup = [list(a) for a in alur[g:g + paralel]]
+        while any(grup):
+            for a in grup:
+                if a:
+                    hasil.append(a.pop(0))
+    for u in hasil:
+        u["update_id"] = next(uid)
+    return hasil
+
+
+def langkah_dari(u: dict) -> str:
+    if "inline_query" in u:
+        return "inline"
+    if "callback_query" in u:
+        data = u["callback_query"].get("data", "")
+        if data.startswith("mode|"):
+            return "template"
+        if data.startswith("fast_save_") or data == "save_data":
+            return "simpan"
+        return "tombol"
+    teks = (u.get("message") or {}).get("text") or ""
+    if teks.startswith("/start"):
+        return "start"
+    return "perintah" if teks.startswith("/") else "blok"
+
+def _chat_id(u: dict):
+    for k in ("message", "callback_query", "inline_query"):
+        if k in u:
+            return u[k]["message"]["chat"]["id"] if k == "callback_query" else (
+                u[k]["chat"]["id"] if k == "message" else u[k]["from"]["id"])
+
+
+# =============== SIAPKAN ENV & IMPORT BOT ===============
+def siapkan_env(script: AppsScriptTiruan, chat_ids: set, tmp: str):
+    """Semua konfigurasi bot dibaca saat import → env diisi dulu."""
+    os.environ.update({
+        "BOT_TOKEN": "123456:LOADTEST",
+        "BOT_DB_PATH": os.path.join(tmp, "loadtest.sqlite3"),
+        "KATALOG_SNAPSHOT": os.path.join(tmp, "katalog.snapshot"),
+        "SESI_PERSIST": "0",
+        "TENANTS": json.dumps({"utama": {"nama": "loadtest", "chat_ids": sorted(chat_ids),
+                                         "script_url": script.url + "/exec",
+                                         "sheet_url": script.url + "/sheet.csv"}}),
+    })
+    for k in ("SHARED_STORE", "TENANTS_FILE"):
+        os.environ.pop(k, None)
+    import bot
+    return bot
+
+
+def bot_api_palsu(latensi: float = 0.0):
+    """BaseRequest yang menjawab Bot API secara lokal (tanpa jaringan)."""
+    from telegram.request import BaseRequest
+
+    class BotApiPalsu(BaseRequest):
+        def __init__(self):
+            self.panggilan = {}
+            self._mid = 1000
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        def _pesan(self, p: dict, mid: int = None) -> dict:
+            if mid is None:
+                self._mid += 1
+                mid = self._mid
+            cid = int(p.get("chat_id") or 0)
+            return {"message_id": mid, "date": int(time.time()), "text": p.get("text", ""),
+                    "chat": {"id": cid, "type": "private"},
+                    "from": {"id": 1, "is_bot": True, "first_name": "Loadtest"}}
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None,
+                             write_timeout=None, connect_timeout=None, pool_timeout=None):
+            nama = url.rsplit("/", 1)[-1]
+            self.panggilan[nama] = self.panggilan.get(nama, 0) + 1
+            if latensi:
+                await asyncio.sleep(latensi)
+            p = request_data.parameters if request_data else {}
+            if nama == "getMe":
+                hasil = {"id": 1, "is_bot": True, "first_name": "Loadtest", "username": "loadtest_bot",
+                         "can_join_groups": True, "can_read_all_group_messages": False,
+                         "supports_inline_queries": True}
+            elif nama in ("sendMessage", "sendDocument"):
+                hasil = self._pesan(p)
+            elif nama == "editMessageText":
+                hasil = self._pesan(p, int(p.get("message_id") or 0))
+            else:
+                hasil = True
+            return 200, json.dumps({"ok": True, "result": hasil}).encode()
+
+    return BotApiPalsu()
+
+
+# =============== JALANKAN ===============
+def persentil(data: list, p: float) -> float:
+    if not data:
+        return 0.0
+    s = sorted(data)
+    return s[min(len(s) - 1, round(p * (len(s) - 1)))]
+
+
+async def jalankan(bot, updates: list, laju: float, latensi_api: float, tunggu: float, script) -> dict:
+    from telegram import Update
+    api = bot_api_palsu(latensi_api)
+    app = bot.build_app(webhook=True, request=api)
+    error = []
+
+    async def catat_error(update, context):
+        # exception di handler ditangkap Application, tidak sampai ke pemanggil process_update
+        error.append(f"{langkah_dari(update.to_dict()) if update else '-'}: {context.error!r}")
+    app.add_error_handler(catat_error)
+    await app.initialize()
+    await app.post_init(app)
+    await app.start()
+    t = time.perf_counter()
+    while bot._pool(app.bot_data).get(bot.TENANT_UTAMA) is None and time.perf_counter() - t < 15:
+        await asyncio.sleep(0.05)
+    kat = bot._pool(app.bot_data).get(bot.TENANT_UTAMA)
+    print(f"📚 Katalog: {len(kat.daftar) if kat else 0} parfum ({(time.perf_counter() - t) * 1000:.0f} ms)")
+
+    proses = app.update_processor
+    latensi = {}              # langkah → [detik]
+    mulai_alur, alur = {}, []
+
+    async def satu(u: dict, jadwal: float):
+        langkah = langkah_dari(u)
+        update = Update.de_json(u, app.bot)
+        try:
+            # jalur yang sama dengan Application saat update diambil dari update_queue
+            await proses.process_update(update, app.process_update(update))
+        except Exception as e:
+            error.append(f"{langkah}: {e!r}")
+            return
+        selesai = time.perf_counter()
+        latensi.setdefault(langkah, []).append(selesai - jadwal)
+        cid = _chat_id(u)
+        if langkah == "start":
+            mulai_alur[cid] = jadwal
+        elif langkah == "simpan" and cid in mulai_alur:
+            alur.append(selesai - mulai_alur.pop(cid))
+
+    tugas = []
+    t0 = time.perf_counter()
+    for i, u in enumerate(updates):
+        jadwal = t0 + (i / laju if laju else 0)
+        jeda = jadwal - time.perf_counter()
+        if jeda > 0:
+            await asyncio.sleep(jeda)
+        tugas.append(asyncio.create_task(satu(u, jadwal)))
+    await asyncio.gather(*tugas)
+    durasi = time.perf_counter() - t0
+
+    # beri waktu worker outbox mengirim ke Apps Script tiruan
+    ob = app.bot_data["outbox"]
+    t = time.perf_counter()
+    while ob.jumlah_pending() and time.perf_counter() - t < tunggu:
+        await asyncio.sleep(0.1)
+    pending = ob.jumlah_pending()
+
+    await app.stop()
+    await app.shutdown()
+    await app.post_shutdown(app)
+    return {"durasi": durasi, "latensi": latensi, "alur": alur, "error": error,
+            "api": api.panggilan, "script": script.diterima, "outbox_pending": pending}
+
+
+def laporan(h: dict) -> dict:
+    baris = {}
+    urutan = ["start", "template", "blok", "simpan", "tombol", "perintah", "inline"]
+    for nama in sorted(h["latensi"], key=lambda x: urutan.index(x) if x in urutan else 99):
+        baris[nama] = h["latensi"][nama]
+    baris["alur start→simpan"] = h["alur"]
+    semua = [x for v in h["latensi"].values() for x in v]
+    baris["semua"] = semua
+
+    hasil = {}
+    print(f"\n{'langkah':20} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'update/dtk':>11}")
+    for nama, data in baris.items():
+        r = {"n": len(data), "p50_ms": persentil(data, .5) * 1000, "p95_ms": persentil(data, .95) * 1000,
+             "p99_ms": persentil(data, .99) * 1000, "per_detik": len(data) / h["durasi"] if h["durasi"] else 0}
+        hasil[nama] = r
+        print(f"{nama:20} {r['n']:6} {r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f} {r['per_detik']:11.1f}")
+    print(f"\n⏱ {len(semua)} update dalam {h['durasi']:.2f} detik")
+    print("🤖 Bot API palsu: " + ", ".join(f"{k}={v}" for k, v in sorted(h["api"].items())))
+    print(f"📤 Apps Script tiruan menerima {h['script']} POST, outbox pending {h['outbox_pending']}")
+    if h["error"]:
+        print(f"❌ {len(h['error'])} update error, contoh: {h['error'][:3]}")
+    return hasil
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--file", help="JSONL update rekaman (default: sintetis)")
+    ap.add_argument("--buat", help="tulis update sintetis ke file JSONL lalu keluar")
+    ap.add_argument("--user", type=int, default=200, help="jumlah user sintetis")
+    ap.add_argument("--inline", type=float, default=1.0, help="rata-rata inline query per user")
+    ap.add_argument("--paralel", type=int, default=20, help="user sintetis yang alurnya selang-seling")
+    ap.add_argument("--laju", type=float, default=200, help="update/detik yang dimasukkan (0 = secepatnya)")
+    ap.add_argument("--latensi-api", type=float, default=0.0, help="detik per panggilan Bot API palsu")
+    ap.add_argument("--latensi-script", type=float, default=0.0, help="detik per POST Apps Script tiruan")
+    ap.add_argument("--tunggu", type=float, default=5.0, help="maks detik menunggu outbox kosong")
+    ap.add_argument("--json", help="simpan ringkasan hasil ke file JSON")
+    args = ap.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            updates = [json.loads(b) for b in f if b.strip()]
+    else:
+        updates = update_sintetis(args.user, args.inline, args.paralel)
+    if args.buat:
+        with open(args.buat, "w", encoding="utf-8") as f:
+            for u in updates:
+                f.write(json.dumps(u, ensure_ascii=False) + "\n")
+        print(f"💾 {len(updates)} update ditulis ke {args.buat}")
+        return
+
+    script = AppsScriptTiruan(args.latensi_script)
+    threading.Thread(target=script.serve_forever, daemon=True).start()
+    tmp = tempfile.mkdtemp(prefix="loadtest-")
+    try:
+        bot = siapkan_env(script, {c for c in map(_chat_id, updates) if c is not None}, tmp)
+        print(f"▶️ {len(updates)} update, laju {args.laju or '∞'}/detik")
+        h = asyncio.run(jalankan(bot, updates, args.laju, args.latensi_api, args.tunggu, script))
+    finally:
+        script.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+    hasil = laporan(h)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(hasil, f, indent=1)
+    if h["error"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# bench/run.py
+"""Micro-benchmark fungsi panas bot.py, jalan offline.
+
+    python bench/run.py                      # jalankan & bandingkan dengan bench/baseline.json
+    python bench/run.py --simpan             # simpan hasil (median 5 run) sebagai baseline baru
+    python bench/run.py --ukuran 100,1000    # batasi ukuran katalog sintetis
+    python bench/run.py --toleransi 0.3      # gagal (exit 1) jika skor relatif turun > 30%
+
+Katalog sintetis dibuat deterministik (seed tetap) dari 100 s/d 100k nama.
+Parsing sheet diuji terhadap fixture tersimpan di bench/fixtures/.
+
+ops/detik mentah tergantung mesin, jadi yang dibandingkan adalah skor relatif:
+ops/detik dibagi ops/detik loop kalibrasi (Python murni) yang diukur di run yang sama,
+berkali-kali sepanjang run (median). Baseline tetap valid di host lain.
+Benchmark yang tampak regresi diukur ulang (maks. 2x) sebelum dinyatakan gagal.
+
+--simpan juga mencatat per benchmark seberapa jauh run paling lambat jatuh di bawah
+median ("sebar"); batas turun benchmark yang memang berisik dilebarkan jadi 1.5x
+sebar tsb (maks. SEBAR_MAKS).
+"""
+import argparse, gc, json, os, random, subprocess, sys, time, tracemalloc
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIR))
+
+import bot  # noqa: E402
+
+BASELINE = os.path.join(DIR, "baseline.json")
+FIXTURE_CSV = os.path.join(DIR, "fixtures", "sheet_parfum.csv")
+FIXTURE_JSON = os.path.join(DIR, "fixtures", "sheet_parfum.json")
+UKURAN = [100, 1000, 10000, 100000]
+SEBAR_MAKS = 0.5   # toleransi per benchmark tidak dilebarkan melebihi ini
+BLOK = (
+    "nama: Budi Santoso\n"
+    "no_hp: 08123456789\n"
+    "alamat: Jl. Melati No. 5, Bandung\n"
+    "nama_parfum: Pink Chiffon\n"
+    "varian: 35ml\n"
+    "qty: 3\n"
+    "harga_satuan: Rp 45.000\n"
+)
+KUNCI = ["pink", "avr", "rose", "bacarat", "no 5", "xyz", "l"]
+_SUKU = ["ka", "ri", "mo", "la", "pin", "ros", "ve", "nu", "ta", "so", "mi", "de", "cha", "el", "bo", "ar", "is", "an"]
+
+
+def katalog_sintetis(n: int) -> list:
+    rnd = random.Random(n)
+    nama = set()
+    while len(nama) < n:
+        kata = ["".join(rnd.choice(_SUKU) for _ in range(rnd.randint(2, 4))).capitalize()
+                for _ in range(rnd.randint(1, 3))]
+        nama.add(" ".join(kata))
+    return sorted(nama)
+
+
+def ukur(fn, min_detik: float = 0.3, ulang: int = 5) -> dict:
+    """ops/detik terbaik dari `ulang` putaran (tiap putaran ≥ min_detik/3; gangguan host
+    hanya bisa memperlambat) + puncak alokasi satu panggilan."""
+    fn()  # pemanasan
+    ops = 0.0
+    gc.collect()
+    gc.disable()   # seperti timeit: jeda GC tergantung sisa heap benchmark sebelumnya
+    try:
+        for _ in range(ulang):
+            n, t0 = 0, time.perf_counter()
+            while True:
+                fn()
+                n += 1
+                dt = time.perf_counter() - t0
+                if dt >= min_detik / 3:
+                    break
+            ops = max(ops, n / dt)
+    finally:
+        gc.enable()
+    tracemalloc.start()
+    fn()
+    _, puncak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ops": ops, "mem_kb": puncak / 1024}
+
+
+def _kalibrasi():
+    """Beban acuan: string, dict & sort — campuran yang mirip fungsi panas bot.py."""
+    d = {}
+    for i in range(2000):
+        k = str(i * 7919)
+        d[k] = k[::-1].upper()
+    return sorted(d.items())
+
+
+def kalibrasi() -> float:
+    return ukur(_kalibrasi, min_detik=0.5)["ops"]
+
+
+def feed_fixture(path: str, format: str, chunk: int = 64 * 1024):
+    with open(path, "rb") as f:
+        data = f.read()
+
+    def jalan():
+        p = bot.PembacaKatalog(format)
+        for i in range(0, len(data), chunk):
+            p.feed(data[i:i + chunk])
+        return p.selesai()
+    return jalan
+
+
+def semua_bench(ukuran: list, hanya: set = None):
+    """→ (hasil, acuan). hanya = nama benchmark yang dijalankan (None = semua).
+
+    Kalibrasi diukur di awal, di antara kelompok & di akhir; acuan = median-nya,
+    supaya satu lonjakan/penurunan clock tidak menggeser semua skor relatif.
+    """
+    hasil, kal = {}, [kalibrasi()]
+
+    def u(nama, fn, **kw):
+        if hanya is None or nama in hanya:
+            hasil[nama] = ukur(fn, **kw)
+
+    u("_format_rp", lambda: bot._format_rp("Rp 1.250.000"))
+    u("_parse_block_to_dict", lambda: bot._parse_block_to_dict(BLOK))
+    u("sheet.csv", feed_fixture(FIXTURE_CSV, "csv"))
+    u("sheet.json", feed_fixture(FIXTURE_JSON, "json"))
+
+    for n in ukuran:
+        if hanya is not None and not any(f"[{n}]" in x for x in hanya):
+            continue
+        kal.append(kalibrasi())
+        daftar = katalog_sintetis(n)
+        u(f"ParfumIndex[{n}]", lambda: bot.ParfumIndex(daftar), min_detik=0.5)
+        index = bot.ParfumIndex(daftar)
+        for kw in KUNCI:
+            u(f"cari_parfum[{n}] {kw!r}", lambda: bot.cari_parfum(kw, index, limit=50))
+        u(f"parfum_page_markup[{n}]", lambda: bot.parfum_page_markup(daftar, n // 12 or 1))
+        kat = bot.Katalog(daftar, index=index)
+        u(f"Katalog.halaman[{n}]", lambda: kat.halaman(n // 12 or 1))
+    kal.append(kalibrasi())
+    acuan = sorted(kal)[len(kal) // 2]
+    for r in hasil.values():
+        r["relatif"] = r["ops"] / acuan
+    return hasil, acuan
+
+
+def putaran_terpisah(ukuran: str, hanya: set = None) -> tuple:
+    """Satu run di proses baru. Kecepatan ikut kondisi proses (heap, cache, letak memori),
+    jadi run kedua di proses yang sama bukan sampel independen."""
+    cmd = [sys.executable, __file__, "--ukuran", ukuran, "--json"]
+    if hanya is not None:
+        cmd += ["--hanya", json.dumps(sorted(hanya))]
+    keluar = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    hasil, acuan = json.loads(keluar)
+    return hasil, acuan
+
+
+def median_putaran(putaran: list) -> dict:
+    """Median per benchmark + "sebar" = (median - min) / median skor relatif antar run."""
+    hasil = {}
+    for nama in putaran[0]:
+        rs = sorted((p[nama] for p in putaran), key=lambda r: r["relatif"])
+        hasil[nama] = dict(rs[len(rs) // 2])
+        hasil[nama]["sebar"] = 1 - rs[0]["relatif"] / hasil[nama]["relatif"]
+    return hasil
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--ukuran", default=",".join(map(str, UKURAN)))
+    ap.add_argument("--simpan", action="store_true", help="tulis hasil ke bench/baseline.json")
+    ap.add_argument("--putaran", type=int, help="jumlah run penuh (tiap run di proses baru), diambil median (default 1; 5 untuk --simpan)")
+    ap.add_argument("--toleransi", type=float, default=0.25, help="batas penurunan skor relatif (0.25 = 25%%)")
+    ap.add_argument("--json", action="store_true", help=argparse.SUPPRESS)   # dipakai putaran_terpisah
+    ap.add_argument("--hanya", type=json.loads, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    ukuran = [int(x) for x in args.ukuran.split(",") if x]
+    if args.json:
+        print(json.dumps(semua_bench(ukuran, set(args.hanya) if args.hanya else None)))
+        return
+
+    n = args.putaran or (5 if args.simpan else 1)
+    putaran = [semua_bench(ukuran)] + [putaran_terpisah(args.ukuran) for _ in range(n - 1)]
+    hasil = median_putaran([h for h, _ in putaran])
+    acuan = sorted(a for _, a in putaran)[len(putaran) // 2]
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    def rasio(nama):
+        b = baseline.get(nama)
+        if b and "relatif" in b:   # baseline lama (ops mentah saja) tidak dibandingkan
+            return hasil[nama]["relatif"] / b["relatif"]
+
+    def toleransi(nama):
+        return max(args.toleransi, min(SEBAR_MAKS, 1.5 * baseline.get(nama, {}).get("sebar", 0)))
+
+    # kandidat regresi diukur ulang (maks. 2x): host yang berisik bisa memperlambat satu putaran
+    for _ in range(0 if args.simpan else 2):
+        curiga = {nama for nama in hasil if (rasio(nama) or 1) < 1 - toleransi(nama)}
+        if not curiga:
+            break
+        ulang, _ = putaran_terpisah(args.ukuran, curiga)
+        for nama, r in ulang.items():
+            if r["relatif"] > hasil[nama]["relatif"]:
+                hasil[nama] = r
+
+    regresi = []
+    print(f"kalibrasi: {acuan:.0f} ops/detik (baseline: {baseline.get('_kalibrasi', {}).get('ops', 0):.0f})")
+    print(f"{'benchmark':42} {'ops/detik':>12} {'relatif':>10} {'mem KB':>9} {'vs baseline':>12} {'batas':>6}")
+    for nama, r in hasil.items():
+        x = rasio(nama)
+        banding = ""
+        if x is not None:
+            banding = f"{(x - 1) * 100:+.1f}%"
+            if x < 1 - toleransi(nama):
+                regresi.append(nama)
+                banding += " ❌"
+        print(f"{nama:42} {r['ops']:12.0f} {r['relatif']:10.4g} {r['mem_kb']:9.1f} {banding:>12} "
+              f"{-toleransi(nama):6.0%}")
+
+    if args.simpan:
+        simpan = {k: {"ops": round(v["ops"], 1), "relatif": float(f"{v['relatif']:.4g}"),
+                      "mem_kb": round(v["mem_kb"], 1), "sebar": round(v["sebar"], 3)} for k, v in hasil.items()}
+        simpan["_kalibrasi"] = {"ops": round(acuan, 1)}   # hanya informasi host pembuat baseline
+        with open(BASELINE, "w") as f:
+            json.dump(simpan, f, indent=1, sort_keys=True)
+        print(f"💾 Baseline disimpan: {BASELINE}")
+    if regresi:
+        print("❌ Regresi melewati batas: " + ", ".join(regresi))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,383 @@
 # ======================= bot.py =======================
-import os, json, requests
+import os, re, sys, csv, json, time, codecs, random, sqlite3, asyncio, hashlib, marshal, mmap, signal, socket, tempfile, threading, tracemalloc, unicodedata, uuid
+import httpx
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict, OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from functools import wraps
+from itertools import islice
 from math import ceil
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from telegram import (
     Update, InlineKeyboardButton, InlineKeyboardMarkup,
-    ReplyKeyboardRemove, InlineQueryResultArticle, InputTextMessageContent, BotCommand
+    ReplyKeyboardRemove, InlineQueryResultArticle, InlineQueryResultsButton, InputTextMessageContent, BotCommand
 )
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler,
-    InlineQueryHandler, filters, ContextTypes, ConversationHandler
+    InlineQueryHandler, filters, ContextTypes, ConversationHandler, BaseUpdateProcessor, CallbackContext
 )
 
 # =============== KONFIGURASI ===============
 TOKEN = os.getenv("BOT_TOKEN")
 SCRIPT_URL = os.getenv("GOOGLE_APPS_SCRIPT_URL")
 
-# Hanya ID ini yang boleh pakai bot (user/grup)
+# Hanya ID ini yang boleh pakai bot (user/grup) — untuk tenant utama jika TENANTS tidak diisi
 AUTHORIZED_IDS = [5425205882, 2092596833, -1002757263947]
 
-# Link sheet nama parfum (gviz json)
-NAMA_PARFUM_SHEET_URL = (
-    "https://docs.google.com/spreadsheets/d/1P4BO2jswz3xcngKspWrJeEm70MqalEN7P_BUMBSH7Ns/gviz/tq?tqx=out:json&gid=0"
+# Link sheet nama parfum (gviz csv di-stream; URL tqx=out:json juga didukung)
+NAMA_PARFUM_SHEET_URL = os.getenv(
+    "NAMA_PARFUM_SHEET_URL",
+    "https://docs.google.com/spreadsheets/d/1P4BO2jswz3xcngKspWrJeEm70MqalEN7P_BUMBSH7Ns/gviz/tq?tqx=out:csv&gid=0"
 )
 
+# HTTP keluar: satu klien keep-alive; per endpoint (timeout total, timeout connect, maks koneksi)
+HTTP_ENDPOINT = {
+    "sheet": (15.0, 5.0, 2),
+    "script": (20.0, 5.0, 4),
+}
+# Laju per endpoint (permintaan/detik, burst) & circuit breaker: terbuka setelah
+# SIRKUIT_AMBANG gagal beruntun, dicoba lagi setelah SIRKUIT_JEDA detik (maks SIRKUIT_JEDA_MAKS)
+HTTP_LAJU = {
+    "sheet": (0.5, 3),
+    "script": (5.0, 10),
+}
+SIRKUIT_AMBANG = int(os.getenv("SIRKUIT_AMBANG", "5"))
+SIRKUIT_JEDA = float(os.getenv("SIRKUIT_JEDA", "30"))
+SIRKUIT_JEDA_MAKS = float(os.getenv("SIRKUIT_JEDA_MAKS", "300"))
+
+# Update diproses bersamaan (maks N), tapi tetap berurutan per chat
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+
+# Outbox lokal: data yang dikonfirmasi masuk SQLite dulu, lalu dikirim worker
+DB_PATH = os.getenv("BOT_DB_PATH", "wistrian.sqlite3")
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "20"))          # baris diambil per putaran
+SCRIPT_BATCH_MAX = int(os.getenv("SCRIPT_BATCH_MAX", "1"))   # >1 hanya jika Apps Script paham field "batch"
+OUTBOX_MAX_COBA = int(os.getenv("OUTBOX_MAX_COBA", "8"))     # setelah ini baris ditandai gagal
+OUTBOX_KLAIM = int(os.getenv("OUTBOX_KLAIM", "60"))         # detik klaim baris satu worker (diperpanjang per POST)
+
+# Simpan idempoten: tiap payload punya idempotency_key; tap ganda / kirim ulang
+# dengan kunci yang sama dalam IDEM_TTL detik diabaikan (maks IDEM_MAKS kunci diingat)
+IDEM_TTL = int(os.getenv("IDEM_TTL", "900"))
+IDEM_MAKS = int(os.getenv("IDEM_MAKS", "4096"))
+
+# Refresh katalog otomatis (detik)
+KATALOG_REFRESH_DETIK = int(os.getenv("KATALOG_REFRESH_DETIK", "900"))
+# Snapshot katalog + index terakhir yang sukses, dimuat saat boot
+KATALOG_SNAPSHOT = os.getenv("KATALOG_SNAPSHOT", "katalog.snapshot")
+
+# Inline mode: cache hasil di proses + cache sisi Telegram (detik)
+INLINE_CACHE_MAKS = int(os.getenv("INLINE_CACHE_MAKS", "512"))
+INLINE_CACHE_TTL = int(os.getenv("INLINE_CACHE_TTL", "300"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "60"))
+# Query yang datang < INLINE_JEDA_MS setelah query sebelumnya dari user yang sama (masih mengetik)
+# ditunda selama itu; query baru membatalkan proses / jawaban lama user tsb.
+INLINE_JEDA_MS = int(os.getenv("INLINE_JEDA_MS", "150"))
+
+# Impor CSV/XLSX: baris divalidasi & dimasukkan outbox per potongan (memori tetap kecil)
+IMPOR_CHUNK = int(os.getenv("IMPOR_CHUNK", "200"))
+IMPOR_MAKS_BYTE = 20 * 1024 * 1024   # batas unduh file dari Bot API
+
 # List opsi
 VARIAN_BOTOL = ['Roll On', '15ml', '25ml', '35ml', '55ml', '65ml', '100ml']
 VARIAN_CAMPURAN = ['Absolute', 'Isopropyl', 'Alkohol', 'Fixative']
 KATEGORI_PEMBELIAN = ['Bibit', 'Botol', 'Campuran']
 
 # State
-CHOOSING, INPUT_DATA, PARFUM_LIST, PARFUM_SEARCH, FAST_PENJUALAN, FAST_PEMBELIAN = range(6)
-
-user_data = {}  # data sementara per chat
+CHOOSING, INPUT_DATA, PARFUM_LIST, PARFUM_SEARCH, FAST_PENJUALAN, FAST_PEMBELIAN, IMPOR_DOKUMEN = range(7)
+
+# Sesi per chat: dibuang jika menganggur > SESI_TTL detik, maksimal SESI_MAKS chat
+SESI_TTL = int(os.getenv("SESI_TTL", str(6 * 3600)))
+SESI_MAKS = int(os.getenv("SESI_MAKS", "1000"))
+SESI_PERSIST = os.getenv("SESI_PERSIST", "1") == "1"   # simpan ke DB_PATH agar tahan restart
+
+# Multi-worker: sesi & katalog dibagi lewat SHARED_STORE (mis. sqlite:///data/shared.sqlite3).
+# Hanya pemimpin (pemegang lease) yang menjalankan refresh katalog terjadwal.
+SHARED_STORE = os.getenv("SHARED_STORE", "")
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+SEWA_TTL = int(os.getenv("SEWA_TTL", "30"))                    # lease pemimpin, diperpanjang tiap TTL/3
+KATALOG_IKUTI_DETIK = int(os.getenv("KATALOG_IKUTI_DETIK", "15"))  # follower cek katalog baru
+
+# Profil on-demand (/profil, web_runner /debug/profil): lama maksimal & jeda sampel CPU
+PROFIL_MAKS_DETIK = int(os.getenv("PROFIL_MAKS_DETIK", "60"))
+PROFIL_INTERVAL = float(os.getenv("PROFIL_INTERVAL", "0.005"))
+
+# Multi-tenant (beberapa toko): TENANTS_FILE berisi JSON, atau env TENANTS berisi JSON yang sama:
+#   {"kode": {"nama": "...", "chat_ids": [...], "script_url": "...", "sheet_url": "..."}}
+# Katalog tiap tenant dimuat saat pertama dipakai, dibuang jika menganggur
+# KATALOG_IDLE_DETIK atau total memori katalog melewati KATALOG_MEM_MAKS_MB.
+TENANTS_FILE = os.getenv("TENANTS_FILE", "")
+TENANT_UTAMA = "utama"
+KATALOG_IDLE_DETIK = int(os.getenv("KATALOG_IDLE_DETIK", "3600"))
+KATALOG_MEM_MAKS_MB = int(os.getenv("KATALOG_MEM_MAKS_MB", "256"))
+
+
+# =============== METRIK (latensi & ukuran) ===============
+class Histogram:
+    __slots__ = ("batas", "bucket", "jumlah", "total", "error")
+
+    def __init__(self, batas: tuple):
+        self.batas = batas
+        self.bucket = [0] * len(batas)
+        self.jumlah, self.total, self.error = 0, 0.0, 0
+
+    def catat(self, nilai: float, error: bool = False):
+        i = bisect_left(self.batas, nilai)
+        if i < len(self.bucket):
+            self.bucket[i] += 1
+        self.jumlah += 1
+        self.total += nilai
+        if error:
+            self.error += 1
+
+
+class Metrik:
+    """Registry metrik in-process; diekspor format Prometheus oleh web_runner (/metrics)."""
+
+    DETIK = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    UKURAN = (0, 1, 5, 10, 25, 50, 100, 500, 1000, 10000)
+
+    def __init__(self):
+        self.latensi = {}   # nama → Histogram (detik)
+        self.ukuran = {}    # nama → Histogram (jumlah item)
+        self.gauge = {}
+        self.hitung = Counter()   # nama → jumlah kejadian
+        self.mulai = time.time()
+
+    def catat(self, nama: str, detik: float, error: bool = False):
+        h = self.latensi.get(nama)
+        if h is None:
+            h = self.latensi[nama] = Histogram(self.DETIK)
+        h.catat(detik, error)
+
+    def catat_ukuran(self, nama: str, n: int):
+        h = self.ukuran.get(nama)
+        if h is None:
+            h = self.ukuran[nama] = Histogram(self.UKURAN)
+        h.catat(n)
+
+    def set_gauge(self, nama: str, nilai: float):
+        self.gauge[nama] = nilai
+
+    def tambah(self, nama: str, n: int = 1):
+        self.hitung[nama] += n
+
+    @contextmanager
+    def ukur(self, nama: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self.catat(nama, time.perf_counter() - t0, error=not isinstance(e, asyncio.CancelledError))
+            raise
+        self.catat(nama, time.perf_counter() - t0)
+
+    def prometheus(self) -> str:
+        out = []
+        for metrik_nama, data in (("bot_latency_seconds", self.latensi), ("bot_result_size", self.ukuran)):
+            out.append(f"# TYPE {metrik_nama} histogram")
+            for nama, h in sorted(data.items()):
+                kum = 0
+                for batas, n in zip(h.batas, h.bucket):
+                    kum += n
+                    out.append(f'{metrik_nama}_bucket{{name="{nama}",le="{batas}"}} {kum}')
+                out.append(f'{metrik_nama}_bucket{{name="{nama}",le="+Inf"}} {h.jumlah}')
+                out.append(f'{metrik_nama}_sum{{name="{nama}"}} {h.total:.6f}')
+                out.append(f'{metrik_nama}_count{{name="{nama}"}} {h.jumlah}')
+        out.append("# TYPE bot_errors_total counter")
+        for nama, h in sorted(self.latensi.items()):
+            out.append(f'bot_errors_total{{name="{nama}"}} {h.error}')
+        out.append("# TYPE bot_events_total counter")
+        for nama, v in sorted(self.hitung.items()):
+            out.append(f'bot_events_total{{name="{nama}"}} {v}')
+        out.append("# TYPE bot_gauge gauge")
+        for nama, v in sorted(self.gauge.items()):
+            out.append(f'bot_gauge{{name="{nama}"}} {v}')
+        out.append(f"bot_uptime_seconds {time.time() - self.mulai:.0f}")
+        return "\n".join(out) + "\n"
+
+
+metrik = Metrik()
+
+def diukur(nama: str):
+    """Dekorator: catat latensi & error fungsi (sync/async) ke `metrik`."""
+    def deco(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def wrapper(*a, **kw):
+                with metrik.ukur(nama):
+                    return await fn(*a, **kw)
+        else:
+            @wraps(fn)
+            def wrapper(*a, **kw):
+                with metrik.ukur(nama):
+                    return fn(*a, **kw)
+        return wrapper
+    return deco
+
+
+# =============== PROFIL (CPU & memori, on-demand) ===============
+# Tidak ada hook permanen: thread sampler / tracemalloc hanya hidup selama profil diminta.
+_profil_jalan = False
+
+def _nama_frame(f) -> str:
+    c = f.f_code
+    return f"{os.path.basename(c.co_filename)}:{c.co_firstlineno} {c.co_name}"
+
+# thread yang sedang menunggu (pool to_thread, dll.) tidak ikut dihitung
+_FILE_MENUNGGU = {"threading.py", "queue.py", "selectors.py"}
+
+class _Sampel:
+    """Hitungan sampel stack: self = fungsi yang sedang berjalan, total = fungsi ada di stack."""
+
+    def __init__(self):
+        self.self_n, self.total_n = Counter(), Counter()
+
+    def catat(self, f, lewati_menunggu: bool = False):
+        if lewati_menunggu and os.path.basename(f.f_code.co_filename) in _FILE_MENUNGGU:
+            return
+        self.self_n[_nama_frame(f)] += 1
+        di_stack = set()
+        while f is not None:
+            di_stack.add(_nama_frame(f))
+            f = f.f_back
+        self.total_n.update(di_stack)
+
+    def laporan(self, judul: str) -> str:
+        n = sum(self.self_n.values())
+        baris = [f"{judul}: {n} sampel." + ("" if n else " Proses hampir tidak memakai CPU."),
+                 "", "  self%  total%  fungsi"]
+        n = n or 1
+        baris += [f"{v / n * 100:7.1f} {self.total_n[k] / n * 100:7.1f}  {k}" for k, v in self.self_n.most_common(40)]
+        baris += ["", "Teratas menurut total%:", "  total%  fungsi"]
+        baris += [f"{v / n * 100:8.1f}  {k}" for k, v in self.total_n.most_common(40)]
+        return "\n".join(baris) + "\n"
+
+def _sampel_thread(sampel: _Sampel, detik: float, interval: float):
+    """Cadangan tanpa SIGPROF: baca stack semua thread dari thread lain (wall-clock)."""
+    sendiri = threading.get_ident()
+    akhir = time.perf_counter() + detik
+    while time.perf_counter() < akhir:
+        for tid, f in sys._current_frames().items():
+            if tid != sendiri:
+                sampel.catat(f)
+        time.sleep(interval)
+
+async def _profil_cpu(detik: float, interval: float) -> str:
+    sampel = _Sampel()
+    if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        await asyncio.to_thread(_sampel_thread, sampel, detik, interval)
+        return sampel.laporan(f"Profil wall-clock {detik:g} detik (thread sampler, interval {interval * 1000:g} ms); "
+                              "event loop yang menganggur tampil sebagai select/poll")
+
+    # SIGPROF hanya berdetak saat proses memakai CPU; handler jalan di thread utama (event loop)
+    # tepat di bytecode yang sedang dieksekusi, thread lain dibaca dari sys._current_frames().
+    utama = threading.get_ident()
+    def tik(signum, frame):
+        if frame is not None:
+            sampel.catat(frame)
+        for tid, f in sys._current_frames().items():
+            if tid != utama:
+                sampel.catat(f, lewati_menunggu=True)
+    lama = signal.signal(signal.SIGPROF, tik)
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+    try:
+        await asyncio.sleep(detik)
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, lama)
+    return sampel.laporan(f"Profil CPU {detik:g} detik (SIGPROF tiap {interval * 1000:g} ms waktu CPU)")
+
+async def _profil_mem(detik: float) -> str:
+    """tracemalloc selama `detik`: alokasi yang bertambah & yang masih hidup, per baris kode."""
+    tracemalloc.start()
+    try:
+        awal = await asyncio.to_thread(tracemalloc.take_snapshot)
+        await asyncio.sleep(detik)
+        akhir = await asyncio.to_thread(tracemalloc.take_snapshot)
+        kini, puncak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    saring = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"))
+    awal, akhir = awal.filter_traces(saring), akhir.filter_traces(saring)
+    baris = [f"Profil memori {detik:g} detik (tracemalloc): dilacak {kini / 1024:.0f} KB, puncak {puncak / 1024:.0f} KB.",
+             "", "Bertambah selama profil (KB, jumlah blok):"]
+    baris += [f"{st.size_diff / 1024:+10.1f} {st.count_diff:+8d}  {st.traceback}"
+              for st in akhir.compare_to(awal, "lineno")[:40] if st.size_diff]
+    baris += ["", "Alokasi hidup terbesar di akhir profil (KB, jumlah blok):"]
+    baris += [f"{st.size / 1024:10.1f} {st.count:8d}  {st.traceback}" for st in akhir.statistics("lineno")[:40]]
+    return "\n".join(baris) + "\n"
+
+async def profil(jenis: str, detik: float = 10) -> str:
+    """Jalankan profil "cpu" / "mem" selama `detik` (maks PROFIL_MAKS_DETIK) pada proses ini → laporan teks.
+    ValueError = parameter salah, RuntimeError = profil lain sedang berjalan."""
+    global _profil_jalan
+    if jenis not in ("cpu", "mem"):
+        raise ValueError("jenis profil harus cpu atau mem")
+    detik = max(1.0, min(float(detik), PROFIL_MAKS_DETIK))
+    if _profil_jalan:
+        raise RuntimeError("profil lain sedang berjalan")
+    _profil_jalan = True
+    try:
+        if jenis == "cpu":
+            return await _profil_cpu(detik, PROFIL_INTERVAL)
+        return await _profil_mem(detik)
+    finally:
+        _profil_jalan = False
+
+
+# =============== TENANT (toko) ===============
+class Tenant:
+    """Satu toko: chat yang boleh akses, sheet nama parfum & Apps Script tujuan simpan."""
+    __slots__ = ("kode", "nama", "chat_ids", "script_url", "sheet_url", "snapshot")
+
+    def __init__(self, kode: str, chat_ids, script_url: str = None, sheet_url: str = None, nama: str = None):
+        self.kode, self.nama = kode, nama or kode
+        self.chat_ids = frozenset(int(c) for c in chat_ids)
+        self.script_url, self.sheet_url = script_url, sheet_url
+        # tenant utama tetap memakai file snapshot lama
+        self.snapshot = KATALOG_SNAPSHOT if kode == TENANT_UTAMA else f"{KATALOG_SNAPSHOT}.{kode}"
+
+
+def _muat_tenant() -> dict:
+    """TENANTS_FILE / TENANTS (JSON) → {kode: Tenant}. Tanpa konfigurasi: satu tenant utama."""
+    if TENANTS_FILE:
+        with open(TENANTS_FILE, encoding="utf-8") as f:
+            conf = json.load(f)
+    elif os.getenv("TENANTS"):
+        conf = json.loads(os.getenv("TENANTS"))
+    else:
+        return {TENANT_UTAMA: Tenant(TENANT_UTAMA, AUTHORIZED_IDS, SCRIPT_URL, NAMA_PARFUM_SHEET_URL)}
+    tenants = {}
+    for kode, c in conf.items():
+        tenants[kode] = Tenant(kode, c.get("chat_ids", []), c.get("script_url"),
+                               c.get("sheet_url"), c.get("nama"))
+    return tenants
+
+def _peta_chat(tenants: dict) -> dict:
+    peta = {}
+    for t in tenants.values():
+        for cid in t.chat_ids:
+            if cid in peta:
+                raise ValueError(f"chat {cid} terdaftar di dua tenant: {peta[cid].kode} & {t.kode}")
+            peta[cid] = t
+    return peta
+
+TENANTS = _muat_tenant()
+TENANT_CHAT = _peta_chat(TENANTS)   # chat/user id → Tenant (lookup O(1))
+
+def tenant_dari(chat_id: int):
+    return TENANT_CHAT.get(chat_id)
+
+def kode_tenant(chat_id: int) -> str:
+    t = TENANT_CHAT.get(chat_id)
+    return t.kode if t else TENANT_UTAMA
 
 
 # =============== UTILITIES ===============
 def is_authorized(chat_id: int) -> bool:
-    return chat_id in AUTHORIZED_IDS
+    return chat_id in TENANT_CHAT
 
 def _format_rp(n):
     try:
@@ -46,68 +386,751 @@ def _format_rp(n):
     except:
         return str(n)
 
+_KUNCI_FIELD = {
+    "nama": "nama",
+    "no hp": "no_hp", "no_hp": "no_hp",
+    "alamat": "alamat",
+    "kategori": "kategori",
+    "nama parfum": "nama_parfum",
+    "nama_parfum": "nama_parfum",
+    "nama barang": "nama_barang",
+    "nama_barang": "nama_barang",
+    "varian": "varian",
+    "qty": "qty", "jumlah": "qty",
+    "harga total": "harga_total", "harga_total": "harga_total",
+    "harga satuan": "harga_satuan", "harga_satuan": "harga_satuan",
+    "link": "link",
+    "tanggal": "tanggal",
+}
+
+def _kunci_field(k: str):
+    """Nama field bebas (blok teks / header file) → nama field payload, atau None."""
+    key = k.strip().lower()
+    return _KUNCI_FIELD.get(key) or _KUNCI_FIELD.get(key.replace(" ", ""))
+
 def _parse_block_to_dict(text: str) -> dict:
-    mapping = {
-        "nama": "nama",
-        "no hp": "no_hp", "no_hp": "no_hp",
-        "alamat": "alamat",
-        "kategori": "kategori",
-        "nama parfum": "nama_parfum",
-        "nama_parfum": "nama_parfum",
-        "nama barang": "nama_barang",
-        "nama_barang": "nama_barang",
-        "varian": "varian",
-        "qty": "qty", "jumlah": "qty",
-        "harga total": "harga_total", "harga_total": "harga_total",
-        "harga satuan": "harga_satuan", "harga_satuan": "harga_satuan",
-        "link": "link",
-    }
     d = {}
     for line in text.splitlines():
         if ":" not in line: 
             continue
         k, v = line.split(":", 1)
-        key = k.strip().lower()
-        val = v.strip()
-        key2 = key.replace(" ", "")
-        norm = mapping.get(key) or mapping.get(key2)
+        norm = _kunci_field(k)
         if norm:
-            d[norm] = val
+            d[norm] = v.strip()
     # normalisasi nama_parfum → nama_barang jika perlu
     if "nama_parfum" in d and "nama_barang" not in d:
         d["nama_barang"] = d["nama_parfum"]
     return d
 
-def ambil_data_parfum(retry=2) -> list:
-    for _ in range(max(1, retry)):
+# =============== HTTP KELUAR ===============
+class SirkuitTerbuka(Exception):
+    """Endpoint dianggap sedang bermasalah: panggilan ditolak seketika, tanpa menunggu timeout."""
+
+    def __init__(self, endpoint: str, sisa: float):
+        super().__init__(f"{endpoint} sedang bermasalah, dicoba lagi ±{ceil(sisa)} detik")
+        self.endpoint, self.sisa = endpoint, sisa
+
+
+class Gerbang:
+    """Pengatur satu endpoint: token bucket, batas paralel adaptif (AIMD) & circuit breaker.
+
+    Sukses → batas paralel naik pelan (+1/batas); gagal (timeout, 429, 5xx) → batas dibagi dua.
+    SIRKUIT_AMBANG kegagalan beruntun → sirkuit terbuka selama jeda; setelah itu satu
+    permintaan percobaan boleh lewat (sukses = tertutup, gagal = terbuka lagi, jeda ×2).
+    """
+
+    def __init__(self, nama: str, laju: float, burst: int, maks: int):
+        self.nama = nama
+        self.laju, self.burst = laju, burst
+        self.token, self._isi = float(burst), time.monotonic()
+        self.maks, self.batas, self.aktif = maks, float(maks), 0
+        self._lega = asyncio.Event()
+        self.gagal_beruntun = 0
+        self.buka_sampai = 0.0      # != 0: terbuka / setengah-terbuka
+        self.jeda = SIRKUIT_JEDA
+        self._uji = False
+
+    def sisa_terbuka(self) -> float:
+        return max(0.0, self.buka_sampai - time.monotonic())
+
+    async def masuk(self) -> bool:
+        """Tunggu giliran; True jika ini permintaan percobaan (setengah-terbuka)."""
+        while True:
+            # dicek ulang setelah menunggu: sirkuit bisa terbuka selama antre
+            sisa = self.sisa_terbuka()
+            if sisa or (self.buka_sampai and self._uji):
+                raise SirkuitTerbuka(self.nama, sisa or 1)
+            if self.aktif < int(self.batas):
+                break
+            self._lega.clear()
+            await self._lega.wait()
+        self.aktif += 1
+        uji = bool(self.buka_sampai)
+        if uji:
+            self._uji = True        # setengah-terbuka: hanya permintaan ini yang lewat
+        try:
+            while True:
+                now = time.monotonic()
+                self.token = min(self.burst, self.token + (now - self._isi) * self.laju)
+                self._isi = now
+                if self.token >= 1:
+                    self.token -= 1
+                    return uji
+                await asyncio.sleep((1 - self.token) / self.laju)
+        except BaseException:
+            self.keluar(None, uji)
+            raise
+
+    def keluar(self, ok, uji: bool = False):
+        """ok True/False = sukses/gagal; None = netral (mis. dibatalkan)."""
+        self.aktif -= 1
+        if uji:
+            self._uji = False
+        if ok:
+            self.gagal_beruntun = 0
+            self.batas = min(self.maks, self.batas + 1 / self.batas)
+            if self.buka_sampai:
+                print(f"✅ Sirkuit {self.nama} tertutup lagi.")
+                self.buka_sampai, self.jeda = 0.0, SIRKUIT_JEDA
+        elif ok is False:
+            self.gagal_beruntun += 1
+            self.batas = max(1.0, self.batas / 2)
+            # yang sudah terlanjur jalan saat sirkuit terbuka tidak memperpanjang jeda
+            if uji or (not self.buka_sampai and self.gagal_beruntun >= SIRKUIT_AMBANG):
+                if uji:
+                    self.jeda = min(SIRKUIT_JEDA_MAKS, self.jeda * 2)
+                self.buka_sampai = time.monotonic() + self.jeda
+                print(f"⛔ Sirkuit {self.nama} terbuka {self.jeda:.0f} detik ({self.gagal_beruntun} gagal beruntun).")
+        metrik.set_gauge(f"http_{self.nama}_batas", round(self.batas, 2))
+        metrik.set_gauge(f"http_{self.nama}_sirkuit_terbuka", int(bool(self.buka_sampai)))
+        self._lega.set()
+
+
+def _sehat(r: httpx.Response) -> bool:
+    # 4xx selain 429 = server hidup (salah request), bukan alasan membuka sirkuit
+    return r.status_code != 429 and r.status_code < 500
+
+
+class HttpPool:
+    """Satu httpx.AsyncClient bersama (keep-alive); per endpoint timeout, per (endpoint, tenant)
+    laju & circuit breaker, supaya Apps Script / sheet satu toko yang rusak tidak menahan toko lain."""
+
+    def __init__(self, endpoint: dict = HTTP_ENDPOINT, laju: dict = HTTP_LAJU, transport=None):
+        total = sum(k for _, _, k in endpoint.values())
+        self.client = httpx.AsyncClient(
+            follow_redirects=True,   # Apps Script menjawab 302 ke googleusercontent
+            limits=httpx.Limits(max_connections=total, max_keepalive_connections=total, keepalive_expiry=60),
+            transport=transport,
+        )
+        self._timeout = {n: httpx.Timeout(t, connect=c) for n, (t, c, _) in endpoint.items()}
+        self._atur = {n: (*laju[n], k) for n, (_, _, k) in endpoint.items()}
+        self.gerbang = {}   # (endpoint, tenant) → Gerbang, dibuat saat pertama dipakai
+
+    def _gerbang(self, endpoint: str, tenant: str) -> Gerbang:
+        g = self.gerbang.get((endpoint, tenant))
+        if g is None:
+            g = self.gerbang[(endpoint, tenant)] = Gerbang(f"{endpoint}.{tenant}", *self._atur[endpoint])
+        return g
+
+    def sisa_terbuka(self, endpoint: str, tenant: str = TENANT_UTAMA) -> float:
+        """Detik sampai endpoint tenant boleh dicoba lagi (0 = tertutup / siap)."""
+        g = self.gerbang.get((endpoint, tenant))
+        return g.sisa_terbuka() if g else 0.0
+
+    @asynccontextmanager
+    async def stream(self, endpoint: str, method: str, url: str, tenant: str = TENANT_UTAMA, **kw):
+        g = self._gerbang(endpoint, tenant)
+        uji = await g.masuk()
+        ok = False
+        try:
+            async with self.client.stream(method, url, timeout=self._timeout[endpoint], **kw) as r:
+                ok = _sehat(r)   # dinilai dari status, sebelum pemanggil sempat raise_for_status()
+                yield r
+        except httpx.TransportError:
+            ok = False       # body putus di tengah (timeout baca) tetap dihitung gagal
+            raise
+        except asyncio.CancelledError:
+            ok = None
+            raise
+        finally:
+            g.keluar(ok, uji)
+
+    async def request(self, endpoint: str, method: str, url: str, tenant: str = TENANT_UTAMA, **kw) -> httpx.Response:
+        g = self._gerbang(endpoint, tenant)
+        uji = await g.masuk()
+        ok = False
+        try:
+            r = await self.client.request(method, url, timeout=self._timeout[endpoint], **kw)
+            ok = _sehat(r)
+            return r
+        except asyncio.CancelledError:
+            ok = None
+            raise
+        finally:
+            g.keluar(ok, uji)
+
+    async def tutup(self):
+        await self.client.aclose()
+
+
+# =============== SHEET PARFUM ===============
+_GVIZ_WRAPPER = re.compile(
+    r"^\s*(?:/\*O_o\*/\s*)?google\.visualization\.Query\.setResponse\((.*)\);?\s*$", re.S)
+
+def _tabel_gviz(raw: str):
+    """Respon gviz JSON → (label kolom, baris berisi teks sel)."""
+    m = _GVIZ_WRAPPER.match(raw)
+    if not m:
+        raise ValueError("respon gviz tidak dikenali: " + raw[:60])
+    data = json.loads(m.group(1))
+    if data.get("status") == "error":
+        raise ValueError("gviz error: " + "; ".join(
+            e.get("detailed_message") or e.get("message", "") for e in data.get("errors", [])))
+    labels = [c.get("label") or "" for c in data["table"].get("cols", [])]
+    rows = []
+    for row in data["table"]["rows"]:
+        baris = []
+        for sel in row.get("c") or []:
+            v = sel.get("v") if sel else None
+            if v is not None and not isinstance(v, str):
+                v = sel.get("f", v)   # angka/tanggal: pakai teks terformat
+            baris.append("" if v is None else str(v))
+        rows.append(baris)
+    return labels, rows
+
+# Harga per ukuran botol: kolom sheet berlabel "35ml" / "Harga 35ml" (lihat VARIAN_BOTOL)
+_VARIAN_NORM = {v.lower().replace(" ", ""): v for v in VARIAN_BOTOL}
+
+def _varian_botol(teks: str):
+    """'35 ML' / 'roll on' → nama varian di VARIAN_BOTOL (None jika bukan ukuran botol)."""
+    return _VARIAN_NORM.get((teks or "").lower().replace(" ", ""))
+
+def _kolom_harga(labels: list) -> dict:
+    """Header sheet → {indeks kolom: varian} untuk kolom harga per ukuran botol."""
+    kolom = {}
+    for i, label in enumerate(labels):
+        t = label.lower().replace(" ", "").replace("_", "")
+        varian = _VARIAN_NORM.get(t[5:] if t.startswith("harga") else t)
+        if varian:
+            kolom[i] = varian
+    return kolom
+
+def _harga_sel(teks) -> int:
+    """Sel harga ("45000", "Rp45.000", "45,000.00") → int; 0 jika kosong / bukan angka."""
+    t = re.sub(r"[.,]\d{1,2}\s*$", "", str(teks or "").strip())   # buang desimal sen
+    d = "".join(ch for ch in t if ch.isdigit())
+    return int(d) if d and len(d) < 10 else 0   # muat di array('I')
+
+class PembacaKatalog:
+    """Baca respon sheet per potongan byte; simpan kolom nama + kolom harga per varian (jika ada).
+
+    CSV diproses baris demi baris (memori tetap datar); JSON gviz perlu
+    utuh untuk json.loads, tapi wrapper-nya divalidasi.
+    """
+
+    def __init__(self, format: str = "csv", kolom: int = 0):
+        self.format, self.kolom = format, kolom
+        self._hash = hashlib.sha256()
+        self._dec = codecs.getincrementaldecoder("utf-8")()
+        self._sisa = ""     # potongan baris terakhir yang belum lengkap
+        self._rekam = ""    # baris CSV yang terpotong newline di dalam kutip
+        self._header = True
+        self._json = []
+        self.nama = set()
+        self.kolom_harga = {}   # indeks kolom → varian, dari header
+        self.harga = {}         # nama → {varian: harga}
+
+    def feed(self, chunk: bytes):
+        self._hash.update(chunk)
+        teks = self._dec.decode(chunk)
+        if self.format == "json":
+            self._json.append(teks)
+            return
+        *baris, self._sisa = (self._sisa + teks).split("\n")
+        for b in baris:
+            self._baris(b)
+
+    def _baris(self, b: str):
+        b = self._rekam + b.rstrip("\r")
+        if b.count('"') % 2:
+            self._rekam = b + "\n"
+            return
+        self._rekam = ""
+        row = next(csv.reader([b]), [])
+        if self._header:    # baris pertama CSV gviz = label kolom
+            self._header = False
+            self.kolom_harga = _kolom_harga(row)
+            return
+        self._row(row)
+
+    def _row(self, row: list):
+        if len(row) > self.kolom:
+            nama = row[self.kolom].strip()
+            if nama:
+                self.nama.add(nama)
+                for k, varian in self.kolom_harga.items():
+                    h = _harga_sel(row[k]) if k < len(row) else 0
+                    if h:
+                        self.harga.setdefault(nama, {})[varian] = h
+
+    def selesai(self) -> list:
+        sisa = self._dec.decode(b"", final=True)
+        if self.format == "json":
+            labels, rows = _tabel_gviz("".join(self._json) + sisa)
+            self.kolom_harga = _kolom_harga(labels)
+            for row in rows:
+                self._row(row)
+            return sorted(self.nama)
+        b = self._sisa + sisa
+        if b.strip() or self._rekam:
+            self._baris(b)
+        return sorted(self.nama)
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+@diukur("http.sheet")
+async def _unduh_katalog(http: HttpPool, url: str, etag=None, tenant: str = TENANT_UTAMA):
+    headers = {"If-None-Match": etag} if etag else {}
+    async with http.stream("sheet", "GET", url, tenant, headers=headers) as r:
+        if r.status_code == 304:
+            return None, etag, None, None
+        r.raise_for_status()
+        pembaca = PembacaKatalog("json" if "out:json" in url else "csv")
+        async for chunk in r.aiter_bytes(64 * 1024):
+            pembaca.feed(chunk)
+        return pembaca.selesai(), r.headers.get("ETag"), pembaca.digest, pembaca.harga
+
+@diukur("fungsi.ambil_data_parfum")
+async def ambil_data_parfum(http: HttpPool, retry=2, etag=None, hash_lama=None, url: str = NAMA_PARFUM_SHEET_URL,
+                            tenant: str = TENANT_UTAMA):
+    """Ambil sheet parfum tanpa memblokir event loop.
+
+    Return (daftar, etag, hash, harga). daftar None = isi sheet tidak berubah
+    (ETag/hash sama), [] = gagal. harga = {nama: {varian: harga}} dari kolom harga.
+    """
+    for n in range(max(1, retry)):
+        if n:
+            await asyncio.sleep(min(8, 2 ** n) * random.uniform(0.5, 1.0))
         try:
-            raw = requests.get(NAMA_PARFUM_SHEET_URL, timeout=10).text
-            data = json.loads(raw[47:-2])  # potong wrapper gviz
-            names = []
-            for row in data["table"]["rows"]:
-                nama = row["c"][0]["v"] if row["c"][0] else ""
-                if nama: names.append(nama.strip())
-            names = sorted(set(names))
+            names, etag_baru, h, harga = await _unduh_katalog(http, url, etag, tenant)
+            if names is None or h == hash_lama:
+                return None, etag_baru, hash_lama, None
             if names:
-                print(f"✅ Parfum loaded: {len(names)}")
-                return names
+                print(f"✅ Parfum loaded: {len(names)}" + (f" ({len(harga)} dengan harga)" if harga else ""))
+                return names, etag_baru, h, harga
+        except SirkuitTerbuka as e:
+            print("⏸ ambil_data_parfum:", e)
+            break
         except Exception as e:
             print("⚠️ ambil_data_parfum error:", e)
-    print("❌ Gagal load dari sheet, gunakan fallback.")
-    return []
-
-def cari_parfum(keyword: str, daftar: list) -> list:
-    kw = (keyword or "").strip().lower()
-    if not kw: return []
-    return [x for x in daftar if kw in x.lower()]
-
-def parfum_page_markup(parfum_list: list, page: int, per_page: int = 6):
+    print("❌ Gagal load dari sheet.")
+    return [], etag, hash_lama, None
+
+# =============== PENCARIAN PARFUM (index) ===============
+def _normalisasi(teks: str) -> str:
+    t = unicodedata.normalize("NFKD", teks or "")
+    t = "".join(ch for ch in t if not unicodedata.combining(ch)).lower()
+    return " ".join(t.split())
+
+FUZZY_KANDIDAT = 400  # batas kandidat yang dinilai di tahap typo
+
+def _trigram(teks: str) -> set:
+    return {teks[i:i + 3] for i in range(len(teks) - 2)}
+
+class ParfumIndex:
+    """Index nama parfum, dibangun sekali per muat katalog.
+
+    Urutan hasil: persis → awalan nama → awalan kata → substring → mirip (typo).
+    """
+
+    def __init__(self, daftar: list):
+        self.nama = list(daftar)
+        self.norm = [_normalisasi(n) for n in self.nama]
+        self._persis = {}
+        awal, kata = [], []
+        self._gram = defaultdict(list)   # trigram → id (urut naik)
+        self._jml_gram = []
+        for i, n in enumerate(self.norm):
+            self._persis.setdefault(n, i)
+            awal.append((n, i))
+            for pos, ch in enumerate(n):
+                if ch == " " and pos + 1 < len(n):
+                    kata.append((n[pos + 1:], i))
+            grams = _trigram(" " + n)
+            self._jml_gram.append(len(grams))
+            for g in grams:
+                self._gram[g].append(i)
+        awal.sort()
+        kata.sort()
+        self._awal_key = [k for k, _ in awal]
+        self._awal_id = array("I", (i for _, i in awal))
+        self._kata_key = [k for k, _ in kata]
+        self._kata_id = array("I", (i for _, i in kata))
+        self._gram = {g: array("I", ids) for g, ids in self._gram.items()}
+        self._jml_gram = array("H", self._jml_gram)
+
+    # --- serialisasi untuk snapshot (hanya tipe yang bisa di-marshal) ---
+    def ke_state(self) -> dict:
+        return {
+            "nama": self.nama, "norm": self.norm,
+            "awal_key": self._awal_key, "awal_id": self._awal_id.tobytes(),
+            "kata_key": self._kata_key, "kata_id": self._kata_id.tobytes(),
+            "gram": {g: ids.tobytes() for g, ids in self._gram.items()},
+            "jml_gram": self._jml_gram.tobytes(),
+        }
+
+    @classmethod
+    def dari_state(cls, st: dict) -> "ParfumIndex":
+        def arr(kode, b):
+            a = array(kode)
+            a.frombytes(b)
+            return a
+        self = cls.__new__(cls)
+        self.nama, self.norm = st["nama"], st["norm"]
+        self._persis = {}
+        for i, n in enumerate(self.norm):
+            self._persis.setdefault(n, i)
+        self._awal_key, self._awal_id = st["awal_key"], arr("I", st["awal_id"])
+        self._kata_key, self._kata_id = st["kata_key"], arr("I", st["kata_id"])
+        self._gram = {g: arr("I", b) for g, b in st["gram"].items()}
+        self._jml_gram = arr("H", st["jml_gram"])
+        return self
+
+    def __len__(self):
+        return len(self.nama)
+
+    def ukuran(self) -> int:
+        """Perkiraan memori (byte), untuk batas memori katalog antar tenant."""
+        teks = sum(sys.getsizeof(x) for daftar in (self.nama, self.norm, self._awal_key, self._kata_key)
+                   for x in daftar)
+        arr = sum(a.itemsize * len(a) for a in (self._awal_id, self._kata_id, self._jml_gram))
+        arr += sum(a.itemsize * len(a) + 64 for a in self._gram.values())
+        return teks + arr + 100 * (len(self._gram) + len(self._persis))
+
+    def cari_persis(self, nama: str):
+        i = self._persis.get(_normalisasi(nama))
+        return None if i is None else self.nama[i]
+
+    def _awalan(self, keys, ids, kw, hasil, seen, limit):
+        j = bisect_left(keys, kw)
+        while j < len(keys) and keys[j].startswith(kw) and len(hasil) < limit:
+            i = ids[j]
+            if i not in seen:
+                seen.add(i)
+                hasil.append(i)
+            j += 1
+
+    def cari(self, keyword: str, limit: int = None) -> list:
+        kw = _normalisasi(keyword)
+        if not kw:
+            return []
+        limit = limit or len(self.nama)
+        hasil, seen = [], set()
+
+        i = self._persis.get(kw)
+        if i is not None:
+            hasil.append(i)
+            seen.add(i)
+        self._awalan(self._awal_key, self._awal_id, kw, hasil, seen, limit)
+        self._awalan(self._kata_key, self._kata_id, kw, hasil, seen, limit)
+
+        # substring di tengah kata: telusuri posting trigram paling jarang lalu verifikasi.
+        # Keyword 1–2 huruf tidak punya trigram → pindai semua nama.
+        grams = _trigram(kw)
+        if len(hasil) < limit:
+            calon = min((self._gram.get(g, ()) for g in grams), key=len) if grams else range(len(self.norm))
+            for i in calon:
+                if i not in seen and kw in self.norm[i]:
+                    seen.add(i)
+                    hasil.append(i)
+                    if len(hasil) >= limit:
+                        break
+
+        # toleran typo: nama yang berbagi cukup banyak trigram dengan keyword.
+        # Kandidat cukup diambil dari posting paling jarang (pigeonhole), dibatasi FUZZY_KANDIDAT.
+        if len(hasil) < limit and len(kw) >= 3:
+            qgrams = sorted(_trigram(" " + kw), key=lambda g: len(self._gram.get(g, ())))
+            minimal = max(2, (len(qgrams) + 1) // 2)
+            kandidat = set()
+            for g in qgrams[:len(qgrams) - minimal + 1]:
+                kandidat.update(islice(self._gram.get(g, ()), FUZZY_KANDIDAT - len(kandidat)))
+                if len(kandidat) >= FUZZY_KANDIDAT:
+                    break
+            qset = set(qgrams)
+            mirip = []
+            for i in kandidat:
+                if i in seen:
+                    continue
+                n = len(qset & _trigram(" " + self.norm[i]))
+                if n >= minimal:
+                    mirip.append((-n, self._jml_gram[i], i))
+            mirip.sort()
+            hasil.extend(i for _, _, i in mirip[:limit - len(hasil)])
+
+        return [self.nama[i] for i in hasil[:limit]]
+
+
+class CacheTTL:
+    """LRU sederhana dengan umur maksimum per entri."""
+
+    def __init__(self, maks: int, ttl: float):
+        self.maks, self.ttl = maks, ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        t, val = item
+        if time.monotonic() - t > self.ttl:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return val
+
+    def set(self, key, val):
+        self._data[key] = (time.monotonic(), val)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maks:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def buang_jika(self, syarat):
+        """Buang entri yang kuncinya memenuhi `syarat(key)`; return jumlahnya."""
+        basi = [k for k in self._data if syarat(k)]
+        for k in basi:
+            del self._data[k]
+        return len(basi)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def cari_parfum(keyword: str, daftar, limit: int = None) -> list:
+    index = daftar if isinstance(daftar, ParfumIndex) else ParfumIndex(daftar)
+    hasil = index.cari(keyword, limit)
+    metrik.catat_ukuran("cari_parfum", len(hasil))
+    return hasil
+
+class Katalog:
+    """Satu versi katalog parfum beserta index turunannya.
+
+    Tidak diubah setelah dipasang; refresh membangun objek baru lalu menukarnya.
+    """
+    __slots__ = ("versi", "daftar", "index", "hash", "etag", "id_nama", "id_of", "harga", "_halaman")
+    PER_PAGE = 6
+
+    def __init__(self, daftar: list, hash: str = None, etag: str = None, index: ParfumIndex = None,
+                 id_nama: list = None, sebelumnya: "Katalog" = None, harga: dict = None, tabel_harga: dict = None):
+        self.versi = 0
+        self.daftar = daftar
+        self.index = index or ParfumIndex(daftar)
+        self.hash, self.etag = hash, etag
+
+        # ID ringkas untuk callback_data (limit 64 byte), stabil antar versi:
+        # nama yang sudah pernah ada tetap memakai ID lamanya, nama baru ditambah di belakang
+        if id_nama is None:
+            id_nama = sebelumnya.id_nama if sebelumnya else ()
+        self.id_nama = list(id_nama)
+        self.id_of = {n: i for i, n in enumerate(self.id_nama)}
+        for n in daftar:
+            if n not in self.id_of:
+                self.id_of[n] = len(self.id_nama)
+                self.id_nama.append(n)
+
+        # harga: varian → array('I') berindeks ID katalog (0 = tidak ada harga), lookup O(1).
+        # Dibangun dari {nama: {varian: harga}} hasil sheet, atau langsung dari snapshot.
+        if tabel_harga is None:
+            tabel_harga = {}
+            for nama, per_varian in (harga or {}).items():
+                pid = self.id_of[nama]
+                for varian, h in per_varian.items():
+                    arr = tabel_harga.get(varian)
+                    if arr is None:
+                        arr = tabel_harga[varian] = array("I", [0]) * len(self.id_nama)
+                    arr[pid] = h
+        self.harga = tabel_harga
+        self._halaman = {}
+
+    def harga_satuan(self, nama: str, varian: str) -> int:
+        """Harga per botol dari sheet; 0 jika tidak ada."""
+        arr = self.harga.get(_varian_botol(varian) or varian)
+        pid = self.id_of.get(nama)
+        return arr[pid] if arr is not None and pid is not None and pid < len(arr) else 0
+
+    def ukuran(self) -> int:
+        return self.index.ukuran() + sum(a.itemsize * len(a) for a in self.harga.values())
+
+    def nama_dari_id(self, pid: int):
+        return self.id_nama[pid] if 0 <= pid < len(self.id_nama) else None
+
+    def halaman(self, page: int) -> InlineKeyboardMarkup:
+        """Keyboard halaman `page`, dibangun sekali per versi katalog lalu dipakai ulang."""
+        max_page = max(1, ceil(len(self.daftar) / self.PER_PAGE))
+        page = max(1, min(page, max_page))
+        mk = self._halaman.get(page)
+        if mk is None:
+            mk = self._halaman[page] = parfum_page_markup(self.daftar, page, self.PER_PAGE, id_of=self.id_of)
+        return mk
+
+    def tombol(self, nama: str) -> InlineKeyboardButton:
+        return InlineKeyboardButton(nama, callback_data=f"parfum|{self.id_of.get(nama, nama)}")
+
+KATALOG_KOSONG = Katalog([])
+
+# Format snapshot: header (magic + versi python, karena marshal terikat versi) + marshal(dict)
+_SNAPSHOT_MAGIC = b"WSNAP1 %d.%d\n" % sys.version_info[:2]
+
+def snapshot_bytes(kat: Katalog) -> bytes:
+    state = {"hash": kat.hash, "etag": kat.etag, "id_nama": kat.id_nama, "index": kat.index.ke_state(),
+             "harga": {v: a.tobytes() for v, a in kat.harga.items()}}
+    return _SNAPSHOT_MAGIC + marshal.dumps(state)
+
+def _state_snapshot(buf):
+    if buf[:len(_SNAPSHOT_MAGIC)] != _SNAPSHOT_MAGIC:
+        print("⚠️ Snapshot katalog beda format, diabaikan.")
+        return None
+    with memoryview(buf) as mv:
+        return marshal.loads(mv[len(_SNAPSHOT_MAGIC):])
+
+def katalog_dari_snapshot(state) -> Katalog:
+    index = ParfumIndex.dari_state(state["index"])
+    harga = {v: array("I", b) for v, b in state.get("harga", {}).items()}
+    return Katalog(index.nama, state["hash"], state["etag"], index=index, id_nama=state.get("id_nama"),
+                   tabel_harga=harga)
+
+def simpan_snapshot(kat: Katalog, path: str = KATALOG_SNAPSHOT):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(snapshot_bytes(kat))
+    os.replace(tmp, path)
+
+def muat_snapshot(path: str = KATALOG_SNAPSHOT):
+    """Muat katalog dari snapshot; None jika tidak ada / format tidak cocok."""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            state = _state_snapshot(mm)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print("⚠️ muat_snapshot error:", e)
+        return None
+    return katalog_dari_snapshot(state) if state else None
+
+def muat_snapshot_store(store, kode: str = TENANT_UTAMA):
+    """Katalog tenant terbitan worker lain di shared store (None jika belum ada)."""
+    buf = store.get(f"katalog:{kode}", "snapshot")
+    state = _state_snapshot(buf) if buf else None
+    return katalog_dari_snapshot(state) if state else None
+
+class KatalogPool:
+    """Katalog per tenant. Dimuat saat pertama dipakai; dibuang jika menganggur > idle detik
+    atau total perkiraan memori > maks_byte (yang paling lama tidak dipakai dibuang dulu)."""
+
+    def __init__(self, idle: int = KATALOG_IDLE_DETIK, maks_byte: int = KATALOG_MEM_MAKS_MB * 1024 * 1024):
+        self.idle, self.maks_byte = idle, maks_byte
+        self._kat = OrderedDict()   # kode → Katalog, urut terakhir dipakai
+        self._ukuran, self._dipakai = {}, {}
+        self._versi = {}            # tetap naik walau katalog sempat dibuang
+
+    def get(self, kode: str):
+        return self._kat.get(kode)
+
+    def pakai(self, kode: str):
+        kat = self._kat.get(kode)
+        if kat is not None:
+            self._kat.move_to_end(kode)
+            self._dipakai[kode] = time.monotonic()
+        return kat
+
+    def pasang(self, kode: str, kat: Katalog) -> list:
+        """Pasang / ganti katalog tenant; return kode tenant yang dibuang karena batas memori."""
+        kat.versi = self._versi[kode] = self._versi.get(kode, 0) + 1
+        self._kat[kode] = kat
+        self._kat.move_to_end(kode)
+        self._dipakai[kode] = time.monotonic()
+        self._ukuran[kode] = kat.ukuran()
+        dibuang = []
+        while self.memori() > self.maks_byte and len(self._kat) > 1:
+            lama = next(k for k in self._kat if k != kode)
+            self._buang(lama)
+            dibuang.append(lama)
+        return dibuang
+
+    def _buang(self, kode: str):
+        self._kat.pop(kode, None)
+        self._ukuran.pop(kode, None)
+        self._dipakai.pop(kode, None)
+
+    def bersihkan(self) -> list:
+        batas = time.monotonic() - self.idle
+        basi = [k for k, t in self._dipakai.items() if t < batas]
+        for k in basi:
+            self._buang(k)
+        return basi
+
+    def dimuat(self) -> list:
+        return list(self._kat)
+
+    def memori(self) -> int:
+        return sum(self._ukuran.values())
+
+    def __len__(self):
+        return len(self._kat)
+
+
+def _pool(bot_data: dict) -> KatalogPool:
+    return bot_data.setdefault("katalog_pool", KatalogPool())
+
+def _gauge_katalog(pool: KatalogPool):
+    metrik.set_gauge("katalog_parfum", sum(len(pool.get(k).daftar) for k in pool.dimuat()))
+    metrik.set_gauge("katalog_dimuat", len(pool))
+    metrik.set_gauge("katalog_memori_byte", pool.memori())
+
+def pasang_katalog(bot_data: dict, kat: Katalog, kode: str = TENANT_UTAMA) -> Katalog:
+    # ditukar tanpa await di antaranya → atomik bagi handler lain
+    pool = _pool(bot_data)
+    for k in pool.pasang(kode, kat):
+        print(f"♻️ Katalog tenant {k} dibuang (batas memori {KATALOG_MEM_MAKS_MB} MB).")
+    _gauge_katalog(pool)
+    if "inline_cache" in bot_data:   # kunci: (kode tenant, versi katalog, query)
+        bot_data["inline_cache"].buang_jika(lambda k: k[0] == kode)
+    return kat
+
+def muat_katalog_tenant(app, tenant: Tenant):
+    """Muat pertama: snapshot (shared store / file) seketika, sheet segar menyusul di latar belakang."""
+    store = app.bot_data.get("store")
+    kat = (store and muat_snapshot_store(store, tenant.kode)) or muat_snapshot(tenant.snapshot)
+    if kat:
+        pasang_katalog(app.bot_data, kat, tenant.kode)
+    nama_job = f"muat_katalog:{tenant.kode}"
+    if app.job_queue and not app.job_queue.get_jobs_by_name(nama_job):
+        app.job_queue.run_once(refresh_katalog, 0, data=tenant.kode, name=nama_job)
+    return kat
+
+def _katalog(context, chat_id: int) -> Katalog:
+    """Katalog tenant pemilik chat (dimuat saat pertama dipakai)."""
+    tenant = TENANT_CHAT.get(chat_id)
+    if tenant is None:
+        return KATALOG_KOSONG
+    kat = _pool(context.bot_data).pakai(tenant.kode)
+    if kat is None:
+        kat = muat_katalog_tenant(context.application, tenant)
+    return kat or KATALOG_KOSONG
+
+@diukur("fungsi.parfum_page_markup")
+def parfum_page_markup(parfum_list: list, page: int, per_page: int = 6, id_of: dict = None):
     total = len(parfum_list)
     max_page = max(1, ceil(total / per_page)) if total else 1
     page = max(1, min(page, max_page))
     start, end = (page - 1) * per_page, (page - 1) * per_page + per_page
     items = parfum_list[start:end]
-    rows = [[InlineKeyboardButton(n, callback_data=f"parfum|{n}")] for n in items]
+    id_of = id_of or {}
+    rows = [[InlineKeyboardButton(n, callback_data=f"parfum|{id_of.get(n, n)}")] for n in items]
     nav = []
     if page > 1:
         nav.append(InlineKeyboardButton("⬅️ Sebelumnya", callback_data=f"page|{page-1}"))
@@ -118,6 +1141,549 @@ def parfum_page_markup(parfum_list: list, page: int, per_page: int = 6):
     return InlineKeyboardMarkup(rows)
 
 
+# =============== BUKU (ledger lokal & rekap) ===============
+class Buku:
+    """Salinan lokal data yang sudah terkirim ke sheet + agregat harian untuk /rekap (per tenant).
+
+    Memakai koneksi Outbox: baris dicatat di transaksi yang sama saat dihapus dari antrean.
+    """
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS buku ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            f" tenant TEXT NOT NULL DEFAULT '{TENANT_UTAMA}',"
+            " tanggal TEXT NOT NULL,"          # yyyy-mm-dd agar bisa BETWEEN
+            " mode TEXT NOT NULL,"
+            " nama TEXT, kategori TEXT, nama_barang TEXT, varian TEXT,"
+            " qty INTEGER NOT NULL, total INTEGER NOT NULL,"
+            " dicatat REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS buku_tanggal ON buku(tenant, tanggal, mode)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS buku_barang ON buku(nama_barang, tanggal)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS harian ("
+            " tenant TEXT NOT NULL, tanggal TEXT NOT NULL, mode TEXT NOT NULL,"
+            " kategori TEXT NOT NULL, nama_barang TEXT NOT NULL,"
+            " n INTEGER NOT NULL, qty INTEGER NOT NULL, total INTEGER NOT NULL,"
+            " PRIMARY KEY (tenant, tanggal, mode, kategori, nama_barang)) WITHOUT ROWID"
+        )
+
+    @staticmethod
+    def _baris(tenant: str, p: dict) -> tuple:
+        tgl = datetime.strptime(p["tanggal"], "%d-%m-%Y").strftime("%Y-%m-%d")
+        return (tenant or TENANT_UTAMA, tgl, p.get("mode", ""), p.get("nama", ""), p.get("kategori", ""),
+                p.get("nama_barang", ""), p.get("varian", ""), _angka(p.get("qty") or 0),
+                _angka(p.get("harga_total") or 0))
+
+    def catat(self, data: list):
+        """data = [(tenant, payload)]. Dipanggil di dalam transaksi pemanggil (lihat Outbox.selesai)."""
+        rows = []
+        for tenant, p in data:
+            try:
+                rows.append(self._baris(tenant, p))
+            except (KeyError, ValueError) as e:
+                print("⚠️ buku lewati payload:", e)
+        now = time.time()
+        self.db.executemany(
+            "INSERT INTO buku (tenant, tanggal, mode, nama, kategori, nama_barang, varian, qty, total, dicatat)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [r + (now,) for r in rows])
+        self.db.executemany(
+            "INSERT INTO harian (tenant, tanggal, mode, kategori, nama_barang, n, qty, total)"
+            " VALUES (?, ?, ?, ?, ?, 1, ?, ?)"
+            " ON CONFLICT (tenant, tanggal, mode, kategori, nama_barang)"
+            " DO UPDATE SET n = n + 1, qty = qty + excluded.qty, total = total + excluded.total",
+            [(tn, t, m, k, b, q, tot) for tn, t, m, _, k, b, _, q, tot in rows])
+
+    def rekap(self, dari: str, sampai: str, tenant: str = TENANT_UTAMA, top: int = 5) -> dict:
+        """Ringkasan rentang tanggal (yyyy-mm-dd, inklusif) dari tabel harian."""
+        rng = (tenant, dari, sampai)
+        return {
+            "mode": {m: (n, q, t) for m, n, q, t in self.db.execute(
+                "SELECT mode, SUM(n), SUM(qty), SUM(total) FROM harian"
+                " WHERE tenant = ? AND tanggal BETWEEN ? AND ? GROUP BY mode", rng)},
+            "top": self.db.execute(
+                "SELECT nama_barang, SUM(qty) AS q, SUM(total) FROM harian"
+                " WHERE tenant = ? AND tanggal BETWEEN ? AND ? AND mode = 'Penjualan'"
+                " GROUP BY nama_barang ORDER BY q DESC LIMIT ?", rng + (top,)).fetchall(),
+            "kategori": self.db.execute(
+                "SELECT kategori, SUM(total) AS t FROM harian"
+                " WHERE tenant = ? AND tanggal BETWEEN ? AND ? AND mode = 'Pembelian'"
+                " GROUP BY kategori ORDER BY t DESC", rng).fetchall(),
+        }
+
+
+# =============== OUTBOX (antrean simpan ke Apps Script) ===============
+class Outbox:
+    """Antrean tahan-restart di SQLite. Handler cukup `tambah_banyak()`, worker yang kirim."""
+
+    def __init__(self, path: str = DB_PATH, worker: str = WORKER_ID):
+        self.worker = worker
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " chat_id INTEGER,"
+            f" tenant TEXT NOT NULL DEFAULT '{TENANT_UTAMA}',"
+            " payload TEXT NOT NULL,"
+            " kunci TEXT,"                      # idempotency_key payload
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            " percobaan INTEGER NOT NULL DEFAULT 0,"
+            " kirim_setelah REAL NOT NULL DEFAULT 0,"
+            " diklaim_oleh TEXT,"               # WORKER_ID yang sedang mengirim
+            " diklaim REAL NOT NULL DEFAULT 0,"  # waktu klaim; kedaluwarsa setelah OUTBOX_KLAIM
+            " error TEXT,"
+            " dibuat REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS outbox_antre ON outbox(status, kirim_setelah)")
+        self.db.execute("CREATE UNIQUE INDEX IF NOT EXISTS outbox_kunci ON outbox(kunci)")
+        # kunci baris yang sudah terkirim (baris outbox-nya dihapus) diingat IDEM_TTL detik
+        self.db.execute("CREATE TABLE IF NOT EXISTS terkirim (kunci TEXT PRIMARY KEY, waktu REAL NOT NULL) WITHOUT ROWID")
+        self.db.execute("CREATE INDEX IF NOT EXISTS terkirim_waktu ON terkirim(waktu)")
+        self.buku = Buku(self.db)
+        self.ada_data = asyncio.Event()
+        self.lepas_klaim()   # klaim proses sebelumnya dengan WORKER_ID sama (restart) langsung diambil lagi
+
+    def tambah_banyak(self, payloads: list, chat_id: int = None, tenant: str = None) -> int:
+        # satu transaksi: semua data dari satu konfirmasi masuk bersamaan; return jumlah yang baru.
+        # kunci yang masih di antrean atau terkirim < IDEM_TTL detik lalu → diabaikan
+        now = time.time()
+        tenant = tenant or kode_tenant(chat_id)
+        self.db.execute("BEGIN")
+        try:
+            cur = self.db.executemany(
+                "INSERT OR IGNORE INTO outbox (chat_id, tenant, payload, kunci, dibuat) SELECT ?, ?, ?, ?, ?"
+                " WHERE NOT EXISTS (SELECT 1 FROM terkirim WHERE kunci = ?4 AND waktu > ?6)",
+                [(chat_id, tenant, json.dumps(p, ensure_ascii=False), p.get("idempotency_key"), now, now - IDEM_TTL)
+                 for p in payloads],
+            )
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        self.ada_data.set()
+        return cur.rowcount
+
+    def ambil(self, limit: int = OUTBOX_BATCH) -> list:
+        # baris diklaim worker ini supaya worker lain yang berbagi DB tidak ikut mengirim;
+        # jika worker mati tanpa melepas klaim, baris diambil lagi setelah OUTBOX_KLAIM detik
+        now = time.time()
+        rows = self.db.execute(
+            "UPDATE outbox SET diklaim_oleh = ?, diklaim = ? WHERE id IN ("
+            " SELECT id FROM outbox WHERE status = 'pending' AND kirim_setelah <= ?"
+            " AND (diklaim_oleh IS NULL OR diklaim <= ?) ORDER BY id LIMIT ?)"
+            " RETURNING id, chat_id, payload, percobaan, tenant",
+            (self.worker, now, now, now - OUTBOX_KLAIM, limit),
+        ).fetchall()
+        return [(i, c, json.loads(p), n, t) for i, c, p, n, t in sorted(rows)]
+
+    def perpanjang(self, rows: list) -> set:
+        """Perbarui klaim baris yang masih dipegang worker ini; return id-nya (yang sudah diambil alih dilewati)."""
+        ids = [r[0] for r in rows]
+        return {i for (i,) in self.db.execute(
+            f"UPDATE outbox SET diklaim = ? WHERE diklaim_oleh = ? AND id IN ({','.join('?' * len(ids))})"
+            " RETURNING id", [time.time(), self.worker, *ids])}
+
+    def lepas_klaim(self):
+        """Lepas semua klaim worker ini (start & shutdown) agar baris langsung bisa dikirim lagi."""
+        self.db.execute("UPDATE outbox SET diklaim_oleh = NULL WHERE diklaim_oleh = ?", (self.worker,))
+
+    def selesai(self, rows: list):
+        # terkirim → keluar dari antrean & masuk buku dalam satu transaksi; kuncinya diingat
+        now = time.time()
+        self.db.execute("BEGIN")
+        try:
+            self.db.executemany("DELETE FROM outbox WHERE id = ?", [(r[0],) for r in rows])
+            self.db.executemany("INSERT OR REPLACE INTO terkirim (kunci, waktu) VALUES (?, ?)",
+                                [(r[2]["idempotency_key"], now) for r in rows if r[2].get("idempotency_key")])
+            self.db.execute("DELETE FROM terkirim WHERE waktu <= ?", (now - IDEM_TTL,))
+            self.buku.catat([(r[4], r[2]) for r in rows])
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def tunda(self, rows: list, detik: float):
+        # belum dicoba (mis. sirkuit tenant terbuka): geser jadwal, percobaan tidak bertambah
+        t = time.time() + detik
+        self.db.executemany("UPDATE outbox SET kirim_setelah = ?, diklaim_oleh = NULL WHERE id = ?",
+                            [(t, r[0]) for r in rows])
+
+    def gagal(self, rows: list, error: str) -> list:
+        """Jadwalkan ulang dengan backoff; kembalikan baris yang sudah menyerah."""
+        menyerah = []
+        for row in rows:
+            i, n = row[0], row[3] + 1
+            if n >= OUTBOX_MAX_COBA:
+                self.db.execute("UPDATE outbox SET status = 'gagal', percobaan = ?, error = ?, diklaim_oleh = NULL"
+                                " WHERE id = ?", (n, error, i))
+                menyerah.append(row)
+            else:
+                jeda = min(600, 5 * 2 ** n) * random.uniform(0.8, 1.2)
+                self.db.execute("UPDATE outbox SET percobaan = ?, kirim_setelah = ?, error = ?, diklaim_oleh = NULL"
+                                " WHERE id = ?", (n, time.time() + jeda, error, i))
+        return menyerah
+
+    def jeda_berikut(self):
+        """Detik sampai baris pending berikutnya boleh dikirim (None jika kosong); klaim worker lain ikut dihitung."""
+        (t,) = self.db.execute(
+            "SELECT MIN(MAX(kirim_setelah, IIF(diklaim_oleh IS NULL, 0, diklaim + ?)))"
+            " FROM outbox WHERE status = 'pending'", (OUTBOX_KLAIM,)).fetchone()
+        return None if t is None else max(0.0, t - time.time())
+
+    def jumlah_pending(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+    def tutup(self):
+        self.db.close()
+
+
+@diukur("http.script")
+async def _post_script(http: HttpPool, payloads: list, url: str = SCRIPT_URL, tenant: str = TENANT_UTAMA):
+    # 1 baris → form biasa (format lama); >1 → field "batch" berisi JSON list
+    data = payloads[0] if len(payloads) == 1 else {"batch": json.dumps(payloads, ensure_ascii=False)}
+    r = await http.request("script", "POST", url, tenant, data=data)
+    r.raise_for_status()
+
+def _potong_per_tenant(rows: list, n: int) -> list:
+    """Potongan ≤ n baris berurutan dengan tenant sama (satu POST = satu Apps Script)."""
+    potongan = []
+    for r in rows:
+        if potongan and len(potongan[-1]) < n and potongan[-1][0][4] == r[4]:
+            potongan[-1].append(r)
+        else:
+            potongan.append([r])
+    return potongan
+
+async def outbox_worker(app):
+    ob, http = app.bot_data["outbox"], app.bot_data["http"]
+    jeda_error = 1
+    while True:
+        try:
+            await _putaran_outbox(app, ob, http)
+            jeda_error = 1
+        except Exception as e:
+            # mis. "database is locked": task tidak boleh mati diam-diam. Baris yang sempat
+            # diklaim putaran ini diambil lagi setelah klaimnya habis (OUTBOX_KLAIM).
+            print(f"⚠️ outbox worker error: {e!r}, coba lagi {jeda_error} dtk")
+            metrik.tambah("outbox_worker_error")
+            await asyncio.sleep(jeda_error)
+            jeda_error = min(60, jeda_error * 2)
+
+async def _putaran_outbox(app, ob: Outbox, http: HttpPool):
+    """Satu putaran: ambil batch lalu kirim per tenant, atau tunggu data / jadwal berikutnya."""
+    ob.ada_data.clear()
+    metrik.set_gauge("outbox_pending", ob.jumlah_pending())
+    rows = ob.ambil(max(OUTBOX_BATCH, SCRIPT_BATCH_MAX))
+    if not rows:
+        jeda = ob.jeda_berikut()
+        try:
+            await asyncio.wait_for(ob.ada_data.wait(), timeout=60 if jeda is None else jeda)
+        except asyncio.TimeoutError:
+            pass
+        return
+
+    semua = _potong_per_tenant(rows, max(1, SCRIPT_BATCH_MAX))
+    for i, potongan in enumerate(semua):
+        kode = potongan[0][4]
+        tenant = TENANTS.get(kode)
+        # Apps Script tenant ini sedang bermasalah: tunda barisnya tanpa menghabiskan
+        # jatah percobaan; tenant lain tetap dikirim
+        sisa = http.sisa_terbuka("script", kode)
+        if sisa:
+            ob.tunda(potongan, sisa)
+            continue
+        # POST sebelumnya bisa lama: perpanjang klaim sisa batch, lewati baris yang sudah diambil alih
+        dipegang = ob.perpanjang([r for p in semua[i:] for r in p])
+        potongan = [r for r in potongan if r[0] in dipegang]
+        if not potongan:
+            continue
+        try:
+            if tenant is None or not tenant.script_url:
+                raise ValueError(f"tenant {kode} tanpa script_url")
+            await _post_script(http, [r[2] for r in potongan], tenant.script_url, kode)
+            ob.selesai(potongan)
+            metrik.catat_ukuran("outbox_batch", len(potongan))
+        except SirkuitTerbuka as e:
+            ob.tunda(potongan, e.sisa)
+        except Exception as e:
+            print("⚠️ outbox kirim error:", e)
+            for _, chat_id, payload, n, _ in ob.gagal(potongan, str(e)):
+                if chat_id is None:
+                    continue
+                try:
+                    await app.bot.send_message(
+                        chat_id,
+                        f"❌ Gagal menyimpan {payload.get('mode', '')} "
+                        f"'{payload.get('nama_barang', '')}' setelah {n + 1} percobaan: {e}")
+                except Exception as e2:
+                    print("⚠️ outbox notif error:", e2)
+
+
+# =============== SHARED STORE (multi-worker) ===============
+# Backend cukup punya: get/set/hapus (nilai bytes, ttl opsional), bersihkan, sewa/lepas (lease), tutup.
+class StoreMemori:
+    """Shared store dalam satu proses (tes lokal)."""
+
+    def __init__(self):
+        self._kv = {}     # (ns, kunci) → (nilai, kedaluwarsa; 0 = abadi)
+        self._sewa = {}   # nama → (pemilik, sampai)
+
+    def get(self, ns: str, kunci: str):
+        item = self._kv.get((ns, kunci))
+        if item is None:
+            return None
+        if item[1] and item[1] < time.time():
+            del self._kv[(ns, kunci)]
+            return None
+        return item[0]
+
+    def set(self, ns: str, kunci: str, nilai: bytes, ttl: float = None):
+        self._kv[(ns, kunci)] = (nilai, time.time() + ttl if ttl else 0)
+
+    def hapus(self, ns: str, kunci: str):
+        self._kv.pop((ns, kunci), None)
+
+    def bersihkan(self) -> int:
+        now = time.time()
+        basi = [k for k, (_, exp) in self._kv.items() if exp and exp < now]
+        for k in basi:
+            del self._kv[k]
+        return len(basi)
+
+    def sewa(self, nama: str, pemilik: str, ttl: float) -> bool:
+        """Ambil / perpanjang lease; False jika masih dipegang pemilik lain."""
+        now = time.time()
+        cur = self._sewa.get(nama)
+        if cur and cur[0] != pemilik and cur[1] > now:
+            return False
+        self._sewa[nama] = (pemilik, now + ttl)
+        return True
+
+    def lepas(self, nama: str, pemilik: str):
+        if self._sewa.get(nama, (None,))[0] == pemilik:
+            del self._sewa[nama]
+
+    def tutup(self):
+        pass
+
+
+class StoreSQLite:
+    """Shared store di file SQLite (WAL): beberapa proses worker di satu host / volume."""
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS kv (ns TEXT NOT NULL, kunci TEXT NOT NULL, nilai BLOB NOT NULL,"
+            " kedaluwarsa REAL NOT NULL DEFAULT 0, PRIMARY KEY (ns, kunci)) WITHOUT ROWID")
+        self.db.execute("CREATE TABLE IF NOT EXISTS sewa (nama TEXT PRIMARY KEY, pemilik TEXT NOT NULL, sampai REAL NOT NULL)")
+
+    def get(self, ns: str, kunci: str):
+        row = self.db.execute("SELECT nilai, kedaluwarsa FROM kv WHERE ns = ? AND kunci = ?", (ns, kunci)).fetchone()
+        if row is None or (row[1] and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def set(self, ns: str, kunci: str, nilai: bytes, ttl: float = None):
+        self.db.execute("INSERT OR REPLACE INTO kv (ns, kunci, nilai, kedaluwarsa) VALUES (?, ?, ?, ?)",
+                        (ns, kunci, nilai, time.time() + ttl if ttl else 0))
+
+    def hapus(self, ns: str, kunci: str):
+        self.db.execute("DELETE FROM kv WHERE ns = ? AND kunci = ?", (ns, kunci))
+
+    def bersihkan(self) -> int:
+        return self.db.execute("DELETE FROM kv WHERE kedaluwarsa > 0 AND kedaluwarsa < ?", (time.time(),)).rowcount
+
+    def sewa(self, nama: str, pemilik: str, ttl: float) -> bool:
+        # satu statement → atomik antar proses
+        now = time.time()
+        cur = self.db.execute(
+            "INSERT INTO sewa (nama, pemilik, sampai) VALUES (?, ?, ?)"
+            " ON CONFLICT (nama) DO UPDATE SET pemilik = excluded.pemilik, sampai = excluded.sampai"
+            " WHERE sewa.pemilik = excluded.pemilik OR sewa.sampai < ?",
+            (nama, pemilik, now + ttl, now))
+        return cur.rowcount == 1
+
+    def lepas(self, nama: str, pemilik: str):
+        self.db.execute("DELETE FROM sewa WHERE nama = ? AND pemilik = ?", (nama, pemilik))
+
+    def tutup(self):
+        self.db.close()
+
+
+def buka_store(url: str):
+    """SHARED_STORE → backend. "memory://" | "sqlite:///path/shared.sqlite3"; kosong = satu worker."""
+    if not url:
+        return None
+    skema, _, lokasi = url.partition("://")
+    if skema == "memory":
+        return StoreMemori()
+    if skema == "sqlite":
+        return StoreSQLite(lokasi)
+    raise ValueError("SHARED_STORE tidak dikenal: " + url)
+
+
+# =============== SESI (data sementara per chat) ===============
+class Sesi:
+    # field yang disimpan (SQLite / shared store); `diakses` hanya dipakai di memori
+    DISIMPAN = ("mode", "step", "draft", "fast_payload", "fast_payloads", "nama_barang", "kembali")
+    __slots__ = DISIMPAN + ("diakses",)
+
+    def __init__(self, mode=None, step=None, draft=None, fast_payload=None, fast_payloads=None, nama_barang=None):
+        self.mode, self.step = mode, step
+        self.kembali = None    # step sebelum prompt /cari
+        self.draft = draft
+        self.fast_payload, self.fast_payloads = fast_payload, fast_payloads
+        self.nama_barang = nama_barang
+        self.diakses = time.time()
+
+    def ke_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.DISIMPAN if getattr(self, k) is not None}
+
+    @classmethod
+    def dari_dict(cls, d: dict) -> "Sesi":
+        sesi = cls()
+        for k, v in d.items():
+            if k in cls.DISIMPAN:
+                setattr(sesi, k, v)
+        return sesi
+
+
+class SesiStore:
+    """Sesi per chat: LRU terbatas + buang jika menganggur, opsional disimpan ke SQLite."""
+
+    def __init__(self, ttl: int = SESI_TTL, maks: int = SESI_MAKS):
+        self.ttl, self.maks = ttl, maks
+        self._data = OrderedDict()
+        self.db = None
+        self.store = None
+
+    def pakai_store(self, store):
+        """Multi-worker: sesi langsung dibaca/ditulis ke shared store (tanpa salinan lokal).
+        Umur sesi dihitung dari penulisan terakhir, karena baca tidak menulis ulang."""
+        self.store = store
+
+    def buka(self, path: str = DB_PATH):
+        """Aktifkan persistensi dan muat sesi yang belum kedaluwarsa."""
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS sesi (chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL, diakses REAL NOT NULL)")
+        batas = time.time() - self.ttl
+        self.db.execute("DELETE FROM sesi WHERE diakses < ?", (batas,))
+        for cid, data, diakses in self.db.execute(
+                "SELECT chat_id, data, diakses FROM sesi ORDER BY diakses DESC LIMIT ?", (self.maks,)).fetchall()[::-1]:
+            sesi = Sesi.dari_dict(json.loads(data))
+            sesi.diakses = diakses
+            self._data[cid] = sesi
+        return len(self._data)
+
+    def get(self, cid: int):
+        if self.store:
+            raw = self.store.get("sesi", str(cid))
+            return Sesi.dari_dict(json.loads(raw)) if raw else None
+        sesi = self._data.get(cid)
+        if sesi is None:
+            return None
+        if time.time() - sesi.diakses > self.ttl:
+            self.pop(cid)
+            return None
+        sesi.diakses = time.time()
+        self._data.move_to_end(cid)
+        return sesi
+
+    def set(self, cid: int, sesi: Sesi):
+        sesi.diakses = time.time()
+        if self.store:
+            self.store.set("sesi", str(cid), json.dumps(sesi.ke_dict(), ensure_ascii=False).encode(), ttl=self.ttl)
+            return
+        self._data[cid] = sesi
+        self._data.move_to_end(cid)
+        if self.db:
+            self.db.execute("INSERT OR REPLACE INTO sesi (chat_id, data, diakses) VALUES (?, ?, ?)",
+                            (cid, json.dumps(sesi.ke_dict(), ensure_ascii=False), sesi.diakses))
+        while len(self._data) > self.maks:
+            self.pop(next(iter(self._data)))
+
+    def pop(self, cid: int):
+        if self.store:
+            sesi = self.get(cid)
+            self.store.hapus("sesi", str(cid))
+            return sesi
+        sesi = self._data.pop(cid, None)
+        if self.db:
+            self.db.execute("DELETE FROM sesi WHERE chat_id = ?", (cid,))
+        return sesi
+
+    def bersihkan(self) -> int:
+        if self.store:
+            return self.store.bersihkan()
+        batas = time.time() - self.ttl
+        basi = [cid for cid, sesi in self._data.items() if sesi.diakses < batas]
+        for cid in basi:
+            self.pop(cid)
+        return len(basi)
+
+    def tutup(self):
+        if self.db:
+            self.db.close()
+            self.db = None
+
+    def __len__(self):
+        return len(self._data)
+
+
+sesi_store = SesiStore()
+
+async def bersihkan_sesi(context: ContextTypes.DEFAULT_TYPE):
+    n = sesi_store.bersihkan()
+    if n:
+        print(f"🧹 Sesi kedaluwarsa dibuang: {n}")
+
+
+# =============== UPDATE PROCESSOR (paralel antar chat) ===============
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Update dari chat berbeda jalan bersamaan; update dari chat yang sama tetap berurutan
+    sehingga state ConversationHandler & sesi konsisten. Inline query (tanpa chat) tidak diantre.
+
+    Slot global diambil *setelah* kunci chat, supaya chat yang sedang antre tidak
+    menghabiskan slot milik chat lain.
+    """
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES):
+        # semaphore bawaan dibuat longgar; batas sebenarnya di self._slot
+        super().__init__(max(1024, max_concurrent_updates))
+        self._slot = asyncio.Semaphore(max_concurrent_updates)
+        self._kunci = {}   # chat_id → [Lock, jumlah update yang memakai]
+
+    async def do_process_update(self, update, coroutine):
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            async with self._slot:
+                await coroutine
+            return
+
+        entry = self._kunci.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self._slot:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._kunci[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
 # =============== START & MENU ===============
 async def set_commands(app):
     cmds = [
@@ -127,12 +1693,15 @@ async def set_commands(app):
         BotCommand("cari", "Cari nama parfum (prompt)"),
         BotCommand("formpenjualan", "Input cepat penjualan (blok teks)"),
         BotCommand("formpembelian", "Input cepat pembelian (blok teks)"),
+        BotCommand("impor", "Impor data lama dari file CSV/XLSX"),
         BotCommand("reload", "Muat ulang daftar parfum"),
+        BotCommand("rekap", "Rekap penjualan & pembelian"),
         BotCommand("batal", "Batalkan proses"),
         BotCommand("bantuan", "Bantuan & panduan"),
     ]
     await app.bot.set_my_commands(cmds)
 
+@diukur("handler.start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     if not is_authorized(chat_id):
@@ -165,13 +1734,14 @@ async def kirim_template_pembelian(send_target, cid):
         "qty:\n"
         "harga_total:\n"
         "link:\n\n"
+        "📋 Banyak data sekaligus: pisahkan tiap blok dengan baris kosong atau `---`.\n"
         "📝 *Note*: *kategori* tulis salah satu: *Bibit / Botol / Campuran*.\n"
         "- Jika *Bibit*: `nama_barang` = *nama parfum* (pakai inline `@Bot keyword`).\n"
         "- Jika *Botol*: `nama_barang` = *ukuran* (15ml, 25ml, ...).\n"
         "- Jika *Campuran*: `varian` = *jenis* (Absolute, Alkohol, ...)."
     )
     await send_target.reply_text(template, parse_mode="Markdown")
-    user_data[cid] = {"mode": "Pembelian", "step": "fast_wait_block"}
+    sesi_store.set(cid, Sesi(mode="Pembelian", step="fast_wait_block"))
     return FAST_PEMBELIAN
 
 async def kirim_template_penjualan(send_target, cid):
@@ -185,14 +1755,17 @@ async def kirim_template_penjualan(send_target, cid):
         "varian:\n"
         "qty:\n"
         "harga_satuan:\n\n"
-        "📝 *Note*: *tanggal* otomatis, *harga_total* = qty × harga_satuan."
+        "📋 Banyak data sekaligus: pisahkan tiap blok dengan baris kosong atau `---`.\n"
+        "📝 *Note*: *tanggal* otomatis, *harga_total* = qty × harga_satuan.\n"
+        "*harga_satuan* boleh dikosongkan jika harga parfum & varian sudah ada di sheet."
     )
     await send_target.reply_text(template, parse_mode="Markdown")
-    user_data[cid] = {"mode": "Penjualan", "step": "fast_wait_block"}
+    sesi_store.set(cid, Sesi(mode="Penjualan", step="fast_wait_block"))
     return FAST_PENJUALAN
 
 
 # =============== COMMANDS (menu) ===============
+@diukur("handler.penjualan_cmd")
 async def penjualan_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cid = update.effective_chat.id
     if not is_authorized(cid):
@@ -200,6 +1773,7 @@ async def penjualan_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
     return await kirim_template_penjualan(update.message, cid)
 
+@diukur("handler.pembelian_cmd")
 async def pembelian_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cid = update.effective_chat.id
     if not is_authorized(cid):
@@ -213,6 +1787,7 @@ async def form_penjualan_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def form_pembelian_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return await pembelian_cmd(update, context)
 
+@diukur("handler.bantuan")
 async def bantuan(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "📘 Bantuan:\n"
@@ -222,27 +1797,113 @@ async def bantuan(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/cari – Cari parfum (prompt)\n"
         "/formpenjualan – Sama dengan /penjualan\n"
         "/formpembelian – Sama dengan /pembelian\n"
+        "/impor penjualan|pembelian – Impor file CSV/XLSX\n"
         "/reload – Muat ulang data parfum\n"
+        "/rekap [hari|minggu|bulan|dd-mm-yyyy] – Rekap transaksi\n"
+        "/profil cpu|mem [detik] – Profil performa bot (diagnosa)\n"
         "/batal – Batalkan proses"
     )
 
+@diukur("handler.cancel")
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cid = update.effective_chat.id
-    user_data.pop(cid, None)
+    sesi_store.pop(cid)
     await update.message.reply_text("❌ Proses dibatalkan.", reply_markup=ReplyKeyboardRemove())
     return ConversationHandler.END
 
+@diukur("handler.reload_cmd")
 async def reload_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not is_authorized(update.effective_user.id):
+    tenant = tenant_dari(update.effective_chat.id) or tenant_dari(update.effective_user.id)
+    if tenant is None:
+        return
+    sisa = context.bot_data["http"].sisa_terbuka("sheet", tenant.kode)
+    if sisa:
+        # jangan antre di belakang timeout: jawab langsung dari katalog yang ada
+        kat = _pool(context.bot_data).get(tenant.kode) or KATALOG_KOSONG
+        await update.message.reply_text(
+            f"⏸ Sheet sedang bermasalah, tetap pakai {len(kat.daftar)} parfum. "
+            f"Coba /reload lagi ±{ceil(sisa)} detik.")
         return
-    daftar = ambil_data_parfum()
-    if not daftar:
-        daftar = ["Pink Chiffon","Avril Lavigne","1000 Bunga","Guess Pink"]
-    context.bot_data["parfum_list"] = daftar
-    await update.message.reply_text(f"🔄 Reload: {len(daftar)} parfum.")
+    context.job_queue.run_once(refresh_katalog, 0, chat_id=update.effective_chat.id, data=tenant.kode)
+    await update.message.reply_text("🔄 Memuat ulang daftar parfum di latar belakang...")
+
+def _rentang_rekap(arg: str):
+    """hari | minggu (7 hari terakhir) | bulan (bulan berjalan) | dd-mm-yyyy → (dari, sampai, label)."""
+    hari_ini = datetime.now().date()
+    if arg in ("", "hari"):
+        dari, label = hari_ini, "hari ini"
+    elif arg == "minggu":
+        dari, label = hari_ini - timedelta(days=6), "7 hari terakhir"
+    elif arg == "bulan":
+        dari, label = hari_ini.replace(day=1), "bulan ini"
+    else:
+        tgl = datetime.strptime(_tanggal(arg), "%d-%m-%Y").date()
+        return tgl.isoformat(), tgl.isoformat(), tgl.strftime("%d-%m-%Y")
+    return dari.isoformat(), hari_ini.isoformat(), label
+
+@diukur("handler.rekap_cmd")
+async def rekap_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("❌ Anda tidak diizinkan.")
+        return
+    try:
+        dari, sampai, label = _rentang_rekap((context.args or [""])[0].lower())
+    except ValueError:
+        await update.message.reply_text("Format: /rekap [hari|minggu|bulan|dd-mm-yyyy]")
+        return
+    ob = context.bot_data["outbox"]
+    r = ob.buku.rekap(dari, sampai, kode_tenant(update.effective_chat.id))
+
+    jual = r["mode"].get("Penjualan", (0, 0, 0))
+    beli = r["mode"].get("Pembelian", (0, 0, 0))
+    baris = [
+        f"📊 Rekap {label}",
+        f"🛍 Penjualan: {jual[0]} transaksi, {jual[1]} pcs, {_format_rp(jual[2])}",
+        f"📦 Pembelian: {beli[0]} transaksi, {_format_rp(beli[2])}",
+    ]
+    if r["top"]:
+        baris.append("\n🏆 Parfum terlaris:")
+        baris += [f"{i}. {nama} ×{q} – {_format_rp(t)}" for i, (nama, q, t) in enumerate(r["top"], 1)]
+    if r["kategori"]:
+        baris.append("\n💸 Belanja per kategori:")
+        baris += [f"{k}: {_format_rp(t)}" for k, t in r["kategori"]]
+    pending = ob.jumlah_pending()
+    if pending:
+        baris.append(f"\n⏳ {pending} data masih antre dikirim (belum terhitung).")
+    await update.message.reply_text("\n".join(baris))
+
+
+@diukur("handler.profil_cmd")
+async def profil_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_authorized(update.effective_chat.id):
+        await update.message.reply_text("❌ Anda tidak diizinkan.")
+        return
+    args = context.args or []
+    jenis = args[0].lower() if args else "cpu"
+    try:
+        detik = float(args[1]) if len(args) > 1 else 10
+    except ValueError:
+        detik = -1
+    if jenis not in ("cpu", "mem") or detik <= 0:
+        await update.message.reply_text(f"Format: /profil cpu|mem [detik, maks {PROFIL_MAKS_DETIK}]")
+        return
+    detik = min(detik, PROFIL_MAKS_DETIK)
+    await update.message.reply_text(f"⏱ Profil {jenis} {detik:g} detik dimulai...")
+
+    async def jalan():
+        try:
+            laporan = await profil(jenis, detik)
+        except RuntimeError as e:
+            await update.message.reply_text(f"⚠️ {e}.")
+            return
+        nama = f"profil-{jenis}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
+        await update.message.reply_document(laporan.encode("utf-8"), filename=nama)
+    # di latar belakang: chat ini tetap bisa dipakai (dan ikut terukur) selama profil
+    context.application.create_task(jalan(), update=update)
 
 
 # =============== CALLBACK (tombol) ===============
+@diukur("handler.handle_callback")
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
@@ -260,156 +1921,240 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if data.startswith("page|"):
         page = int(data.split("|", 1)[1])
-        parfums = context.bot_data.get("parfum_list", [])
-        await q.edit_message_text("🧴 Pilih nama parfum:", reply_markup=parfum_page_markup(parfums, page))
+        await q.edit_message_text("🧴 Pilih nama parfum:", reply_markup=_katalog(context, cid).halaman(page))
         return PARFUM_LIST
 
     # ========= PATCH PENTING: pilih parfum tanpa fake update =========
     if data.startswith("parfum|"):
         nama = data.split("|", 1)[1]
-        ud = user_data.get(cid, {})
+        if nama.isdigit():   # ID ringkas; tombol lama masih membawa nama utuh
+            nama = _katalog(context, cid).nama_dari_id(int(nama))
+            if nama is None:
+                await q.edit_message_text("⚠️ Pilihan parfum sudah tidak berlaku. Cari ulang via /cari.")
+                return ConversationHandler.END
+        ud = sesi_store.get(cid)
 
         # CASE 1: sedang menyelesaikan draft Pembelian (kategori Bibit)
-        if ud.get("mode") == "Pembelian" and "draft" in ud:
-            d = ud["draft"]
+        if ud and ud.mode == "Pembelian" and ud.draft is not None:
+            d = ud.draft
             d["nama_barang"] = nama  # set parfum terpilih
 
-            kategori = (d.get("kategori") or "").strip().capitalize()
-            try:
-                qty = int(''.join(ch for ch in str(d.get("qty", "")) if ch.isdigit()))
-                total = int(''.join(ch for ch in str(d.get("harga_total", "")) if ch.isdigit()))
-            except:
-                await q.edit_message_text("❗ qty & harga_total harus angka. Kirim ulang blok.")
+            payload, err, _ = payload_pembelian(d, _katalog(context, cid).index)
+            if err:
+                await q.edit_message_text(err + "\nKirim ulang blok.")
                 return FAST_PEMBELIAN
+            sesi_store.set(cid, Sesi(mode="Pembelian", step="fast_wait_block", fast_payload=payload))
 
-            satuan = total // qty if qty else 0
-            payload = {
-                "mode": "Pembelian",
-                "tanggal": datetime.now().strftime("%d-%m-%Y"),
-                "nama": d.get("nama",""),
-                "no_hp": d.get("no_hp",""),
-                "alamat": d.get("alamat",""),
-                "kategori": kategori,
-                "nama_barang": d.get("nama_barang",""),
-                "varian": d.get("varian",""),
-                "qty": str(qty),
-                "harga_total": _format_rp(total),
-                "harga_satuan": _format_rp(satuan),
-                "link": d.get("link",""),
-            }
-            user_data[cid] = {"fast_payload": payload}
-
-            confirm_text = (
-                "Berikut data yang akan disimpan;\n\n"
-                "*mode: Pembelian*\n"
-                f"tanggal: {payload['tanggal']}\n"
-                f"nama: {payload['nama']}\n"
-                f"no_hp: {payload['no_hp']}\n"
-                f"alamat: {payload['alamat']}\n"
-                f"kategori: {payload['kategori']}\n"
-                f"nama_barang: {payload['nama_barang']}\n"
-                f"varian: {payload['varian']}\n"
-                f"qty: {payload['qty']}\n"
-                f"harga_total: {payload['harga_total']}\n"
-                f"harga_satuan: {payload['harga_satuan']}\n"
-                f"link: {payload['link']}\n"
-            )
-            kb = InlineKeyboardMarkup([
-                [InlineKeyboardButton("✅ Lanjut simpan", callback_data="fast_save_pembelian"),
-                 InlineKeyboardButton("❌ Cancel", callback_data="fast_cancel")]
-            ])
             await q.edit_message_text(f"🧴 Parfum dipilih: {nama}")
-            await q.message.reply_text(confirm_text, parse_mode="Markdown", reply_markup=kb)
+            await q.message.reply_text(_teks_konfirmasi(payload), parse_mode="Markdown",
+                                       reply_markup=_kb_konfirmasi("Pembelian"))
             return FAST_PEMBELIAN
 
         # CASE 2: jalur biasa (mis. penjualan atau bukan draft)
-        user_data[cid]["nama_barang"] = nama
+        ud = ud or Sesi()
+        ud.nama_barang = nama
+        sesi_store.set(cid, ud)
         await q.edit_message_text(f"🧴 Parfum dipilih: {nama}")
         return ConversationHandler.END
     # =================================================================
 
     if data == "search|parfum":
+        _tandai_cari(cid)
         await q.edit_message_text("🔍 Ketik keyword parfum (contoh: *pink* / *avril*):", parse_mode="Markdown")
         return PARFUM_SEARCH
 
     # Konfirmasi fast mode / flow umum
     if data in ("fast_save_penjualan", "fast_save_pembelian", "save_data"):
-        payload = user_data.get(cid, {}).get("fast_payload") or user_data.get(cid, {}).get("payload_confirm")
-        if not payload:
+        idem = context.bot_data.setdefault("idem_cache", CacheTTL(IDEM_MAKS, IDEM_TTL))
+        kunci_pesan = ("pesan", cid, q.message.message_id)
+        if idem.get(kunci_pesan):
+            # tap ganda pada konfirmasi yang sama: sudah diproses, jangan timpa pesan sukses
+            return ConversationHandler.END
+        ud = sesi_store.get(cid)
+        payloads = (ud.fast_payloads or [p for p in (ud.fast_payload,) if p]) if ud else []
+        if not payloads:
             await q.edit_message_text("⚠️ Data tidak ditemukan.")
             return ConversationHandler.END
+        idem.set(kunci_pesan, True)
+        kunci = [p.get("idempotency_key") for p in payloads]
+        baru = [p for p, k in zip(payloads, kunci) if not (k and idem.get(k))]
         try:
-            requests.post(SCRIPT_URL, data=payload, timeout=10)
-            await q.edit_message_text("✅ Data berhasil disimpan.")
+            n = context.bot_data["outbox"].tambah_banyak(baru, cid) if baru else 0
+            for k in kunci:
+                if k:
+                    idem.set(k, True)
+            if len(payloads) == 1:
+                teks = ("✅ Data diterima, sedang dikirim ke sheet." if n
+                        else "✅ Data ini sudah tersimpan sebelumnya.")
+            else:
+                teks = f"✅ {n} data diterima, sedang dikirim ke sheet."
+                if n < len(payloads):
+                    teks += f" ({len(payloads) - n} duplikat diabaikan)"
+            if n and context.bot_data["http"].sisa_terbuka("script", kode_tenant(cid)):
+                teks += "\n⏸ Sheet sedang bermasalah; data aman di antrean dan dikirim otomatis."
+            await q.edit_message_text(teks)
         except Exception as e:
+            idem.set(kunci_pesan, None)
             await q.edit_message_text(f"❌ Gagal menyimpan: {e}")
-        user_data.pop(cid, None)
+        sesi_store.pop(cid)
         return ConversationHandler.END
 
     if data in ("fast_cancel", "cancel_data"):
-        user_data.pop(cid, None)
+        sesi_store.pop(cid)
         await q.edit_message_text("❌ Dibatalkan.")
         return ConversationHandler.END
 
 
 # =============== PENCARIAN (PROMPT) ===============
+def _tandai_cari(cid: int):
+    # dicatat di sesi agar jawaban keyword tetap dikenali worker lain / setelah restart
+    ud = sesi_store.get(cid) or Sesi()
+    if ud.step != "cari":
+        ud.step, ud.kembali = "cari", ud.step
+        sesi_store.set(cid, ud)
+
+@diukur("handler.cari_cmd")
 async def cari_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cid = update.effective_chat.id
     if not is_authorized(cid):
         await update.message.reply_text("❌ Anda tidak diizinkan.")
         return ConversationHandler.END
 
-    if not context.bot_data.get("parfum_list"):
+    if not _katalog(context, cid).daftar:
         await update.message.reply_text("⚠️ Data parfum belum termuat. Coba /reload lalu ulangi /cari.")
         return ConversationHandler.END
 
+    _tandai_cari(cid)
     await update.message.reply_text("🔍 Ketik keyword parfum (mis: *pink* / *avril*):", parse_mode="Markdown")
     return PARFUM_SEARCH
 
+@diukur("handler.parfum_search_input")
 async def parfum_search_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     kw = update.message.text
-    daftar = context.bot_data.get("parfum_list", [])
-    if not daftar:
+    kat = _katalog(context, update.effective_chat.id)
+    if not kat.daftar:
         await update.message.reply_text("⚠️ Data parfum belum termuat. Coba /reload.")
         return ConversationHandler.END
 
-    hasil = cari_parfum(kw, daftar)
+    hasil = cari_parfum(kw, kat.index, limit=12)
     if not hasil:
         await update.message.reply_text("❌ Tidak ditemukan. Coba keyword lain (cukup sebagian kata).")
         return PARFUM_SEARCH
 
-    rows = [[InlineKeyboardButton(n, callback_data=f"parfum|{n}")] for n in hasil[:12]]
+    ud = sesi_store.get(update.effective_chat.id)
+    if ud and ud.step == "cari":
+        ud.step, ud.kembali = ud.kembali, None
+        sesi_store.set(update.effective_chat.id, ud)
+    rows = [[kat.tombol(n)] for n in hasil[:12]]
     rows.append([InlineKeyboardButton("🔁 Cari lagi", callback_data="search|parfum")])
     await update.message.reply_text(f"🔍 Hasil: *{kw}*", parse_mode="Markdown",
                                     reply_markup=InlineKeyboardMarkup(rows))
     return PARFUM_LIST
 
 
-# =============== FAST MODE: PENJUALAN (blok teks) ===============
-async def fast_penjualan_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    cid = update.effective_chat.id
-    if user_data.get(cid, {}).get("step") != "fast_wait_block" or user_data[cid].get("mode") != "Penjualan":
-        await update.message.reply_text("❗ Gunakan /penjualan terlebih dahulu.")
-        return ConversationHandler.END
-
-    d = _parse_block_to_dict(update.message.text)
+# =============== VALIDASI & PAYLOAD ===============
+MAKS_BARIS_RINGKASAN = 40   # batas baris ringkasan multi-data
+MAKS_PESAN = 4096           # batas panjang satu pesan Telegram (unit UTF-16)
+
+def _panjang_tg(teks: str) -> int:
+    return len(teks.encode("utf-16-le")) // 2
+
+def _batasi(baris: list, ruang: int, label: str) -> list:
+    """Maks MAKS_BARIS_RINGKASAN baris & `ruang` karakter; sisanya jadi '... dan N <label> lain'."""
+    hasil, n = [], 0
+    for b in baris[:MAKS_BARIS_RINGKASAN]:
+        if n + _panjang_tg(b) + 1 > ruang:
+            break
+        hasil.append(b)
+        n += _panjang_tg(b) + 1
+    while len(hasil) < len(baris):
+        ekor = f"... dan {len(baris) - len(hasil)} {label} lain"
+        if not hasil or n + _panjang_tg(ekor) <= ruang:
+            hasil.append(ekor)
+            break
+        n -= _panjang_tg(hasil.pop()) + 1
+    return hasil
+
+def _angka(teks) -> int:
+    return int(''.join(ch for ch in str(teks) if ch.isdigit()))
+
+_FORMAT_TANGGAL = ("%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d", "%d-%m-%y", "%d/%m/%y")
+
+def _tanggal(teks) -> str:
+    """Tanggal transaksi → dd-mm-yyyy. Kosong = hari ini (data lama dari /impor boleh bawa tanggal)."""
+    teks = (teks or "").strip().split(" ")[0]
+    if not teks:
+        return datetime.now().strftime("%d-%m-%Y")
+    for fmt in _FORMAT_TANGGAL:
+        try:
+            return datetime.strptime(teks, fmt).strftime("%d-%m-%Y")
+        except ValueError:
+            pass
+    raise ValueError(teks)
+
+def _pecah_blok(text: str) -> list:
+    """Pisah pesan jadi beberapa blok `key: value`.
+
+    `---` selalu memisah. Baris kosong memisah hanya jika potongan berikutnya
+    tampak seperti data baru (ada `nama:` atau field yang sama terulang), supaya
+    satu blok yang kebetulan berisi baris kosong tidak ikut terpecah.
+    """
+    potongan, cur, keras = [], [], False
+    for line in (text or "").splitlines() + [""]:
+        t = line.strip()
+        if t and not re.fullmatch(r"-{3,}", t):
+            cur.append(line)
+            continue
+        if cur:
+            potongan.append(("\n".join(cur), keras))
+            cur, keras = [], False
+        if t:
+            keras = True
+
+    blok, kunci = [], set()
+    for teks, keras in potongan:
+        k = set(_parse_block_to_dict(teks))
+        if not k:
+            continue
+        if blok and not keras and "nama" not in k and not (k & kunci):
+            blok[-1] += "\n" + teks
+            kunci |= k
+        else:
+            blok.append(teks)
+            kunci = k
+    return blok
+
+def payload_penjualan(d: dict, kat: Katalog = None):
+    """Validasi blok penjualan → (payload, error).
+
+    harga_satuan kosong diisi dari daftar harga katalog `kat` (per parfum & ukuran botol).
+    """
+    if not d.get("harga_satuan") and kat is not None and kat.harga and d.get("nama_barang"):
+        nama = kat.index.cari_persis(d["nama_barang"])
+        h = kat.harga_satuan(nama, d.get("varian") or "") if nama else 0
+        if h:
+            d["harga_satuan"] = str(h)
     required = ["nama", "nama_barang", "varian", "qty", "harga_satuan"]
     miss = [x for x in required if not d.get(x)]
     if miss:
-        await update.message.reply_text("⚠️ Field wajib belum lengkap: " + ", ".join(miss))
-        return FAST_PENJUALAN
-
+        err = "⚠️ Field wajib belum lengkap: " + ", ".join(miss)
+        if miss == ["harga_satuan"] and kat is not None and kat.harga:
+            err += " (harga parfum & varian ini belum ada di sheet)"
+        return None, err
     try:
-        qty = int(''.join(ch for ch in str(d["qty"]) if ch.isdigit()))
-        satuan = int(''.join(ch for ch in str(d["harga_satuan"]) if ch.isdigit()))
-    except:
-        await update.message.reply_text("❗ qty & harga_satuan harus angka.")
-        return FAST_PENJUALAN
+        qty = _angka(d["qty"])
+        satuan = _angka(d["harga_satuan"])
+    except ValueError:
+        return None, "❗ qty & harga_satuan harus angka."
+    try:
+        tanggal = _tanggal(d.get("tanggal"))
+    except ValueError:
+        return None, "❗ tanggal harus dd-mm-yyyy."
 
     total = qty * satuan
-    payload = {
+    return {
         "mode": "Penjualan",
-        "tanggal": datetime.now().strftime("%d-%m-%Y"),
+        "tanggal": tanggal,
         "nama": d.get("nama",""),
         "no_hp": d.get("no_hp",""),
         "alamat": d.get("alamat",""),
@@ -419,92 +2164,55 @@ async def fast_penjualan_receive(update: Update, context: ContextTypes.DEFAULT_T
         "qty": str(qty),
         "harga_satuan": _format_rp(satuan),
         "harga_total": _format_rp(total),
-        "link": ""
-    }
-    user_data[cid] = {"fast_payload": payload}
-
-    text = (
-        "Berikut data yang akan disimpan;\n\n"
-        "*mode: Penjualan*\n"
-        f"tanggal: {payload['tanggal']}\n"
-        f"nama: {payload['nama']}\n"
-        f"no_hp: {payload['no_hp']}\n"
-        f"alamat: {payload['alamat']}\n"
-        f"nama_parfum: {payload['nama_barang']}\n"
-        f"varian: {payload['varian']}\n"
-        f"qty: {payload['qty']}\n"
-        f"harga_satuan: {payload['harga_satuan']}\n"
-        f"harga_total: {payload['harga_total']}\n"
-    )
-    kb = InlineKeyboardMarkup([[InlineKeyboardButton("✅ Lanjut simpan", callback_data="fast_save_penjualan"),
-                                InlineKeyboardButton("❌ Cancel", callback_data="fast_cancel")]])
-    await update.message.reply_text(text, parse_mode="Markdown", reply_markup=kb)
-    return FAST_PENJUALAN
+        "link": "",
+        "idempotency_key": uuid.uuid4().hex,
+    }, None
 
+def payload_pembelian(d: dict, index: ParfumIndex):
+    """Validasi blok pembelian → (payload, error, saran).
 
-# =============== FAST MODE: PEMBELIAN (blok teks) ===============
-async def fast_pembelian_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    cid = update.effective_chat.id
-    if user_data.get(cid, {}).get("step") != "fast_wait_block" or user_data[cid].get("mode") != "Pembelian":
-        await update.message.reply_text("❗ Gunakan /pembelian terlebih dahulu.")
-        return ConversationHandler.END
-
-    d = _parse_block_to_dict(update.message.text)
+    saran berisi nama parfum mirip jika kategori Bibit tapi nama tidak persis.
+    """
     if "nama_barang" not in d and "nama_parfum" in d:
         d["nama_barang"] = d["nama_parfum"]
 
     req = ["nama", "kategori", "qty", "harga_total"]
     miss = [x for x in req if not d.get(x)]
     if miss:
-        await update.message.reply_text("⚠️ Field wajib belum lengkap: " + ", ".join(miss))
-        return FAST_PEMBELIAN
+        return None, "⚠️ Field wajib belum lengkap: " + ", ".join(miss), []
 
     kategori = (d.get("kategori") or "").strip().capitalize()
     if kategori not in KATEGORI_PEMBELIAN:
-        await update.message.reply_text("❗ Kategori harus *Bibit / Botol / Campuran*.", parse_mode="Markdown")
-        return FAST_PEMBELIAN
+        return None, "❗ Kategori harus Bibit / Botol / Campuran.", []
 
     # Validasi turunan kategori
-    if kategori == "Botol":
-        if (d.get("nama_barang") or "") not in VARIAN_BOTOL:
-            await update.message.reply_text(
-                "⚠️ Untuk *Botol*, `nama_barang` harus salah satu ukuran: " + ", ".join(VARIAN_BOTOL),
-                parse_mode="Markdown")
-            return FAST_PEMBELIAN
-    if kategori == "Campuran":
-        if (d.get("varian") or "") not in VARIAN_CAMPURAN:
-            await update.message.reply_text(
-                "⚠️ Untuk *Campuran*, `varian` harus salah satu: " + ", ".join(VARIAN_CAMPURAN),
-                parse_mode="Markdown")
-            return FAST_PEMBELIAN
-    if kategori == "Bibit":
-        daftar = context.bot_data.get("parfum_list", [])
-        if daftar and d.get("nama_barang"):
-            if not any(d["nama_barang"].lower() == x.lower() for x in daftar):
-                suggestions = [x for x in daftar if d["nama_barang"].lower() in x.lower()][:8]
-                if suggestions:
-                    rows = [[InlineKeyboardButton(x, callback_data=f"parfum|{x}")] for x in suggestions]
-                    await update.message.reply_text(
-                        "🔎 Nama parfum tidak persis ditemukan. Pilih salah satu:",
-                        reply_markup=InlineKeyboardMarkup(rows)
-                    )
-                    user_data[cid] = {"mode":"Pembelian","draft":d}
-                    return PARFUM_LIST
-                else:
-                    await update.message.reply_text("❌ Nama parfum tidak ditemukan di database. Coba keyword via /cari.")
-                    return FAST_PEMBELIAN
+    if kategori == "Botol" and (d.get("nama_barang") or "") not in VARIAN_BOTOL:
+        return None, "⚠️ Untuk Botol, nama_barang harus salah satu ukuran: " + ", ".join(VARIAN_BOTOL), []
+    if kategori == "Campuran" and (d.get("varian") or "") not in VARIAN_CAMPURAN:
+        return None, "⚠️ Untuk Campuran, varian harus salah satu: " + ", ".join(VARIAN_CAMPURAN), []
+    if kategori == "Bibit" and len(index) and d.get("nama_barang"):
+        persis = index.cari_persis(d["nama_barang"])
+        if not persis:
+            saran = index.cari(d["nama_barang"], limit=8)
+            if saran:
+                return None, "🔎 Nama parfum tidak persis ditemukan: " + d["nama_barang"], saran
+            return None, "❌ Nama parfum tidak ditemukan di database: " + d["nama_barang"], []
+        d["nama_barang"] = persis
 
     try:
-        qty = int(''.join(ch for ch in str(d["qty"]) if ch.isdigit()))
-        total = int(''.join(ch for ch in str(d["harga_total"]) if ch.isdigit()))
-    except:
-        await update.message.reply_text("❗ qty & harga_total harus angka.")
-        return FAST_PEMBELIAN
+        qty = _angka(d["qty"])
+        total = _angka(d["harga_total"])
+    except ValueError:
+        return None, "❗ qty & harga_total harus angka.", []
+    try:
+        tanggal = _tanggal(d.get("tanggal"))
+    except ValueError:
+        return None, "❗ tanggal harus dd-mm-yyyy.", []
 
     satuan = total // qty if qty else 0
-    payload = {
+    return {
         "mode": "Pembelian",
-        "tanggal": datetime.now().strftime("%d-%m-%Y"),
+        "tanggal": tanggal,
         "nama": d.get("nama",""),
         "no_hp": d.get("no_hp",""),
         "alamat": d.get("alamat",""),
@@ -515,10 +2223,25 @@ async def fast_pembelian_receive(update: Update, context: ContextTypes.DEFAULT_T
         "harga_total": _format_rp(total),
         "harga_satuan": _format_rp(satuan),
         "link": d.get("link",""),
-    }
-    user_data[cid] = {"fast_payload": payload}
-
-    text = (
+        "idempotency_key": uuid.uuid4().hex,
+    }, None, []
+
+def _teks_konfirmasi(payload: dict) -> str:
+    if payload["mode"] == "Penjualan":
+        return (
+            "Berikut data yang akan disimpan;\n\n"
+            "*mode: Penjualan*\n"
+            f"tanggal: {payload['tanggal']}\n"
+            f"nama: {payload['nama']}\n"
+            f"no_hp: {payload['no_hp']}\n"
+            f"alamat: {payload['alamat']}\n"
+            f"nama_parfum: {payload['nama_barang']}\n"
+            f"varian: {payload['varian']}\n"
+            f"qty: {payload['qty']}\n"
+            f"harga_satuan: {payload['harga_satuan']}\n"
+            f"harga_total: {payload['harga_total']}\n"
+        )
+    return (
         "Berikut data yang akan disimpan;\n\n"
         "*mode: Pembelian*\n"
         f"tanggal: {payload['tanggal']}\n"
@@ -533,50 +2256,548 @@ async def fast_pembelian_receive(update: Update, context: ContextTypes.DEFAULT_T
         f"harga_satuan: {payload['harga_satuan']}\n"
         f"link: {payload['link']}\n"
     )
-    kb = InlineKeyboardMarkup([[InlineKeyboardButton("✅ Lanjut simpan", callback_data="fast_save_pembelian"),
-                                InlineKeyboardButton("❌ Cancel", callback_data="fast_cancel")]])
-    await update.message.reply_text(text, parse_mode="Markdown", reply_markup=kb)
+
+def _kb_konfirmasi(mode: str, jumlah: int = 1) -> InlineKeyboardMarkup:
+    label = "✅ Lanjut simpan" if jumlah == 1 else f"✅ Simpan {jumlah} data"
+    return InlineKeyboardMarkup([[InlineKeyboardButton(label, callback_data=f"fast_save_{mode.lower()}"),
+                                  InlineKeyboardButton("❌ Cancel", callback_data="fast_cancel")]])
+
+async def _terima_banyak(update: Update, context: ContextTypes.DEFAULT_TYPE, mode: str, blok: list):
+    """Validasi banyak blok sekaligus → satu ringkasan konfirmasi dengan error per data."""
+    cid = update.effective_chat.id
+    state = FAST_PENJUALAN if mode == "Penjualan" else FAST_PEMBELIAN
+    kat = _katalog(context, cid)
+    payloads, errors = [], []
+    for no, b in enumerate(blok, 1):
+        d = _parse_block_to_dict(b)
+        if mode == "Penjualan":
+            payload, err = payload_penjualan(d, kat)
+        else:
+            payload, err, saran = payload_pembelian(d, kat.index)
+            if saran:
+                err += " (mungkin: " + ", ".join(saran[:3]) + ")"
+        if payload:
+            payloads.append((no, payload))
+        else:
+            errors.append(f"#{no}: {err}")
+
+    baris = [f"#{no}. {p['nama']} – {p['nama_barang']} {p['varian']} ×{p['qty']} = {p['harga_total']}"
+             for no, p in payloads]
+    kepala = f"{mode}: {len(payloads)} dari {len(blok)} data valid.\n\n"
+    judul_err = "\n\n⚠️ Tidak ikut disimpan (perbaiki & kirim ulang):\n" if errors else ""
+    ruang = MAKS_PESAN - _panjang_tg(kepala + judul_err)
+    # data valid boleh memakai ruang yang tidak terpakai daftar error (dan sebaliknya)
+    baris = _batasi(baris, ruang - min(_panjang_tg("\n".join(errors)), ruang // 2), "data")
+    errors = _batasi(errors, ruang - _panjang_tg("\n".join(baris)) - 1, "error")
+
+    text = kepala + "\n".join(baris)
+    if errors:
+        text += judul_err + "\n".join(errors)
+    if not payloads:
+        await update.message.reply_text(text)
+        return state
+
+    sesi_store.set(cid, Sesi(mode=mode, step="fast_wait_block", fast_payloads=[p for _, p in payloads]))
+    await update.message.reply_text(text, reply_markup=_kb_konfirmasi(mode, len(payloads)))
+    return state
+
+
+# =============== FAST MODE: PENJUALAN (blok teks) ===============
+async def _ikuti_sesi(update: Update, context: ContextTypes.DEFAULT_TYPE, ud, perintah: str):
+    """State percakapan di worker ini basi (sesi sudah diubah worker lain, mis. /pembelian
+    saat state di sini masih FAST_PENJUALAN): ikuti sesi tersimpan, bukan menolak blok."""
+    hasil = await lanjutkan_sesi(update, context) if ud else None
+    if hasil is not None:
+        return hasil
+    await update.message.reply_text(f"❗ Gunakan {perintah} terlebih dahulu.")
+    return ConversationHandler.END
+
+@diukur("handler.fast_penjualan_receive")
+async def fast_penjualan_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cid = update.effective_chat.id
+    ud = sesi_store.get(cid)
+    if not ud or ud.step != "fast_wait_block" or ud.mode != "Penjualan":
+        return await _ikuti_sesi(update, context, ud, "/penjualan")
+
+    blok = _pecah_blok(update.message.text)
+    if len(blok) > 1:
+        return await _terima_banyak(update, context, "Penjualan", blok)
+
+    payload, err = payload_penjualan(_parse_block_to_dict(update.message.text), _katalog(context, cid))
+    if err:
+        await update.message.reply_text(err)
+        return FAST_PENJUALAN
+    sesi_store.set(cid, Sesi(mode="Penjualan", step="fast_wait_block", fast_payload=payload))
+
+    await update.message.reply_text(_teks_konfirmasi(payload), parse_mode="Markdown",
+                                    reply_markup=_kb_konfirmasi("Penjualan"))
+    return FAST_PENJUALAN
+
+
+# =============== FAST MODE: PEMBELIAN (blok teks) ===============
+@diukur("handler.fast_pembelian_receive")
+async def fast_pembelian_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cid = update.effective_chat.id
+    ud = sesi_store.get(cid)
+    if not ud or ud.step != "fast_wait_block" or ud.mode != "Pembelian":
+        return await _ikuti_sesi(update, context, ud, "/pembelian")
+
+    blok = _pecah_blok(update.message.text)
+    if len(blok) > 1:
+        return await _terima_banyak(update, context, "Pembelian", blok)
+
+    d = _parse_block_to_dict(update.message.text)
+    payload, err, saran = payload_pembelian(d, _katalog(context, cid).index)
+    if saran:
+        kat = _katalog(context, cid)
+        rows = [[kat.tombol(x)] for x in saran]
+        await update.message.reply_text(
+            "🔎 Nama parfum tidak persis ditemukan. Pilih salah satu:",
+            reply_markup=InlineKeyboardMarkup(rows)
+        )
+        sesi_store.set(cid, Sesi(mode="Pembelian", draft=d))
+        return PARFUM_LIST
+    if err:
+        if err.startswith("❌ Nama parfum"):
+            err += "\nCoba keyword via /cari."
+        await update.message.reply_text(err)
+        return FAST_PEMBELIAN
+    sesi_store.set(cid, Sesi(mode="Pembelian", step="fast_wait_block", fast_payload=payload))
+
+    await update.message.reply_text(_teks_konfirmasi(payload), parse_mode="Markdown",
+                                    reply_markup=_kb_konfirmasi("Pembelian"))
     return FAST_PEMBELIAN
 
 
+@diukur("handler.lanjutkan_sesi")
+async def lanjutkan_sesi(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Pesan teks tanpa state percakapan (mis. bot baru restart / update sebelumnya ditangani worker lain): lanjutkan dari sesi tersimpan."""
+    ud = sesi_store.get(update.effective_chat.id)
+    if ud and ud.step == "cari":
+        return await parfum_search_input(update, context)
+    if not ud or ud.step != "fast_wait_block":
+        return
+    if ud.mode == "Penjualan":
+        return await fast_penjualan_receive(update, context)
+    if ud.mode == "Pembelian":
+        return await fast_pembelian_receive(update, context)
+
+
+# =============== IMPOR (CSV / XLSX) ===============
+def _sel_xlsx(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.strftime("%d-%m-%Y")
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))   # 3.0 → "3", bukan "30" setelah _angka
+    return str(v)
+
+def _baris_impor(path: str):
+    """Iterasi baris file (list str) tanpa memuat seluruh file: CSV (, ; tab) atau XLSX sheet pertama."""
+    if path.lower().endswith(".xlsx"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("Impor XLSX butuh paket openpyxl.")
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in wb.worksheets[0].iter_rows(values_only=True):
+                yield [_sel_xlsx(v) for v in row]
+        finally:
+            wb.close()
+        return
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        try:
+            dialek = csv.Sniffer().sniff(f.read(4096), delimiters=",;\t")
+        except csv.Error:
+            dialek = csv.excel
+        f.seek(0)
+        yield from csv.reader(f, dialek)
+
+def _baris_ke_dict(kolom: list, row: list) -> dict:
+    d = {k: v.strip() for k, v in zip(kolom, row) if k and v and v.strip()}
+    if "nama_parfum" in d and "nama_barang" not in d:
+        d["nama_barang"] = d["nama_parfum"]
+    return d
+
+@diukur("fungsi.impor_file")
+async def impor_file(path: str, mode: str, index, outbox, chat_id: int = None, log=None, kunci_dasar: str = None):
+    """Validasi baris file per potongan IMPOR_CHUNK; yang valid langsung masuk outbox.
+
+    Error per baris ditulis ke `log` (file biner) agar memori tidak tumbuh.
+    kunci_dasar (mis. file_unique_id) → idempotency_key per baris tetap sama jika file dikirim ulang.
+    Return (jumlah masuk, jumlah baris data, jumlah error, contoh error).
+    """
+    rows = _baris_impor(path)
+    header = next(rows, None)
+    kolom = [_kunci_field(h) for h in header or []]
+    if not any(kolom):
+        raise ValueError("Header tidak dikenali. Baris pertama harus nama kolom (nama, qty, ...).")
+
+    masuk = total = n_err = 0
+    contoh, no = [], 1
+    for potongan in iter(lambda: list(islice(rows, IMPOR_CHUNK)), []):
+        payloads = []
+        for row in potongan:
+            no += 1
+            if not any(c.strip() for c in row):
+                continue
+            total += 1
+            d = _baris_ke_dict(kolom, row)
+            if mode == "Penjualan":
+                payload, err = payload_penjualan(d)
+            else:
+                payload, err, saran = payload_pembelian(d, index)
+                if saran:
+                    err += " (mungkin: " + ", ".join(saran[:3]) + ")"
+            if payload:
+                if kunci_dasar:
+                    payload["idempotency_key"] = hashlib.sha1(f"{kunci_dasar}:{no}".encode()).hexdigest()
+                payloads.append(payload)
+                continue
+            n_err += 1
+            if len(contoh) < MAKS_BARIS_RINGKASAN // 2:
+                contoh.append(f"baris {no}: {err}")
+            if log:
+                log.write(f"baris {no}: {err}\n".encode("utf-8"))
+        if payloads:
+            masuk += outbox.tambah_banyak(payloads, chat_id)
+        await asyncio.sleep(0)   # beri giliran update lain di antara potongan
+    metrik.catat_ukuran("impor_baris", total)
+    return masuk, total, n_err, contoh
+
+@diukur("handler.impor_cmd")
+async def impor_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cid = update.effective_chat.id
+    if not is_authorized(cid):
+        await update.message.reply_text("❌ Anda tidak diizinkan.")
+        return ConversationHandler.END
+    mode = {"penjualan": "Penjualan", "pembelian": "Pembelian"}.get((context.args or [""])[0].lower())
+    if not mode:
+        await update.message.reply_text("Format: /impor penjualan atau /impor pembelian")
+        return ConversationHandler.END
+
+    sesi_store.set(cid, Sesi(mode=mode, step="impor_wait_doc"))
+    await update.message.reply_text(
+        f"📥 Kirim file *.csv* atau *.xlsx* berisi data {mode.lower()}.\n"
+        "Baris pertama = nama kolom, sama seperti format blok "
+        "(nama, no_hp, alamat, kategori, nama_parfum/nama_barang, varian, qty, harga_satuan/harga_total, link).\n"
+        "Kolom *tanggal* (dd-mm-yyyy) opsional; kosong = hari ini.",
+        parse_mode="Markdown"
+    )
+    return IMPOR_DOKUMEN
+
+@diukur("handler.impor_dokumen")
+async def impor_dokumen(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cid = update.effective_chat.id
+    ud = sesi_store.get(cid)
+    if not ud or ud.step != "impor_wait_doc":
+        return ConversationHandler.END
+    doc = update.message.document
+    ext = os.path.splitext(doc.file_name or "")[1].lower()
+    if ext not in (".csv", ".xlsx"):
+        await update.message.reply_text("❗ Kirim file .csv atau .xlsx.")
+        return IMPOR_DOKUMEN
+    if doc.file_size and doc.file_size > IMPOR_MAKS_BYTE:
+        await update.message.reply_text("❗ File terlalu besar (maks 20 MB). Pecah jadi beberapa file.")
+        return IMPOR_DOKUMEN
+    sesi_store.pop(cid)
+
+    status = await update.message.reply_text("⏳ Memproses file...")
+    fd, path = tempfile.mkstemp(suffix=ext)
+    os.close(fd)
+    with tempfile.TemporaryFile() as log:
+        try:
+            f = await doc.get_file()
+            await f.download_to_drive(path)
+            masuk, total, n_err, contoh = await impor_file(
+                path, ud.mode, _katalog(context, cid).index, context.bot_data["outbox"], cid, log,
+                kunci_dasar=f"{ud.mode}:{doc.file_unique_id}")
+        except (ValueError, csv.Error) as e:
+            await status.edit_text(f"❌ Impor gagal: {e}")
+            return ConversationHandler.END
+        except Exception as e:
+            # xlsx rusak (BadZipFile/InvalidFileException), gagal unduh (TelegramError), dll.
+            print(f"❌ Impor {doc.file_name} (chat {cid}) gagal: {e!r}")
+            await status.edit_text(f"❌ Impor gagal: {type(e).__name__}: {e}\nPeriksa file lalu kirim ulang via /impor.")
+            return ConversationHandler.END
+        finally:
+            os.remove(path)
+
+        text = f"📥 Impor {ud.mode}: {masuk} dari {total} baris masuk antrian, sedang dikirim ke sheet."
+        if masuk + n_err < total:
+            text += f" ({total - masuk - n_err} duplikat diabaikan)"
+        if n_err:
+            text += f"\n\n⚠️ {n_err} baris tidak ikut disimpan:\n" + "\n".join(contoh)
+            if n_err > len(contoh):
+                text += "\n... daftar lengkap di file terlampir."
+        await status.edit_text(text)
+        if n_err > len(contoh):
+            log.seek(0)
+            await update.message.reply_document(log, filename="impor_error.txt")
+    return ConversationHandler.END
+
+
 # =============== INLINE MODE (search) ===============
+def _hasil_inline(query: str, kat: Katalog) -> list:
+    return [
+        InlineQueryResultArticle(
+            id=f"p{i}", title=nama,
+            description="Pilih untuk kirim nama parfum",
+            input_message_content=InputTextMessageContent(nama)
+        )
+        for i, nama in enumerate(cari_parfum(query, kat.index, limit=50))
+    ]
+
+async def _hasil_bersama(bot_data: dict, cache: CacheTTL, key: tuple, query: str, kat: Katalog) -> list:
+    """Hasil inline untuk `key`. User lain yang mencari kata (ternormalisasi) sama di saat
+    bersamaan menunggu future yang sama, bukan menghitung ulang."""
+    results = cache.get(key)
+    if results is not None:
+        return results
+    proses = bot_data.setdefault("inline_proses", {})   # key → Future yang sedang dihitung
+    fut = proses.get(key)
+    if fut is None:
+        fut = proses[key] = asyncio.ensure_future(asyncio.to_thread(_hasil_inline, query, kat))
+
+        def selesai(f):
+            proses.pop(key, None)
+            if not f.cancelled() and f.exception() is None:
+                cache.set(key, f.result())
+        fut.add_done_callback(selesai)
+    else:
+        metrik.tambah("inline_digabung")
+    # shield: user yang query-nya dibatalkan tidak ikut membatalkan hitungan milik user lain
+    return await asyncio.shield(fut)
+
+async def _jawab_inline(q, context: ContextTypes.DEFAULT_TYPE, tunda: bool):
+    user_id = q.from_user.id
+    cache = context.bot_data.setdefault("inline_cache", CacheTTL(INLINE_CACHE_MAKS, INLINE_CACHE_TTL))
+    kat = _katalog(context, user_id)
+    key = (kode_tenant(user_id), kat.versi, _normalisasi(q.query))
+    results = cache.get(key)
+    if results is None:
+        if tunda:
+            # user masih mengetik: tunggu sebentar, query berikutnya membatalkan tugas ini
+            await asyncio.sleep(INLINE_JEDA_MS / 1000)
+        results = await _hasil_bersama(context.bot_data, cache, key, q.query, kat)
+    # is_personal tetap True: hasil hanya untuk user yang lolos cek izin
+    await q.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=True,
+                   button=InlineQueryResultsButton("Buka bot untuk input lengkap", start_parameter="start"))
+
+@diukur("handler.handle_inline_query")
 async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.inline_query
     user_id = q.from_user.id
-    if AUTHORIZED_IDS and user_id not in AUTHORIZED_IDS:
+    if not is_authorized(user_id):
         await q.answer([], cache_time=1, is_personal=True,
-                       switch_pm_text="Buka bot untuk akses", switch_pm_parameter="start")
+                       button=InlineQueryResultsButton("Buka bot untuk akses", start_parameter="start"))
         return
-    daftar = context.bot_data.get("parfum_list", [])
-    if not daftar:
-        daftar = ["Pink Chiffon","Avril Lavigne","1000 Bunga","Guess Pink"]
-    hasil = cari_parfum(q.query, daftar)[:50]
-
-    results = []
-    for i, nama in enumerate(hasil):
-        content = InputTextMessageContent(nama)
-        results.append(
-            InlineQueryResultArticle(
-                id=f"p{i}", title=nama,
-                description="Pilih untuk kirim nama parfum",
-                input_message_content=content
-            )
-        )
-    await q.answer(results, cache_time=0, is_personal=True,
-                   switch_pm_text="Buka bot untuk input lengkap", switch_pm_parameter="start")
+    # user_id → (tugas, waktu query); hanya user terdaftar, jadi ukurannya terbatas
+    aktif = context.bot_data.setdefault("inline_aktif", {})
+    sekarang = time.monotonic()
+    lama = aktif.get(user_id)
+    if lama and not lama[0].done():
+        lama[0].cancel()
+        metrik.tambah("inline_dibatalkan")
+    tunda = bool(lama) and sekarang - lama[1] < INLINE_JEDA_MS / 1000
+    tugas = asyncio.ensure_future(_jawab_inline(q, context, tunda))
+    aktif[user_id] = (tugas, sekarang)
+    try:
+        await tugas
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            raise   # aplikasi berhenti, bukan digantikan query baru
+        # digantikan query yang lebih baru dari user yang sama: tidak perlu dijawab
 
 
 # =============== MAIN ===============
+@diukur("job.refresh_katalog")
+async def refresh_katalog(context: ContextTypes.DEFAULT_TYPE):
+    """Job: ambil sheet, bangun katalog baru hanya jika isinya berubah.
+
+    job.data = kode tenant (muat pertama / /reload); tanpa data = semua tenant di TENANTS.
+    Tenant yang tidak dimuat di worker ini dilewati, kecuali oleh pemimpin multi-worker:
+    ia merawat semua tenant (diterbitkan ke shared store) walau hanya dipakai worker lain.
+    Follower cukup mengikuti tenant yang baru saja diterbitkan pemimpin;
+    /reload manual selalu mengambil sheet sendiri.
+    """
+    bot_data = context.application.bot_data
+    store = bot_data.get("store")
+    manual = bool(context.job and context.job.chat_id)
+    kode = context.job.data if context.job else None
+    pemimpin = bool(store and bot_data.get("pemimpin"))
+    dimuat = set(_pool(bot_data).dimuat())
+    for kode in ([kode] if kode else list(TENANTS)):
+        tenant = TENANTS.get(kode)
+        lokal = kode in dimuat or bool(context.job and context.job.data)
+        if tenant is None or not (lokal or pemimpin):
+            continue
+        if store and not manual and not pemimpin and _terbit_segar(store, kode):
+            await ikuti_tenant(bot_data, store, kode)
+            continue
+        pesan = await _refresh_tenant(bot_data, tenant, pasang=lokal)
+        print(pesan if len(TENANTS) == 1 else f"[{kode}] {pesan}")
+        if manual:
+            await context.bot.send_message(context.job.chat_id, pesan)
+
+async def _refresh_tenant(bot_data: dict, tenant: Tenant, pasang: bool = True) -> str:
+    """pasang=False: tenant tidak dipakai worker ini, hasilnya hanya diterbitkan ke shared store
+    (versi lama diambil dari store agar ETag & ID parfum tetap berlanjut)."""
+    locks = bot_data.setdefault("refresh_lock", {})
+    store = bot_data.get("store")
+    async with locks.setdefault(tenant.kode, asyncio.Lock()):
+        lama = _pool(bot_data).get(tenant.kode) if pasang else None
+        if lama is None and not pasang and store:
+            lama = await asyncio.to_thread(muat_snapshot_store, store, tenant.kode)
+        lama = lama or KATALOG_KOSONG
+        if not tenant.sheet_url:
+            return f"❌ Tenant {tenant.kode} belum punya sheet_url."
+        daftar, etag, h, harga = await ambil_data_parfum(bot_data["http"], etag=lama.etag, hash_lama=lama.hash,
+                                                         url=tenant.sheet_url, tenant=tenant.kode)
+        if daftar:
+            # build index di luar loop; ID parfum meneruskan versi sebelumnya
+            kat = await asyncio.to_thread(Katalog, daftar, h, etag, sebelumnya=lama, harga=harga)
+            if pasang:
+                pasang_katalog(bot_data, kat, tenant.kode)
+            try:
+                await asyncio.to_thread(simpan_snapshot, kat, tenant.snapshot)
+            except Exception as e:
+                print("⚠️ simpan_snapshot error:", e)
+            pesan = f"🔄 Reload: {len(daftar)} parfum (versi {kat.versi})."
+            lama = kat
+        elif daftar is None:
+            lama.etag = etag
+            pesan = f"✅ Daftar parfum tidak berubah ({len(lama.daftar)} parfum)."
+        elif bot_data["http"].sisa_terbuka("sheet", tenant.kode):
+            pesan = (f"⏸ Sheet sedang bermasalah, tetap pakai {len(lama.daftar)} parfum "
+                     f"(dicoba lagi ±{ceil(bot_data['http'].sisa_terbuka('sheet', tenant.kode))} detik).")
+        else:
+            pesan = f"❌ Gagal memuat sheet, tetap pakai {len(lama.daftar)} parfum."
+        if store and daftar != []:
+            await terbitkan_katalog(store, tenant.kode, lama)
+    return pesan
+
+def _terbit_segar(store, kode: str) -> bool:
+    t = store.get(f"katalog:{kode}", "waktu")
+    return bool(t) and time.time() - float(t) < KATALOG_REFRESH_DETIK * 1.5
+
+async def terbitkan_katalog(store, kode: str, kat: Katalog):
+    """Taruh snapshot katalog tenant di shared store untuk worker lain (hash ditulis terakhir).
+    "waktu" selalu diperbarui agar worker lain tahu tenant ini sedang dirawat."""
+    ns = f"katalog:{kode}"
+    if kat.hash and store.get(ns, "hash") != kat.hash.encode():
+        buf = await asyncio.to_thread(snapshot_bytes, kat)
+        store.set(ns, "snapshot", buf)
+        store.set(ns, "hash", kat.hash.encode())
+    store.set(ns, "waktu", str(time.time()).encode())
+
+async def ikuti_tenant(bot_data: dict, store, kode: str):
+    h = store.get(f"katalog:{kode}", "hash")
+    lama = _pool(bot_data).get(kode) or KATALOG_KOSONG
+    if not h or h.decode() == lama.hash:
+        return
+    kat = await asyncio.to_thread(muat_snapshot_store, store, kode)
+    if kat and kat.hash != lama.hash:
+        pasang_katalog(bot_data, kat, kode)
+        print(f"📥 Katalog {kode} dari shared store: {len(kat.daftar)} parfum (versi {kat.versi}).")
+
+@diukur("job.ikuti_katalog")
+async def ikuti_katalog(context: ContextTypes.DEFAULT_TYPE):
+    """Job semua worker: pasang katalog dari shared store jika hash-nya beda dengan milik sendiri."""
+    bot_data = context.application.bot_data
+    for kode in _pool(bot_data).dimuat():
+        await ikuti_tenant(bot_data, bot_data["store"], kode)
+
+async def bersihkan_katalog(context: ContextTypes.DEFAULT_TYPE):
+    pool = _pool(context.application.bot_data)
+    basi = pool.bersihkan()
+    if basi:
+        print(f"🧹 Katalog menganggur dibuang: {', '.join(basi)}")
+        _gauge_katalog(pool)
+
+async def jaga_sewa(context: ContextTypes.DEFAULT_TYPE):
+    """Job: ambil / perpanjang lease pemimpin. Jika pemimpin mati, worker lain mengambil alih
+    paling lambat SEWA_TTL detik kemudian."""
+    bot_data = context.application.bot_data
+    pemimpin = bot_data["store"].sewa("pemimpin", WORKER_ID, SEWA_TTL)
+    if pemimpin != bot_data.get("pemimpin"):
+        print(f"👑 {WORKER_ID} jadi pemimpin (refresh katalog)." if pemimpin else f"👥 {WORKER_ID} jadi follower.")
+    bot_data["pemimpin"] = pemimpin
+    metrik.set_gauge("pemimpin", int(pemimpin))
+
 async def preload_parfum(app):
-    daftar = ambil_data_parfum()
-    if not daftar:
-        daftar = ["Pink Chiffon","Avril Lavigne","1000 Bunga","Guess Pink"]
-        print("⚠️ Pakai fallback parfum sementara.")
-    app.bot_data["parfum_list"] = daftar
+    app.bot_data["http"] = HttpPool()
+    store = buka_store(SHARED_STORE)
+    if store:
+        app.bot_data["store"] = store
+        sesi_store.pakai_store(store)
+        await jaga_sewa(CallbackContext(app))
+        app.job_queue.run_repeating(jaga_sewa, interval=max(1, SEWA_TTL // 3), first=SEWA_TTL // 3, name="jaga_sewa")
+        app.job_queue.run_repeating(ikuti_katalog, interval=KATALOG_IKUTI_DETIK,
+                                    first=KATALOG_IKUTI_DETIK, name="ikuti_katalog")
+    elif SESI_PERSIST:
+        n = sesi_store.buka()
+        if n:
+            print(f"💾 Sesi dipulihkan: {n}")
+    app.job_queue.run_repeating(bersihkan_sesi, interval=300, first=300, name="bersihkan_sesi")
+    app.job_queue.run_repeating(bersihkan_katalog, interval=300, first=300, name="bersihkan_katalog")
+
+    # tenant utama (konfigurasi satu toko) langsung dimuat; tenant lain saat pertama dipakai.
+    # Layani dari snapshot terakhir dulu, ambil sheet segar di latar belakang.
+    utama = TENANTS.get(TENANT_UTAMA)
+    if utama:
+        t0 = time.perf_counter()
+        kat = muat_katalog_tenant(app, utama)
+        if kat:
+            print(f"⚡ Snapshot katalog: {len(kat.daftar)} parfum ({(time.perf_counter() - t0) * 1000:.1f} ms)")
+        else:
+            print("⚠️ Belum ada snapshot katalog, menunggu sheet.")
+    print(f"🏪 Tenant: {', '.join(TENANTS)} ({len(TENANT_CHAT)} chat terdaftar)")
+    app.job_queue.run_repeating(refresh_katalog, interval=KATALOG_REFRESH_DETIK,
+                                first=KATALOG_REFRESH_DETIK, name="refresh_katalog")
+
+    # outbox: baris pending dari sesi sebelumnya ikut dikirim ulang oleh worker
+    ob = Outbox()
+    app.bot_data["outbox"] = ob
+    if ob.jumlah_pending():
+        print(f"📤 Outbox: {ob.jumlah_pending()} data pending dikirim ulang.")
+    app.bot_data["outbox_task"] = asyncio.create_task(outbox_worker(app))
     await set_commands(app)
 
-def main():
-    app = ApplicationBuilder().token(TOKEN).post_init(preload_parfum).build()
+async def shutdown_bot(app):
+    task = app.bot_data.pop("outbox_task", None)
+    if task:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    ob = app.bot_data.pop("outbox", None)
+    if ob:
+        ob.lepas_klaim()   # POST yang terpotong dikirim ulang worker lain tanpa menunggu klaim habis
+        ob.tutup()
+    http = app.bot_data.pop("http", None)
+    if http:
+        await http.tutup()
+    sesi_store.tutup()
+    store = app.bot_data.pop("store", None)
+    if store:
+        store.lepas("pemimpin", WORKER_ID)   # follower bisa langsung ambil alih
+        store.tutup()
+
+def build_app(webhook: bool = False, request=None):
+    """Bangun Application + semua handler. webhook=True → tanpa Updater (update dimasukkan dari luar).
+    request = BaseRequest pengganti koneksi Bot API (mis. Bot API palsu di bench/loadtest.py)."""
+    builder = (ApplicationBuilder().token(TOKEN)
+               .concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES))
+               .post_init(preload_parfum).post_shutdown(shutdown_bot))
+    if request is not None:
+        builder = builder.request(request)
+    if webhook:
+        builder = builder.updater(None)
+    app = builder.build()
 
     # Commands yang aktif di semua state
     always_cmds = [
@@ -586,7 +2807,9 @@ def main():
         CommandHandler("formpenjualan", form_penjualan_cmd),
         CommandHandler("formpembelian", form_pembelian_cmd),
         CommandHandler("cari", cari_cmd),
+        CommandHandler("impor", impor_cmd),
         CommandHandler("reload", reload_cmd),
+        CommandHandler("rekap", rekap_cmd),
         CommandHandler("bantuan", bantuan),
         CommandHandler("batal", cancel),
     ]
@@ -616,14 +2839,27 @@ def main():
                 CallbackQueryHandler(handle_callback, pattern="^fast_"),
                 *always_cmds
             ],
+            IMPOR_DOKUMEN: [
+                MessageHandler(filters.Document.ALL, impor_dokumen),
+                CallbackQueryHandler(handle_callback),
+                *always_cmds
+            ],
         },
         fallbacks=[CommandHandler("batal", cancel)],
         allow_reentry=True
     )
 
     app.add_handler(conv)
+    # di luar state percakapan (mis. setelah restart), tombol & blok teks dilanjutkan dari sesi
+    app.add_handler(CallbackQueryHandler(handle_callback))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, lanjutkan_sesi))
+    app.add_handler(MessageHandler(filters.Document.ALL, impor_dokumen))
+    app.add_handler(CommandHandler("profil", profil_cmd))   # diagnosa, tidak dimasukkan ke menu
     app.add_handler(InlineQueryHandler(handle_inline_query))  # inline mode
-    app.run_polling()
+    return app
+
+def main():
+    build_app().run_polling()
 
 if __name__ == "__main__":
     main()
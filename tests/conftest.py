@@ -0,0 +1,113 @@
+# Konfigurasi bot dibaca saat import → env tes diisi sebelum `import bot`.
+import json, os, sys, tempfile, time
+from collections import Counter
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="wistrian-test-")
+os.environ.update({
+    "BOT_TOKEN": "123456:TEST",
+    "BOT_DB_PATH": os.path.join(_TMP, "test.sqlite3"),
+    "KATALOG_SNAPSHOT": os.path.join(_TMP, "katalog.snapshot"),
+    "SESI_PERSIST": "0",
+    "SIRKUIT_AMBANG": "3",
+    "SIRKUIT_JEDA": "0.2",
+    "SIRKUIT_JEDA_MAKS": "1",
+    "TENANTS": json.dumps({
+        "utama": {"chat_ids": [1, 2, 3], "script_url": "https://script.test/utama",
+                  "sheet_url": "https://sheet.test/utama"},
+        "lain": {"chat_ids": [10], "script_url": "https://script.test/lain",
+                 "sheet_url": "https://sheet.test/lain"},
+    }),
+})
+for k in ("SHARED_STORE", "TENANTS_FILE"):
+    os.environ.pop(k, None)
+
+from telegram import Update  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+
+import bot  # noqa: E402
+
+
+def _pesan(cid: int, mid: int, teks: str = None, dokumen: dict = None) -> dict:
+    m = {"message_id": mid, "date": int(time.time()), "chat": {"id": cid, "type": "private"},
+         "from": {"id": cid, "is_bot": False, "first_name": f"User{cid}"}}
+    if teks is not None:
+        m["text"] = teks
+        if teks.startswith("/"):
+            m["entities"] = [{"type": "bot_command", "offset": 0, "length": len(teks.split()[0])}]
+    if dokumen is not None:
+        m["document"] = dokumen
+    return m
+
+
+class BotApiPalsu(BaseRequest):
+    """Bot API lokal: catat teks yang dikirim / diedit bot, layani getFile + unduhan `isi_file`.
+    Method di `gagal` ({nama: deskripsi}) dijawab 400."""
+
+    def __init__(self, isi_file: bytes = b""):
+        self.isi_file = isi_file
+        self.teks, self.panggilan, self.gagal = [], Counter(), {}
+        self._mid = 1000
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _pesan_bot(self, p: dict) -> dict:
+        self._mid += 1
+        return {"message_id": int(p.get("message_id") or self._mid), "date": int(time.time()),
+                "text": p.get("text", ""), "chat": {"id": int(p.get("chat_id") or 0), "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Tes"}}
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        if "/file/bot" in url:
+            return 200, self.isi_file
+        nama = url.rsplit("/", 1)[-1]
+        self.panggilan[nama] += 1
+        if nama in self.gagal:
+            return 400, json.dumps({"ok": False, "error_code": 400, "description": self.gagal[nama]}).encode()
+        p = request_data.parameters if request_data else {}
+        if nama == "getMe":
+            hasil = {"id": 1, "is_bot": True, "first_name": "Tes", "username": "tes_bot"}
+        elif nama == "getFile":
+            hasil = {"file_id": p["file_id"], "file_unique_id": "u", "file_path": "documents/file"}
+        elif nama in ("sendMessage", "sendDocument", "editMessageText"):
+            if "text" in p:
+                self.teks.append(p["text"])
+            hasil = self._pesan_bot(p)
+        else:
+            hasil = True
+        return 200, json.dumps({"ok": True, "result": hasil}).encode()
+
+
+@pytest.fixture
+def worker():
+    """Factory: Application asli dari bot.build_app (webhook, belum initialize) + Bot API palsu → (app, req)."""
+    def buat(isi_file: bytes = b""):
+        req = BotApiPalsu(isi_file)
+        return bot.build_app(webhook=True, request=req), req
+    return buat
+
+
+@pytest.fixture
+def update_pesan():
+    """Factory: Update pesan teks / dokumen dari chat `cid` untuk app tsb."""
+    def buat(app, cid: int, teks: str = None, dokumen: dict = None, mid: int = 1):
+        return Update.de_json({"update_id": mid, "message": _pesan(cid, mid, teks, dokumen)}, app.bot)
+    return buat
+
+
+@pytest.fixture
+def kirim(update_pesan):
+    """Async: masukkan pesan lewat update processor & handler app (seperti update dari Telegram)."""
+    async def _kirim(app, mid: int, teks: str, cid: int = 1):
+        u = update_pesan(app, cid, teks, mid=mid)
+        await app.update_processor.process_update(u, app.process_update(u))
+    return _kirim
@@ -0,0 +1,47 @@
+import asyncio
+
+import bot
+
+BOTOL = "nama: Supplier {i}\nkategori: Botol\nnama_barang: {ukuran}\nqty: 2\nharga_total: 50.000"
+
+
+def test_pecah_blok_pemisah():
+    assert bot._pecah_blok("nama: A\nqty: 1\n---\nqty: 2") == ["nama: A\nqty: 1", "qty: 2"]
+    # baris kosong + `nama:` baru → data baru
+    assert bot._pecah_blok("nama: A\nqty: 1\n\nnama: B\nqty: 2") == ["nama: A\nqty: 1", "nama: B\nqty: 2"]
+    # baris kosong + field yang sama terulang → data baru
+    assert bot._pecah_blok("qty: 1\n\nqty: 2") == ["qty: 1", "qty: 2"]
+
+
+def test_pecah_blok_baris_kosong_di_dalam_satu_blok():
+    teks = "nama: A\nno_hp: 0812\n\nnama_barang: Oud\nqty: 1\n\n\n"
+    assert bot._pecah_blok(teks) == ["nama: A\nno_hp: 0812\nnama_barang: Oud\nqty: 1"]
+    assert bot._pecah_blok("halo\n\n---\n") == []
+
+
+def _ringkasan(worker, kirim, cid: int, blok: list) -> str:
+    async def jalan():
+        app, req = worker()
+        await app.initialize()
+        try:
+            await kirim(app, 1, "/pembelian", cid)
+            await kirim(app, 2, "\n\n".join(blok), cid)
+        finally:
+            await app.shutdown()
+        return req.teks[-1]
+    return asyncio.run(jalan())
+
+
+def test_ringkasan_banyak_error_muat_satu_pesan(worker, kirim):
+    teks = _ringkasan(worker, kirim, 2, [BOTOL.format(i=i, ukuran="37ml") for i in range(45)])
+    assert bot._panjang_tg(teks) <= bot.MAKS_PESAN
+    assert teks.startswith("Pembelian: 0 dari 45 data valid.")
+    assert teks.rstrip().endswith("error lain")
+
+
+def test_ringkasan_campuran_muat_satu_pesan(worker, kirim):
+    blok = [BOTOL.format(i=i, ukuran="35ml" if i % 2 else "37ml") for i in range(120)]
+    teks = _ringkasan(worker, kirim, 3, blok)
+    assert bot._panjang_tg(teks) <= bot.MAKS_PESAN
+    assert "data lain" in teks and "error lain" in teks
+    assert len(bot.sesi_store.get(3).fast_payloads) == 60   # yang disimpan tetap semua data valid
@@ -0,0 +1,44 @@
+import bot
+
+
+def test_kolom_harga_dari_header():
+    kolom = bot._kolom_harga(["Nama Parfum", "Roll On", "Harga 35ml", "harga_100 ML", "50ml", "Stok"])
+    assert kolom == {1: "Roll On", 2: "35ml", 3: "100ml"}   # 50ml bukan varian botol
+    assert bot._kolom_harga([]) == {}
+
+
+def test_harga_sel():
+    assert bot._harga_sel("45000") == 45000
+    assert bot._harga_sel("Rp45.000") == 45000
+    assert bot._harga_sel("Rp 45.000,00") == 45000
+    assert bot._harga_sel("45,000.00") == 45000
+    assert bot._harga_sel(" 120.000 ") == 120000
+    assert bot._harga_sel(35000) == 35000
+    for kosong in ("", None, "-", "habis", "12345678901"):   # >9 digit tidak muat array('I')
+        assert bot._harga_sel(kosong) == 0
+
+
+def test_harga_satuan_katalog():
+    v1 = bot.Katalog(["Oud", "Baccarat"], hash="h1", harga={"Oud": {"35ml": 50000, "Roll On": 25000}})
+    assert v1.harga_satuan("Oud", "35ml") == 50000
+    assert v1.harga_satuan("Oud", "35 ML") == 50000          # varian dinormalisasi
+    assert v1.harga_satuan("Oud", "roll on") == 25000
+    assert v1.harga_satuan("Baccarat", "35ml") == 0          # parfum tanpa harga
+    assert v1.harga_satuan("Oud", "100ml") == 0              # kolom tidak ada
+    assert v1.harga_satuan("Tidak Ada", "35ml") == 0
+
+    # versi baru: ID lama tetap, nama baru di belakang (di luar panjang array lama)
+    v2 = bot.Katalog(["Aventus", "Oud"], hash="h2", sebelumnya=v1,
+                     harga={"Aventus": {"35ml": 70000}, "Oud": {"35ml": 55000}})
+    assert (v2.harga_satuan("Oud", "35ml"), v2.harga_satuan("Aventus", "35ml")) == (55000, 70000)
+    assert v2.harga_satuan("Baccarat", "35ml") == 0
+    dari_snapshot = bot.katalog_dari_snapshot(bot._state_snapshot(bot.snapshot_bytes(v2)))
+    assert dari_snapshot.harga_satuan("Aventus", "35ml") == 70000
+
+
+def test_harga_satuan_kosong_diisi_dari_katalog():
+    kat = bot.Katalog(["Oud"], hash="h", harga={"Oud": {"35ml": 50000}})
+    p, err = bot.payload_penjualan({"nama": "Ani", "nama_barang": "oud", "varian": "35ml", "qty": "2"}, kat)
+    assert err is None and p["harga_total"] == bot._format_rp(100000)
+    p, err = bot.payload_penjualan({"nama": "Ani", "nama_barang": "Oud", "varian": "100ml", "qty": "2"}, kat)
+    assert p is None and "belum ada di sheet" in err
@@ -0,0 +1,156 @@
+import asyncio, os, tempfile, time
+from types import SimpleNamespace
+
+import httpx
+
+import bot
+
+
+def _pool(handler) -> bot.HttpPool:
+    return bot.HttpPool(transport=httpx.MockTransport(handler))
+
+
+def test_sirkuit_per_tenant():
+    async def jalan():
+        http = _pool(lambda req: httpx.Response(500 if req.url.path == "/lain" else 200))
+        for _ in range(bot.SIRKUIT_AMBANG):
+            await http.request("script", "POST", "https://script.test/lain", "lain")
+        assert http.sisa_terbuka("script", "lain") > 0
+        assert http.sisa_terbuka("script", "utama") == 0
+        r = await http.request("script", "POST", "https://script.test/utama", "utama")
+        assert r.status_code == 200
+        await http.tutup()
+    asyncio.run(jalan())
+
+
+def test_outbox_hanya_tunda_tenant_bermasalah():
+    async def jalan():
+        http = _pool(lambda req: httpx.Response(500 if req.url.path == "/lain" else 200))
+        for _ in range(bot.SIRKUIT_AMBANG):
+            await http.request("script", "POST", "https://script.test/lain", "lain")
+        ob = bot.Outbox(os.path.join(tempfile.mkdtemp(), "outbox.sqlite3"))
+        ob.tambah_banyak([{"mode": "Penjualan", "idempotency_key": f"u{i}"} for i in range(2)], 1)
+        ob.tambah_banyak([{"mode": "Penjualan", "idempotency_key": f"l{i}"} for i in range(2)], 10)
+        app = SimpleNamespace(bot_data={"outbox": ob, "http": http}, bot=None)
+        worker = asyncio.create_task(bot.outbox_worker(app))
+        t = time.monotonic()
+        while ob.jumlah_pending() > 2 and time.monotonic() - t < 5:
+            await asyncio.sleep(0.01)
+        worker.cancel()
+        rows = ob.db.execute("SELECT tenant, percobaan, kirim_setelah FROM outbox").fetchall()
+        assert [r[0] for r in rows] == ["lain", "lain"]
+        assert all(n == 0 and k > time.time() for _, n, k in rows)   # ditunda, bukan dihitung gagal
+        ob.tutup()
+        await http.tutup()
+    asyncio.run(jalan())
+
+
+URL = "https://script.test/utama"
+
+
+class Flaky:
+    """Transport tiruan: status dari daftar `status` (berulang di elemen terakhir), hitung panggilan."""
+
+    def __init__(self, *status, jeda: float = 0.0):
+        self.status, self.jeda, self.n = list(status), jeda, 0
+
+    async def __call__(self, req):
+        self.n += 1
+        if self.jeda:
+            await asyncio.sleep(self.jeda)
+        return httpx.Response(self.status.pop(0) if len(self.status) > 1 else self.status[0])
+
+
+async def _buka(http):
+    for _ in range(bot.SIRKUIT_AMBANG):
+        await http.request("script", "POST", URL)
+    return http.gerbang[("script", bot.TENANT_UTAMA)]
+
+
+def test_sirkuit_terbuka_setelah_ambang_dan_menolak_cepat():
+    async def jalan():
+        flaky = Flaky(500)
+        http = _pool(flaky)
+        for _ in range(bot.SIRKUIT_AMBANG - 1):
+            await http.request("script", "POST", URL)
+        assert http.sisa_terbuka("script") == 0
+        await http.request("script", "POST", URL)
+        assert http.sisa_terbuka("script") > 0
+
+        t = time.perf_counter()
+        try:
+            await http.request("script", "POST", URL)
+            assert False, "harus SirkuitTerbuka"
+        except bot.SirkuitTerbuka as e:
+            assert e.sisa > 0
+        assert time.perf_counter() - t < 0.05
+        assert flaky.n == bot.SIRKUIT_AMBANG   # tidak ada panggilan baru ke server
+        await http.tutup()
+    asyncio.run(jalan())
+
+
+def test_setengah_terbuka_satu_percobaan_lalu_tertutup():
+    async def jalan():
+        flaky = Flaky(*[500] * bot.SIRKUIT_AMBANG, 200)
+        http = _pool(flaky)
+        g = await _buka(http)
+        await asyncio.sleep(g.sisa_terbuka() + 0.01)
+        flaky.jeda = 0.1
+
+        hasil = await asyncio.gather(http.request("script", "POST", URL), http.request("script", "POST", URL),
+                                     return_exceptions=True)
+        assert sum(isinstance(h, httpx.Response) for h in hasil) == 1       # hanya satu percobaan lewat
+        assert sum(isinstance(h, bot.SirkuitTerbuka) for h in hasil) == 1
+        assert flaky.n == bot.SIRKUIT_AMBANG + 1
+        assert g.buka_sampai == 0 and g.jeda == bot.SIRKUIT_JEDA
+        assert (await http.request("script", "POST", URL)).status_code == 200
+        await http.tutup()
+    asyncio.run(jalan())
+
+
+def test_setengah_terbuka_gagal_buka_lagi_jeda_dua_kali():
+    async def jalan():
+        flaky = Flaky(500)
+        http = _pool(flaky)
+        g = await _buka(http)
+        await asyncio.sleep(g.sisa_terbuka() + 0.01)
+        await http.request("script", "POST", URL)      # percobaan gagal
+        assert g.jeda == min(bot.SIRKUIT_JEDA_MAKS, bot.SIRKUIT_JEDA * 2)
+        assert bot.SIRKUIT_JEDA < g.sisa_terbuka() <= g.jeda
+        await http.tutup()
+    asyncio.run(jalan())
+
+
+def test_aimd_batas_paralel():
+    async def jalan():
+        flaky = Flaky(500, 200)
+        http = _pool(flaky)
+        maks = bot.HTTP_ENDPOINT["script"][2]
+        await http.request("script", "POST", URL)
+        g = http.gerbang[("script", bot.TENANT_UTAMA)]
+        assert g.batas == max(1.0, maks / 2)            # gagal → dibagi dua
+        sebelum = g.batas
+        await http.request("script", "POST", URL)
+        assert g.batas == min(maks, sebelum + 1 / sebelum)   # sukses → naik pelan
+        for _ in range(6):
+            await http.request("script", "POST", URL)
+        assert g.batas == maks
+        await http.tutup()
+    asyncio.run(jalan())
+
+
+def test_stream_4xx_dari_raise_for_status_tidak_membuka_sirkuit():
+    async def jalan():
+        http = _pool(lambda req: httpx.Response(404 if req.url.path == "/utama" else 503))
+        for _ in range(bot.SIRKUIT_AMBANG):   # masih dalam burst laju sheet per tenant
+            try:
+                async with http.stream("sheet", "GET", "https://sheet.test/utama", "utama") as r:
+                    r.raise_for_status()
+            except httpx.HTTPStatusError:
+                pass
+            async with http.stream("sheet", "GET", "https://sheet.test/lain", "lain"):
+                pass
+        assert http.sisa_terbuka("sheet", "utama") == 0
+        assert http.sisa_terbuka("sheet", "lain") > 0     # 5xx lewat jalur stream tetap dihitung gagal
+        await http.tutup()
+    asyncio.run(jalan())
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import tempfile
+
+from telegram.ext import CallbackContext
+
+import bot
+
+
+async def _kirim_dokumen(app, update_pesan, cid: int, mode: str, nama_file: str):
+    bot.sesi_store.set(cid, bot.Sesi(mode=mode, step="impor_wait_doc"))
+    dok = {"file_id": f"f{cid}", "file_unique_id": f"u{cid}", "file_name": nama_file, "file_size": 9}
+    u = update_pesan(app, cid, dokumen=dok, mid=cid)
+    return await bot.impor_dokumen(u, CallbackContext.from_update(u, app))
+
+
+def test_xlsx_rusak_status_diperbarui(worker, update_pesan):
+    async def jalan():
+        app, req = worker(b"bukan zip")
+        await app.initialize()
+        app.bot_data["outbox"] = bot.Outbox(os.path.join(tempfile.mkdtemp(), "outbox.sqlite3"))
+        try:
+            hasil = await _kirim_dokumen(app, update_pesan, 1, "Penjualan", "data.xlsx")
+        finally:
+            await app.shutdown()
+        assert hasil == bot.ConversationHandler.END
+        assert req.teks[0] == "⏳ Memproses file..."
+        assert req.teks[-1].startswith("❌ Impor gagal: BadZipFile")
+    asyncio.run(jalan())
+
+
+def test_gagal_unduh_status_diperbarui(worker, update_pesan):
+    async def jalan():
+        app, req = worker()
+        req.gagal["getFile"] = "Bad Request: file is too big"
+        await app.initialize()
+        try:
+            await _kirim_dokumen(app, update_pesan, 2, "Pembelian", "data.csv")
+        finally:
+            await app.shutdown()
+        assert req.teks[-1].startswith("❌ Impor gagal: BadRequest")
+        assert bot.sesi_store.get(2) is None
+    asyncio.run(jalan())
+
+
+def test_impor_ulang_diabaikan_walau_sudah_terkirim(tmp_path):
+    csv = tmp_path / "jual.csv"
+    csv.write_text("nama,nama_barang,varian,qty,harga_satuan\nAni,Baccarat,35ml,1,50000\nBudi,Oud,50ml,2,70000\n")
+    ob = bot.Outbox(str(tmp_path / "outbox.sqlite3"))
+
+    async def impor():
+        return await bot.impor_file(str(csv), "Penjualan", None, ob, chat_id=1, kunci_dasar="file-1")
+    try:
+        assert asyncio.run(impor())[:2] == (2, 2)
+        assert asyncio.run(impor())[0] == 0          # masih di antrean
+        ob.selesai(ob.ambil())                        # terkirim → baris outbox dihapus
+        assert ob.jumlah_pending() == 0
+        assert asyncio.run(impor())[0] == 0          # kunci terkirim masih diingat
+        ob.db.execute("UPDATE terkirim SET waktu = waktu - ?", (bot.IDEM_TTL + 1,))
+        assert asyncio.run(impor())[0] == 2          # lewat jendela idempotensi
+    finally:
+        ob.tutup()
@@ -0,0 +1,144 @@
+import asyncio, time
+from types import SimpleNamespace
+
+import httpx
+
+import bot
+
+BLOK_PEMBELIAN = "nama: Supplier A\nkategori: Botol\nnama_barang: 35ml\nqty: 2\nharga_total: 50.000"
+
+
+def test_blok_diterima_walau_state_worker_basi(worker, kirim):
+    async def jalan():
+        (a, req_a), (b, _) = worker(), worker()
+        await a.initialize()
+        await b.initialize()
+        try:
+            await kirim(a, 1, "/penjualan")      # state di worker A: FAST_PENJUALAN
+            await kirim(b, 2, "/pembelian")      # sesi bersama sekarang mode Pembelian
+            req_a.teks.clear()
+            await kirim(a, 3, BLOK_PEMBELIAN)    # worker A masih mengira Penjualan
+        finally:
+            await a.shutdown()
+            await b.shutdown()
+        ud = bot.sesi_store.get(1)
+        assert ud.mode == "Pembelian" and ud.fast_payload["kategori"] == "Botol"
+        assert not any("Gunakan /penjualan" in t for t in req_a.teks)
+        assert any("Supplier A" in t for t in req_a.teks)
+    asyncio.run(jalan())
+
+
+def test_klaim_outbox_dilepas_saat_shutdown_dan_kedaluwarsa(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    a, b = bot.Outbox(path, worker="a"), bot.Outbox(path, worker="b")
+    try:
+        a.tambah_banyak([{"mode": "Penjualan", "idempotency_key": f"k{i}"} for i in range(3)], 1)
+        assert len(a.ambil()) == 3
+        assert b.ambil() == [] and b.jeda_berikut() > bot.OUTBOX_KLAIM - 5   # dipegang a, b tidak sibuk-loop
+        a.lepas_klaim()                                                      # shutdown a di tengah POST
+        assert [r[0] for r in b.ambil()] == [1, 2, 3]
+        b.db.execute("UPDATE outbox SET diklaim = diklaim - ?", (bot.OUTBOX_KLAIM + 1,))   # b mati
+        assert len(a.ambil()) == 3 and b.perpanjang([(i,) for i in (1, 2, 3)]) == set()
+        a.tutup()
+        a = bot.Outbox(path, worker="a")                                     # restart: klaim lama diambil lagi
+        assert len(a.ambil()) == 3
+    finally:
+        a.tutup()
+        b.tutup()
+
+
+def _dua_store(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    return bot.StoreSQLite(path), bot.StoreSQLite(path)   # dua koneksi = dua proses worker
+
+
+def test_sesi_dibaca_langsung_dari_store_bersama(tmp_path):
+    sa, sb = _dua_store(tmp_path)
+    a, b = bot.SesiStore(), bot.SesiStore()
+    a.pakai_store(sa)
+    b.pakai_store(sb)
+    try:
+        a.set(7, bot.Sesi(mode="Penjualan", step="fast_wait_block", fast_payloads=[{"qty": "1"}]))
+        ud = b.get(7)
+        assert (ud.mode, ud.step, ud.fast_payloads) == ("Penjualan", "fast_wait_block", [{"qty": "1"}])
+        ud.mode = "Pembelian"
+        b.set(7, ud)
+        assert a.get(7).mode == "Pembelian"      # tanpa salinan lokal yang basi
+        a.pop(7)
+        assert b.get(7) is None
+    finally:
+        sa.tutup()
+        sb.tutup()
+
+
+def test_sewa_eksklusif_lalu_diambil_alih_setelah_habis(tmp_path):
+    sa, sb = _dua_store(tmp_path)
+    try:
+        assert sa.sewa("pemimpin", "a", 0.2)
+        assert not sb.sewa("pemimpin", "b", 30)
+        assert sa.sewa("pemimpin", "a", 0.2)      # perpanjang oleh pemilik
+        time.sleep(0.25)
+        assert sb.sewa("pemimpin", "b", 30)       # a mati → b ambil alih
+        assert not sa.sewa("pemimpin", "a", 30)
+        sb.lepas("pemimpin", "b")
+        assert sa.sewa("pemimpin", "a", 30)
+    finally:
+        sa.tutup()
+        sb.tutup()
+
+
+def test_follower_ikuti_katalog_terbitan_dengan_id_sama(tmp_path):
+    sa, sb = _dua_store(tmp_path)
+    pemimpin, follower = {}, {}
+
+    async def jalan():
+        v1 = bot.Katalog(["Oud", "Baccarat"], hash="h1")
+        v2 = bot.Katalog(["Aventus", "Baccarat", "Oud"], hash="h2", sebelumnya=v1)
+        bot.pasang_katalog(pemimpin, v2, "lain")
+        await bot.terbitkan_katalog(sa, "lain", v2)
+        await bot.ikuti_tenant(follower, sb, "lain")
+        return v2
+    try:
+        v2 = asyncio.run(jalan())
+        kat = bot._pool(follower).get("lain")
+        assert kat.hash == "h2" and kat.daftar == v2.daftar
+        assert kat.id_nama == v2.id_nama == ["Oud", "Baccarat", "Aventus"]
+        assert bot._terbit_segar(sb, "lain")
+    finally:
+        sa.tutup()
+        sb.tutup()
+
+
+def test_pemimpin_refresh_semua_tenant_termasuk_yang_tidak_dimuat(tmp_path):
+    sa, sb = _dua_store(tmp_path)
+    diminta = []
+
+    def sheet(req):
+        diminta.append(req.url.path)
+        return httpx.Response(200, text=f'"Nama Parfum"\n"Oud {req.url.path}"\n"Baccarat"\n')
+
+    async def jalan():
+        http = bot.HttpPool(transport=httpx.MockTransport(sheet))
+        pemimpin = {"http": http, "store": sa, "pemimpin": True}
+        bot.pasang_katalog(pemimpin, bot.Katalog(["Baccarat"], hash="lama"), "utama")
+        ctx = SimpleNamespace(application=SimpleNamespace(bot_data=pemimpin), job=None, bot=None)
+        await bot.refresh_katalog(ctx)
+        follower = {}
+        await bot.ikuti_tenant(follower, sb, "lain")
+
+        sendiri = {"http": http}                  # tanpa shared store: tenant yang tidak dimuat dilewati
+        bot.pasang_katalog(sendiri, bot.Katalog(["Baccarat"], hash="lama"), "utama")
+        diminta.clear()
+        await bot.refresh_katalog(SimpleNamespace(application=SimpleNamespace(bot_data=sendiri), job=None, bot=None))
+        await http.tutup()
+        return pemimpin, follower
+    try:
+        pemimpin, follower = asyncio.run(jalan())
+        assert bot._pool(pemimpin).dimuat() == ["utama"]                 # "lain" tidak ikut dimuat pemimpin
+        assert bot._pool(pemimpin).get("utama").daftar == ["Baccarat", "Oud /utama"]
+        assert bot._pool(pemimpin).get("utama").id_nama[0] == "Baccarat"
+        assert bot._pool(follower).get("lain").daftar == ["Baccarat", "Oud /lain"]
+        assert diminta == ["/utama"]
+    finally:
+        sa.tutup()
+        sb.tutup()
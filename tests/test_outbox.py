@@ -0,0 +1,89 @@
+import asyncio, sqlite3, time
+from types import SimpleNamespace
+
+import httpx
+
+import bot
+
+
+def _data(n: int, awalan: str = "k") -> list:
+    return [{"mode": "Penjualan", "tanggal": "01-02-2025", "nama_barang": "Oud", "qty": "1",
+             "harga_total": "Rp 10.000", "idempotency_key": f"{awalan}{i}"} for i in range(n)]
+
+
+async def _sampai(syarat, batas: float = 5):
+    t = time.monotonic()
+    while not syarat() and time.monotonic() - t < batas:
+        await asyncio.sleep(0.01)
+
+
+def test_gagal_backoff_lalu_menyerah(tmp_path):
+    ob = bot.Outbox(str(tmp_path / "outbox.sqlite3"))
+    try:
+        ob.tambah_banyak(_data(1), 1)
+        for n in range(1, bot.OUTBOX_MAX_COBA):
+            (row,) = ob.ambil()
+            t = time.time()
+            assert ob.gagal([row], "HTTP 500") == []
+            percobaan, kirim = ob.db.execute("SELECT percobaan, kirim_setelah FROM outbox").fetchone()
+            assert percobaan == n
+            assert 0.8 * min(600, 5 * 2 ** n) <= kirim - t <= 1.2 * min(600, 5 * 2 ** n) + 1
+            assert ob.ambil() == []                                   # belum jadwalnya
+            ob.db.execute("UPDATE outbox SET kirim_setelah = 0")
+        (row,) = ob.ambil()
+        assert ob.gagal([row], "HTTP 500") == [row]
+        assert ob.jumlah_pending() == 0
+        assert ob.db.execute("SELECT status, error FROM outbox").fetchone() == ("gagal", "HTTP 500")
+    finally:
+        ob.tutup()
+
+
+def test_antrean_dikirim_ulang_setelah_db_dibuka_lagi(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    ob = bot.Outbox(path)
+    ob.tambah_banyak(_data(3), 1)
+    ob.ambil()
+    ob.tutup()                      # proses mati di tengah kirim: klaim tidak sempat dilepas
+
+    async def jalan():
+        terkirim = []
+        http = bot.HttpPool(transport=httpx.MockTransport(
+            lambda req: terkirim.append(req.content) or httpx.Response(200)))
+        ob = bot.Outbox(path)
+        worker = asyncio.create_task(bot.outbox_worker(
+            SimpleNamespace(bot_data={"outbox": ob, "http": http}, bot=None)))
+        await _sampai(lambda: ob.jumlah_pending() == 0)
+        worker.cancel()
+        rekap = ob.buku.rekap("2025-02-01", "2025-02-01")
+        ob.tutup()
+        await http.tutup()
+        return terkirim, rekap
+    terkirim, rekap = asyncio.run(jalan())
+    assert len(terkirim) == 3
+    assert rekap["mode"]["Penjualan"] == (3, 3, 30000)
+
+
+def test_worker_tetap_hidup_saat_db_error(tmp_path, monkeypatch):
+    async def jalan():
+        http = bot.HttpPool(transport=httpx.MockTransport(lambda req: httpx.Response(200)))
+        ob = bot.Outbox(str(tmp_path / "outbox.sqlite3"))
+        asli, error = ob.ambil, []
+
+        def ambil_terkunci(*a):
+            if not error:
+                error.append(1)
+                raise sqlite3.OperationalError("database is locked")
+            return asli(*a)
+        monkeypatch.setattr(ob, "ambil", ambil_terkunci)
+        ob.tambah_banyak(_data(2), 1)
+        worker = asyncio.create_task(bot.outbox_worker(
+            SimpleNamespace(bot_data={"outbox": ob, "http": http}, bot=None)))
+        await _sampai(lambda: ob.jumlah_pending() == 0)
+        selesai = worker.done()
+        worker.cancel()
+        n = ob.jumlah_pending()
+        ob.tutup()
+        await http.tutup()
+        return error, selesai, n
+    error, selesai, n = asyncio.run(jalan())
+    assert error and not selesai and n == 0
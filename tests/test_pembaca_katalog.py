@@ -0,0 +1,45 @@
+import os
+
+import bot
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "..", "bench", "fixtures", "sheet_parfum")
+
+CSV = ('"Nama Parfum","Harga 35ml","Roll On"\r\n'
+       '"Oud, Royal","Rp50.000","25000"\r\n'
+       '"Crème Brûlée","",""\r\n'
+       '"Baris\ndua","45.000,00","-"\r\n'
+       '"",  "1000", ""\r\n'
+       '"Akhir Tanpa Newline","70000"').encode()
+
+
+def _baca(data: bytes, ukuran: int, format: str = "csv"):
+    """Feed per `ukuran` byte → (daftar nama, harga, digest)."""
+    p = bot.PembacaKatalog(format)
+    for i in range(0, len(data), ukuran):
+        p.feed(data[i:i + ukuran])
+    return p.selesai(), p.harga, p.digest
+
+
+def test_csv_sama_di_semua_batas_potongan():
+    utuh = _baca(CSV, len(CSV))
+    assert utuh[0] == ["Akhir Tanpa Newline", "Baris\ndua", "Crème Brûlée", "Oud, Royal"]
+    assert utuh[1] == {"Oud, Royal": {"35ml": 50000, "Roll On": 25000},
+                          "Baris\ndua": {"35ml": 45000}, "Akhir Tanpa Newline": {"35ml": 70000}}
+    # batas potongan jatuh di tengah karakter UTF-8, di antara \r\n, dan di dalam kutip
+    for ukuran in range(1, 40):
+        assert _baca(CSV, ukuran) == utuh, ukuran
+
+
+def test_kosong_dan_hanya_header():
+    assert _baca(b"", 8)[0] == []
+    assert _baca(b'"Nama Parfum"\n', 3)[0] == []
+
+
+def test_fixture_csv_dan_json_sama():
+    with open(FIXTURE + ".csv", "rb") as f:
+        csv_bytes = f.read()
+    with open(FIXTURE + ".json", "rb") as f:
+        json_bytes = f.read()
+    dari_csv = _baca(csv_bytes, 64 * 1024)[0]
+    assert dari_csv and dari_csv == _baca(csv_bytes, 997)[0]
+    assert _baca(json_bytes, 997, "json")[0] == dari_csv
@@ -0,0 +1,37 @@
+import csv
+import os
+
+import bot
+
+FIXTURE_CSV = os.path.join(os.path.dirname(__file__), "..", "bench", "fixtures", "sheet_parfum.csv")
+DAFTAR = ["Pink Chiffon", "1000 Bunga", "Baccarat Rouge", "Avril", "Aqua Di Gio", "Kayu Manis"]
+
+
+def test_keyword_pendek_tetap_substring():
+    idx = bot.ParfumIndex(DAFTAR)
+    assert idx.cari("if") == ["Pink Chiffon"]
+    hasil = idx.cari("a")
+    # awalan dulu, baru substring di tengah kata
+    assert hasil == ["Aqua Di Gio", "Avril", "1000 Bunga", "Baccarat Rouge", "Kayu Manis"]
+    assert idx.cari("a", limit=2) == hasil[:2]
+
+
+def test_sama_dengan_substring_baseline():
+    with open(FIXTURE_CSV, encoding="utf-8") as f:
+        r = csv.reader(f)
+        next(r)
+        daftar = [row[0] for row in r]
+    idx = bot.ParfumIndex(daftar)
+    for kw in ("a", "l", "mi", "os", "if", "rose", "no 5", "anan"):
+        substring = {n for n in daftar if bot._normalisasi(kw) in bot._normalisasi(n)}
+        assert substring <= set(idx.cari(kw)), kw
+
+
+def test_pasang_katalog_hanya_buang_cache_inline_tenant_itu():
+    bot_data = {"inline_cache": bot.CacheTTL(10, 60)}
+    cache = bot_data["inline_cache"]
+    cache.set(("utama", 1, "oud"), ["a"])
+    cache.set(("lain", 1, "oud"), ["b"])
+    bot.pasang_katalog(bot_data, bot.Katalog(["Oud"], hash="h"), "lain")
+    assert cache.get(("utama", 1, "oud")) == ["a"]
+    assert cache.get(("lain", 1, "oud")) is None and len(cache) == 1
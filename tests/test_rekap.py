@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime
+
+import bot
+
+
+def _jual(tgl: str, barang: str, qty: int, total: int) -> dict:
+    return {"mode": "Penjualan", "tanggal": tgl, "nama": "Ani", "kategori": "", "nama_barang": barang,
+            "varian": "35ml", "qty": str(qty), "harga_total": bot._format_rp(total)}
+
+
+def _beli(tgl: str, kategori: str, total: int) -> dict:
+    return {"mode": "Pembelian", "tanggal": tgl, "nama": "Supplier", "kategori": kategori,
+            "nama_barang": "35ml", "qty": "10", "harga_total": bot._format_rp(total)}
+
+
+def test_agregat_harian_per_tenant_dan_rentang(tmp_path):
+    ob = bot.Outbox(str(tmp_path / "outbox.sqlite3"))
+    try:
+        ob.buku.catat([
+            ("utama", _jual("01-03-2025", "Oud", 2, 100000)),
+            ("utama", _jual("01-03-2025", "Oud", 1, 50000)),
+            ("utama", _jual("02-03-2025", "Baccarat", 5, 200000)),
+            ("utama", _beli("02-03-2025", "Botol", 30000)),
+            ("utama", _beli("02-03-2025", "Bibit", 90000)),
+            ("lain", _jual("01-03-2025", "Oud", 9, 1)),
+            ("utama", {"mode": "Penjualan", "tanggal": "bukan tanggal"}),   # dilewati, tidak menggagalkan
+        ])
+        assert ob.db.execute("SELECT COUNT(*) FROM buku").fetchone()[0] == 6
+        assert ob.db.execute("SELECT n, qty, total FROM harian WHERE tenant = 'utama' AND nama_barang = 'Oud'"
+                             ).fetchone() == (2, 3, 150000)
+
+        r = ob.buku.rekap("2025-03-01", "2025-03-01")
+        assert r["mode"] == {"Penjualan": (2, 3, 150000)}
+        r = ob.buku.rekap("2025-03-01", "2025-03-02", top=1)
+        assert r["mode"]["Penjualan"] == (3, 8, 350000) and r["mode"]["Pembelian"] == (2, 20, 120000)
+        assert r["top"] == [("Baccarat", 5, 200000)]
+        assert r["kategori"] == [("Bibit", 90000), ("Botol", 30000)]
+        assert ob.buku.rekap("2025-03-01", "2025-03-02", "lain")["mode"] == {"Penjualan": (1, 9, 1)}
+    finally:
+        ob.tutup()
+
+
+def test_rentang_rekap():
+    hari_ini = datetime.now().date().isoformat()
+    assert bot._rentang_rekap("") == (hari_ini, hari_ini, "hari ini")
+    assert bot._rentang_rekap("bulan")[0] == hari_ini[:8] + "01"
+    assert bot._rentang_rekap("05-01-2025") == ("2025-01-05", "2025-01-05", "05-01-2025")
+
+
+def test_rekap_cmd(tmp_path, worker, kirim):
+    hari_ini = datetime.now().strftime("%d-%m-%Y")
+
+    async def jalan():
+        app, req = worker()
+        await app.initialize()
+        ob = app.bot_data["outbox"] = bot.Outbox(str(tmp_path / "outbox.sqlite3"))
+        try:
+            ob.buku.catat([("utama", _jual(hari_ini, "Oud", 2, 100000)), ("utama", _beli(hari_ini, "Botol", 30000))])
+            ob.tambah_banyak([_jual(hari_ini, "Oud", 1, 1)], 1)
+            await kirim(app, 1, "/rekap", cid=1)
+            await kirim(app, 2, "/rekap kemarin-lusa", cid=1)
+        finally:
+            ob.tutup()
+            await app.shutdown()
+        return req.teks
+    rekap, salah = asyncio.run(jalan())
+    assert rekap.splitlines()[:3] == ["📊 Rekap hari ini",
+                                      "🛍 Penjualan: 1 transaksi, 2 pcs, Rp 100.000",
+                                      "📦 Pembelian: 1 transaksi, Rp 30.000"]
+    assert "1. Oud ×2 – Rp 100.000" in rekap and "Botol: Rp 30.000" in rekap
+    assert "⏳ 1 data masih antre" in rekap
+    assert salah.startswith("Format: /rekap")
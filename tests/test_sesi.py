@@ -0,0 +1,43 @@
+import time
+
+import bot
+
+
+def test_ke_dict_hanya_field_disimpan():
+    s = bot.Sesi(mode="Penjualan", step="fast_wait_block", fast_payloads=[{"qty": "1"}])
+    s.kembali = "fast_wait_block"
+    assert s.ke_dict() == {"mode": "Penjualan", "step": "fast_wait_block",
+                           "fast_payloads": [{"qty": "1"}], "kembali": "fast_wait_block"}
+    d = bot.Sesi.dari_dict({**s.ke_dict(), "diakses": 1.0, "asing": 1})
+    assert d.ke_dict() == s.ke_dict() and d.diakses > 1.0
+
+
+def test_ttl_dan_maks():
+    st = bot.SesiStore(ttl=60, maks=2)
+    for cid in (1, 2):
+        st.set(cid, bot.Sesi(mode="Penjualan"))
+    st.get(1)                               # 1 baru dipakai → 2 yang paling lama
+    st.set(3, bot.Sesi(mode="Pembelian"))
+    assert st.get(2) is None and len(st) == 2
+    st.get(1).diakses = time.time() - 61
+    assert st.get(1) is None                # menganggur > ttl
+    st._data[3].diakses = time.time() - 61
+    assert st.bersihkan() == 1 and len(st) == 0
+
+
+def test_persisten_setelah_restart(tmp_path):
+    path = str(tmp_path / "sesi.sqlite3")
+    st = bot.SesiStore(ttl=60, maks=3)
+    st.buka(path)
+    st.set(1, bot.Sesi(mode="Penjualan", step="fast_wait_block", fast_payloads=[{"qty": "2"}]))
+    st.set(2, bot.Sesi(mode="Pembelian"))
+    st.set(3, bot.Sesi(mode="Pembelian", step="impor_wait_doc"))
+    st.pop(3)
+    st.db.execute("UPDATE sesi SET diakses = diakses - 61 WHERE chat_id = 2")
+    st.tutup()
+
+    baru = bot.SesiStore(ttl=60, maks=2)
+    assert baru.buka(path) == 1             # 2 kedaluwarsa, 3 sudah di-pop
+    ud = baru.get(1)
+    assert (ud.mode, ud.step, ud.fast_payloads) == ("Penjualan", "fast_wait_block", [{"qty": "2"}])
+    baru.tutup()
@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+
+
+def _update(chat_id=None):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id) if chat_id is not None else None)
+
+
+def test_tidak_ada_head_of_line_blocking_antar_chat():
+    async def jalan():
+        proc = bot.PerChatUpdateProcessor(4)
+        selesai = []
+
+        async def kerja(nama, detik):
+            await asyncio.sleep(detik)
+            selesai.append(nama)
+
+        tugas = [
+            asyncio.create_task(proc.do_process_update(_update(1), kerja("chat1-a", 0.2))),
+            asyncio.create_task(proc.do_process_update(_update(1), kerja("chat1-b", 0))),
+            asyncio.create_task(proc.do_process_update(_update(2), kerja("chat2", 0))),
+            asyncio.create_task(proc.do_process_update(_update(), kerja("inline", 0))),
+        ]
+        await asyncio.gather(*tugas)
+        # chat 2 & inline query tidak menunggu update lambat chat 1
+        assert set(selesai[:2]) == {"chat2", "inline"}
+        # update chat 1 tetap berurutan walau yang kedua lebih cepat
+        assert selesai[2:] == ["chat1-a", "chat1-b"]
+        assert proc._kunci == {}
+    asyncio.run(jalan())
+
+
+def test_chat_antre_tidak_memakai_slot():
+    async def jalan():
+        proc = bot.PerChatUpdateProcessor(1)
+        selesai = []
+
+        async def kerja(nama, detik):
+            await asyncio.sleep(detik)
+            selesai.append(nama)
+
+        # chat 1 punya dua update: yang kedua antre di kunci chat, bukan di slot global
+        tugas = [
+            asyncio.create_task(proc.do_process_update(_update(1), kerja("chat1-a", 0.1))),
+            asyncio.create_task(proc.do_process_update(_update(1), kerja("chat1-b", 0.1))),
+            asyncio.create_task(proc.do_process_update(_update(2), kerja("chat2", 0))),
+        ]
+        await asyncio.gather(*tugas)
+        assert selesai.index("chat2") < selesai.index("chat1-b")
+    asyncio.run(jalan())
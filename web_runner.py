@@ -1,25 +1,185 @@
 # web_runner.py
+# Satu server async (uvicorn + Starlette) untuk health check dan update Telegram.
+#   BOT_MODE=webhook → Telegram mengirim update ke WEBHOOK_PATH (tanpa long-poll)
+#   BOT_MODE=polling → fallback: polling berjalan di event loop yang sama
+#
+# Boot cepat: port langsung dibuka; telegram, httpx & bot.py di-import lalu
+# Application dibangun di latar belakang. /livez = proses hidup, /readyz = bot siap,
+# /startup = rincian waktu import & inisialisasi.
+# /debug/profil?jenis=cpu|mem&detik=N = profil on-demand (aktif jika PROFIL_TOKEN diisi).
 import os
-from threading import Thread
-from flask import Flask
+import time
+_T0 = time.perf_counter()
 
-# === import fungsi main() dari bot.py ===
-from bot import main as run_bot
+import asyncio
+import hmac
+import importlib
+from contextlib import asynccontextmanager
 
-app = Flask(__name__)
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
 
-@app.get("/")
-def health():
-    return "OK - telegram bot alive"
+MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")          # URL publik (kosong = tidak setWebhook, untuk tes lokal)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")    # dicek di header X-Telegram-Bot-Api-Secret-Token
+PROFIL_TOKEN = os.getenv("PROFIL_TOKEN")        # header "Authorization: Bearer <token>"; kosong = endpoint mati
 
-def start_bot():
-    # Jalankan bot polling di thread lain (blocking kalau di main thread)
-    run_bot()
+# modul berat di-import berurutan supaya biaya masing-masing terlihat di laporan startup
+MODUL_BERAT = ("httpx", "telegram", "telegram.ext", "bot")
+
+
+class Boot:
+    """Status boot latar belakang + catatan waktu per tahap (ms)."""
+
+    def __init__(self):
+        self.tahap = "mulai"
+        self.waktu = {"modul web_runner": (time.perf_counter() - _T0) * 1000}
+        self.siap = False
+        self.error = None
+        self.bot = None     # modul bot.py setelah di-import
+        self.ptb = None     # telegram.ext.Application
+
+    async def ukur(self, nama: str, aw):
+        self.tahap = nama
+        t = time.perf_counter()
+        hasil = await aw
+        self.waktu[nama] = (time.perf_counter() - t) * 1000
+        return hasil
+
+    def laporan(self) -> dict:
+        return {
+            "siap": self.siap, "tahap": self.tahap, "error": self.error,
+            "ms": {k: round(v, 1) for k, v in self.waktu.items()},
+            "total_ms": round(sum(self.waktu.values()), 1),
+        }
+
+
+boot = Boot()
+
+
+async def jalankan_boot():
+    try:
+        for nama in MODUL_BERAT:
+            # import di thread: event loop tetap menjawab /livez & /readyz selama import
+            mod = await boot.ukur(f"import {nama}", asyncio.to_thread(importlib.import_module, nama))
+        boot.bot = mod
+        from telegram import Update
+
+        boot.tahap, t = "build_app", time.perf_counter()
+        ptb = boot.ptb = mod.build_app(webhook=MODE == "webhook")
+        boot.waktu["build_app"] = (time.perf_counter() - t) * 1000
+
+        # urutan sama dengan Application.run_polling/run_webhook
+        await boot.ukur("initialize", ptb.initialize())
+        if ptb.post_init:
+            await boot.ukur("post_init", ptb.post_init(ptb))
+        if MODE == "webhook":
+            if WEBHOOK_URL:
+                await boot.ukur("set_webhook", ptb.bot.set_webhook(
+                    WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                    allowed_updates=Update.ALL_TYPES))
+        else:
+            await boot.ukur("start_polling", ptb.updater.start_polling(allowed_updates=Update.ALL_TYPES))
+        await boot.ukur("start", ptb.start())
+    except Exception as e:
+        boot.error = f"{boot.tahap}: {e!r}"
+        print("❌ Boot gagal di", boot.error)
+        return
+    boot.siap, boot.tahap = True, "siap"
+    for nama, ms in boot.waktu.items():
+        boot.bot.metrik.set_gauge(f"startup_ms.{nama}", round(ms, 1))
+    rincian = ", ".join(f"{k} {v:.0f}" for k, v in boot.waktu.items())
+    print(f"🚀 Bot siap dalam {sum(boot.waktu.values()):.0f} ms ({rincian})")
 
-if __name__ == "__main__":
-    # Mulai bot
-    Thread(target=start_bot, daemon=True).start()
 
-    # Jalankan HTTP server agar Render melihat ada port yang dibuka
-    port = int(os.getenv("PORT", "10000"))  # Render akan set PORT otomatis
-    app.run(host="0.0.0.0", port=port)
\ No newline at end of file
+async def health(request: Request):
+    return PlainTextResponse("OK - telegram bot alive")
+
+async def livez(request: Request):
+    # boot gagal permanen → minta platform me-restart proses
+    if boot.error:
+        return PlainTextResponse("boot gagal: " + boot.error, status_code=500)
+    return PlainTextResponse("OK")
+
+async def readyz(request: Request):
+    if boot.siap:
+        return PlainTextResponse("OK")
+    return PlainTextResponse("belum siap: " + boot.tahap, status_code=503)
+
+async def startup(request: Request):
+    return JSONResponse(boot.laporan())
+
+async def metrics(request: Request):
+    if boot.bot is None:
+        return PlainTextResponse("belum siap\n", status_code=503)
+    return PlainTextResponse(boot.bot.metrik.prometheus(), media_type="text/plain; version=0.0.4")
+
+async def debug_profil(request: Request):
+    auth = request.headers.get("Authorization", "")
+    if not PROFIL_TOKEN or not hmac.compare_digest(auth.encode(), f"Bearer {PROFIL_TOKEN}".encode()):
+        return Response(status_code=404)
+    if boot.bot is None:
+        return PlainTextResponse("belum siap\n", status_code=503)
+    try:
+        laporan = await boot.bot.profil(request.query_params.get("jenis", "cpu"),
+                                        float(request.query_params.get("detik", "10")))
+    except ValueError as e:
+        return PlainTextResponse(f"{e}\n", status_code=400)
+    except RuntimeError as e:
+        return PlainTextResponse(f"{e}\n", status_code=409)
+    return PlainTextResponse(laporan)
+
+async def telegram_update(request: Request):
+    if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        return Response(status_code=403)
+    if not boot.siap:
+        return Response(status_code=503)   # Telegram mengirim ulang nanti
+    from telegram import Update
+    try:
+        update = Update.de_json(await request.json(), boot.ptb.bot)
+    except Exception:
+        return Response(status_code=400)
+    await boot.ptb.update_queue.put(update)
+    return Response()
+
+
+@asynccontextmanager
+async def lifespan(_):
+    boot.waktu["hingga listen"] = (time.perf_counter() - _T0) * 1000 - boot.waktu["modul web_runner"]
+    task = asyncio.create_task(jalankan_boot())
+    try:
+        yield
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        ptb = boot.ptb
+        if ptb is not None:
+            if ptb.updater and ptb.updater.running:
+                await ptb.updater.stop()
+            if ptb.running:
+                await ptb.stop()
+            await ptb.shutdown()
+            if ptb.post_shutdown:
+                await ptb.post_shutdown(ptb)
+
+
+routes = [
+    Route("/", health), Route("/livez", livez), Route("/readyz", readyz),
+    Route("/startup", startup), Route("/metrics", metrics), Route("/debug/profil", debug_profil),
+]
+if MODE == "webhook":
+    routes.append(Route(WEBHOOK_PATH, telegram_update, methods=["POST"]))
+app = Starlette(routes=routes, lifespan=lifespan)
+
+if __name__ == "__main__":
+    # Render/Heroku akan set PORT otomatis
+    port = int(os.getenv("PORT", "10000"))
+    uvicorn.run(app, host="0.0.0.0", port=port)